@@ -42,6 +42,10 @@ REST_API_VERSION_HISTORY = """REST API Version History:
     * 1.1 - Add support for getting notification progress details.
     * 1.2 - Add enabled option to segment.
     * 1.3 - Add masakari vmoves.
+    * 1.4 - Add support for the Idempotency-Key header when creating a
+            notification.
+    * 1.5 - Add the notifications batch create action.
+    * 1.6 - Add the number of active notifications to segment.
 """
 
 # The minimum and maximum versions of the API supported
@@ -50,7 +54,7 @@ REST_API_VERSION_HISTORY = """REST API Version History:
 # Note: This only applies for the v1 API once microversions
 # support is fully merged.
 _MIN_API_VERSION = "1.0"
-_MAX_API_VERSION = "1.3"
+_MAX_API_VERSION = "1.6"
 # The default api version request if none is requested in the headers
 DEFAULT_API_VERSION = _MIN_API_VERSION
 
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 from http import HTTPStatus
 
 from oslo_utils import timeutils
@@ -52,6 +53,37 @@ class NotificationsController(wsgi.Controller):
     def _validate_comp_host_payload(self, req, body):
         pass
 
+    def _validate_payload(self, req, notification_data):
+        if notification_data['type'] == fields.NotificationType.PROCESS:
+            self._validate_process_payload(req,
+                                           body=notification_data['payload'])
+
+        if notification_data['type'] == fields.NotificationType.VM:
+            self._validate_vm_payload(req, body=notification_data['payload'])
+
+        if notification_data['type'] == fields.NotificationType.COMPUTE_HOST:
+            self._validate_comp_host_payload(req,
+                                             body=notification_data['payload'])
+
+    @staticmethod
+    def _view(req, notification):
+        """Notification as returned at the microversion of the request."""
+        # NOTE: The fingerprint of the request is internal to the API and
+        # the fencing token of the recovery lock internal to the engines.
+        hidden = ['idempotency_fingerprint', 'fencing_token']
+        if not api_version_request.is_supported(req, min_version='1.4'):
+            hidden.append('idempotency_key')
+        hidden = [field for field in hidden
+                  if notification.obj_attr_is_set(field)]
+        if not hidden:
+            return notification
+
+        # NOTE: A shallow copy, the notification itself is left untouched.
+        notification = copy.copy(notification)
+        for field in hidden:
+            delattr(notification, field)
+        return notification
+
     @wsgi.response(HTTPStatus.ACCEPTED)
     @extensions.expected_errors((HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN,
                                  HTTPStatus.CONFLICT))
@@ -62,27 +94,58 @@ class NotificationsController(wsgi.Controller):
         context.can(notifications_policies.NOTIFICATIONS % 'create')
 
         notification_data = body['notification']
-        if notification_data['type'] == fields.NotificationType.PROCESS:
-            self._validate_process_payload(req,
-                                           body=notification_data['payload'])
+        self._validate_payload(req, notification_data)
 
-        if notification_data['type'] == fields.NotificationType.VM:
-            self._validate_vm_payload(req, body=notification_data['payload'])
-
-        if notification_data['type'] == fields.NotificationType.COMPUTE_HOST:
-            self._validate_comp_host_payload(req,
-                                             body=notification_data['payload'])
+        idempotency_key = None
+        if api_version_request.is_supported(req, min_version='1.4'):
+            idempotency_key = req.headers.get('Idempotency-Key')
+            if idempotency_key is not None and not (
+                    0 < len(idempotency_key) <= 255):
+                msg = _('Idempotency-Key header must be between 1 and 255 '
+                        'characters long')
+                raise exc.HTTPBadRequest(explanation=msg)
 
         try:
             notification = self.api.create_notification(
-                context, notification_data)
+                context, notification_data, idempotency_key=idempotency_key)
         except exception.HostNotFoundByName as err:
             raise exc.HTTPBadRequest(explanation=err.format_message())
         except (exception.DuplicateNotification,
+                exception.IdempotencyKeyReused,
                 exception.HostOnMaintenanceError) as err:
             raise exc.HTTPConflict(explanation=err.format_message())
 
-        return {'notification': notification}
+        return {'notification': self._view(req, notification)}
+
+    @wsgi.Controller.api_version("1.5")
+    @wsgi.response(HTTPStatus.ACCEPTED)
+    @extensions.expected_errors((HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN))
+    @validation.schema(schema.create_batch)
+    def batch(self, req, body):
+        """Creates new notifications received together."""
+        context = req.environ['masakari.context']
+        context.can(notifications_policies.NOTIFICATIONS % 'create')
+
+        notifications_data = body['notifications']
+        for notification_data in notifications_data:
+            self._validate_payload(req, notification_data)
+
+        results = self.api.create_notifications(context, notifications_data)
+
+        return {'notifications': [self._batch_result(req, result)
+                                  for result in results]}
+
+    @classmethod
+    def _batch_result(cls, req, result):
+        if isinstance(result, exception.HostNotFoundByName):
+            code = HTTPStatus.BAD_REQUEST
+        elif isinstance(result, (exception.DuplicateNotification,
+                                 exception.HostOnMaintenanceError)):
+            code = HTTPStatus.CONFLICT
+        else:
+            return {'code': HTTPStatus.ACCEPTED.value,
+                    'notification': cls._view(req, result)}
+        return {'code': code.value, 'message': result.format_message()}
 
     @extensions.expected_errors((HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN))
     def index(self, req):
@@ -116,7 +179,8 @@ class NotificationsController(wsgi.Controller):
         except exception.Invalid as err:
             raise exc.HTTPBadRequest(explanation=err.format_message())
 
-        return {'notifications': notifications}
+        return {'notifications': [self._view(req, notification)
+                                  for notification in notifications]}
 
     @extensions.expected_errors((HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND))
     def show(self, req, id):
@@ -133,7 +197,7 @@ class NotificationsController(wsgi.Controller):
                 notification = self.api.get_notification(context, id)
         except exception.NotificationNotFound as err:
             raise exc.HTTPNotFound(explanation=err.format_message())
-        return {'notification': notification}
+        return {'notification': self._view(req, notification)}
 
 
 class Notifications(extensions.V1APIExtensionBase):
@@ -145,11 +209,13 @@ class Notifications(extensions.V1APIExtensionBase):
 
     def get_resources(self):
         member_actions = {'action': 'POST'}
+        collection_actions = {'batch': 'POST'}
 
         resources = [
             extensions.ResourceExtension(ALIAS,
                                          NotificationsController(),
                                          member_name='notification',
+                                         collection_actions=collection_actions,
                                          member_actions=member_actions)
             ]
         return resources
@@ -39,3 +39,18 @@ create = {
     'required': ['notification'],
     'additionalProperties': False
 }
+
+
+create_batch = {
+    'type': 'object',
+    'properties': {
+        'notifications': {
+            'type': 'array',
+            'items': create['properties']['notification'],
+            'minItems': 1,
+            'maxItems': 1000,
+        }
+    },
+    'required': ['notifications'],
+    'additionalProperties': False
+}
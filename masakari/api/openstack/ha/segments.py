@@ -20,6 +20,7 @@ from webob import exc
 from masakari.api.openstack import common
 from masakari.api.openstack import extensions
 from masakari.api.openstack.ha.schemas import segments as schema
+from masakari.api.openstack.ha.views import segments as views_segments
 from masakari.api.openstack import wsgi
 from masakari.api import validation
 from masakari import exception
@@ -60,7 +61,7 @@ class SegmentsController(wsgi.Controller):
         except exception.Invalid as e:
             raise exc.HTTPBadRequest(explanation=e.format_message())
 
-        return {'segments': segments}
+        return {'segments': views_segments.build_segments(req, segments)}
 
     @extensions.expected_errors((HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND))
     def show(self, req, id):
@@ -72,7 +73,7 @@ class SegmentsController(wsgi.Controller):
             segment = self.api.get_segment(context, id)
         except exception.FailoverSegmentNotFound as e:
             raise exc.HTTPNotFound(explanation=e.format_message())
-        return {'segment': segment}
+        return {'segment': views_segments.build_segment(req, segment)}
 
     @wsgi.response(HTTPStatus.CREATED)
     @extensions.expected_errors((HTTPStatus.FORBIDDEN, HTTPStatus.CONFLICT))
@@ -88,7 +89,7 @@ class SegmentsController(wsgi.Controller):
             segment = self.api.create_segment(context, segment_data)
         except exception.FailoverSegmentExists as e:
             raise exc.HTTPConflict(explanation=e.format_message())
-        return {'segment': segment}
+        return {'segment': views_segments.build_segment(req, segment)}
 
     @extensions.expected_errors((HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND,
                                  HTTPStatus.CONFLICT))
@@ -107,7 +108,7 @@ class SegmentsController(wsgi.Controller):
         except (exception.FailoverSegmentExists, exception.Conflict) as e:
             raise exc.HTTPConflict(explanation=e.format_message())
 
-        return {'segment': segment}
+        return {'segment': views_segments.build_segment(req, segment)}
 
     @wsgi.response(HTTPStatus.NO_CONTENT)
     @extensions.expected_errors((HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND,
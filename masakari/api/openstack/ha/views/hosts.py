@@ -14,19 +14,23 @@
 #    under the License.
 
 from masakari.api.openstack import common
+from masakari.api.openstack.ha.views import segments as views_segments
 
 
 def get_view_builder(req):
     base_url = req.application_url
-    return ViewBuilder(base_url)
+    return ViewBuilder(base_url, req=req)
 
 
 class ViewBuilder(common.ViewBuilder):
 
-    def __init__(self, base_url):
-        """:param base_url: url of the root wsgi application."""
+    def __init__(self, base_url, req=None):
+        """:param base_url: url of the root wsgi application.
+        :param req: request the view is built for.
+        """
         self.prefix = self._update_masakari_link_prefix(base_url)
         self.base_url = base_url
+        self.req = req
 
     def _host_details(self, host):
         return {
@@ -34,7 +38,7 @@ class ViewBuilder(common.ViewBuilder):
             'uuid': host.uuid,
             'name': host.name,
             'failover_segment_id': host.failover_segment.uuid,
-            'failover_segment': host.failover_segment,
+            'failover_segment': self._segment_details(host.failover_segment),
             'type': host.type,
             'reserved': host.reserved,
             'control_attributes': host.control_attributes,
@@ -45,6 +49,11 @@ class ViewBuilder(common.ViewBuilder):
             'deleted': host.deleted
         }
 
+    def _segment_details(self, segment):
+        if self.req is None:
+            return segment
+        return views_segments.build_segment(self.req, segment)
+
     def build_host(self, host):
         get_host_response = self._host_details(host)
         return get_host_response
@@ -0,0 +1,31 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+
+from masakari.api import api_version_request
+
+
+def build_segment(req, segment):
+    """Failover segment as returned at the microversion of the request."""
+    if (api_version_request.is_supported(req, min_version='1.6') or
+            not segment.obj_attr_is_set('active_notifications')):
+        return segment
+
+    # NOTE: A shallow copy, the segment itself is left untouched.
+    segment = copy.copy(segment)
+    delattr(segment, 'active_notifications')
+    return segment
+
+
+def build_segments(req, segments):
+    return [build_segment(req, segment) for segment in segments]
@@ -13,12 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import socket
-
 from masakari.notifications.objects import base as notification_base
 from masakari.notifications.objects import exception as notification_exception
 from masakari.notifications.objects import notification as event_notification
 from masakari.objects import fields
+from masakari import rpc
 
 
 def _get_fault_and_priority_from_exc_and_tb(exception, tb):
@@ -33,6 +32,7 @@ def _get_fault_and_priority_from_exc_and_tb(exception, tb):
     return fault, priority
 
 
+@rpc.if_notifications_enabled
 def notify_about_segment_api(context, segment, action, phase=None,
                              binary='masakari-api', exception=None, tb=None):
     """Send versioned notification about a segment API.
@@ -50,8 +50,8 @@ def notify_about_segment_api(context, segment, action, phase=None,
     api_notification = event_notification.SegmentApiNotification(
         context=context,
         priority=priority,
-        publisher=notification_base.NotificationPublisher(
-            context=context, host=socket.gethostname(), binary=binary),
+        publisher=notification_base.NotificationPublisher.from_binary(
+            binary),
         event_type=notification_base.EventType(
             action=action,
             phase=phase),
@@ -59,6 +59,7 @@ def notify_about_segment_api(context, segment, action, phase=None,
     api_notification.emit(context)
 
 
+@rpc.if_notifications_enabled
 def notify_about_host_api(context, host, action, phase=None,
                           binary='masakari-api', exception=None, tb=None):
     """Send versioned notification about a host API.
@@ -75,8 +76,8 @@ def notify_about_host_api(context, host, action, phase=None,
     api_notification = event_notification.HostApiNotification(
         context=context,
         priority=priority,
-        publisher=notification_base.NotificationPublisher(
-            context=context, host=socket.gethostname(), binary=binary),
+        publisher=notification_base.NotificationPublisher.from_binary(
+            binary),
         event_type=notification_base.EventType(
             action=action,
             phase=phase),
@@ -84,6 +85,7 @@ def notify_about_host_api(context, host, action, phase=None,
     api_notification.emit(context)
 
 
+@rpc.if_notifications_enabled
 def notify_about_notification_api(context, notification, action, phase=None,
                           binary='masakari-api', exception=None, tb=None):
     """Send versioned notification about a notification api.
@@ -101,8 +103,8 @@ def notify_about_notification_api(context, notification, action, phase=None,
     api_notification = event_notification.NotificationApiNotification(
         context=context,
         priority=priority,
-        publisher=notification_base.NotificationPublisher(
-            context=context, host=socket.gethostname(), binary=binary),
+        publisher=notification_base.NotificationPublisher.from_binary(
+            binary),
         event_type=notification_base.EventType(
             action=action,
             phase=phase),
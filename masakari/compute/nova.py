@@ -16,8 +16,10 @@
 Handles all requests to Nova.
 """
 
+import collections
 import functools
 import sys
+import threading
 
 from keystoneauth1 import exceptions as keystone_exception
 import keystoneauth1.loading
@@ -26,6 +28,7 @@ from novaclient import api_versions
 from novaclient import client as nova_client
 from novaclient import exceptions as nova_exception
 from oslo_log import log as logging
+from requests import adapters as requests_adapters
 from requests import exceptions as request_exceptions
 
 from masakari import conf
@@ -78,61 +81,154 @@ def translate_nova_exception(method):
     return wrapper
 
 
+class NovaClientPool(object):
+    """Process wide pool of authenticated Keystone sessions and Nova clients.
+
+    Keystone sessions are keyed by the privileged credentials and region
+    used to build them, so the auth plugin keeps its token until it expires
+    and the underlying HTTP connections are kept alive between calls. Nova
+    clients bound to a pooled session are cached per global request id and
+    timeout in a bounded LRU, as the request id is baked into the client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _session_key(self):
+        return (CONF.os_privileged_user_auth_url,
+                CONF.os_privileged_user_name,
+                CONF.os_privileged_user_password,
+                CONF.os_privileged_user_tenant,
+                CONF.os_user_domain_name,
+                CONF.os_project_domain_name,
+                CONF.os_system_scope,
+                CONF.os_region_name,
+                CONF.nova_ca_certificates_file,
+                CONF.nova_api_insecure)
+
+    def _create_session(self, context):
+        # User needs to authenticate to Keystone before querying Nova, so we
+        # set auth_url to the identity service endpoint
+        url = CONF.os_privileged_user_auth_url
+
+        LOG.debug('Creating a Keystone session for Nova using "%s" user',
+                  CONF.os_privileged_user_name)
+
+        # Now that we have the correct auth_url, username, password and
+        # project_name, let's build a Keystone session.
+        loader = keystoneauth1.loading.get_plugin_loader(
+            CONF.keystone_authtoken.auth_type)
+        auth = loader.load_from_options(
+            auth_url=url,
+            username=context.user_id,
+            password=context.auth_token,
+            project_name=context.project_name,
+            user_domain_name=CONF.os_user_domain_name,
+            project_domain_name=CONF.os_project_domain_name,
+            system_scope=CONF.os_system_scope)
+        session_loader = keystoneauth1.loading.session.Session()
+        keystone_session = session_loader.load_from_options(
+            auth=auth, cacert=CONF.nova_ca_certificates_file,
+            insecure=CONF.nova_api_insecure)
+
+        # Cap the number of keep-alive connections opened towards the
+        # identity and compute endpoints by this process.
+        adapter = requests_adapters.HTTPAdapter(
+            pool_connections=CONF.nova_client_pool_connections,
+            pool_maxsize=CONF.nova_client_pool_maxsize,
+            pool_block=True)
+        keystone_session.session.mount('https://', adapter)
+        keystone_session.session.mount('http://', adapter)
+
+        return keystone_session
+
+    def get_client(self, context, timeout=None):
+        """Returns a Nova client bound to a pooled Keystone session."""
+        nova_catalog_info = CONF.nova_catalog_admin_info
+        service_type, service_name, endpoint_type = nova_catalog_info.split(
+            ':')
+
+        context = ctx.RequestContext(
+            user_id=CONF.os_privileged_user_name,
+            project_id=None,
+            auth_token=CONF.os_privileged_user_password,
+            project_name=CONF.os_privileged_user_tenant,
+            service_catalog=context.service_catalog,
+            global_request_id=context.global_id)
+
+        session_key = self._session_key()
+        client_key = (session_key, nova_catalog_info, timeout,
+                      context.global_id)
+
+        with self._lock:
+            client_obj = self._clients.get(client_key)
+            if client_obj is not None:
+                self._clients.move_to_end(client_key)
+                self.hits += 1
+                return client_obj
+
+            self.misses += 1
+            keystone_session = self._sessions.get(session_key)
+            if keystone_session is None:
+                keystone_session = self._create_session(context)
+                self._sessions[session_key] = keystone_session
+
+            LOG.debug('Creating a Nova client using "%s" user',
+                      CONF.os_privileged_user_name)
+
+            client_obj = nova_client.Client(
+                api_versions.APIVersion(NOVA_API_VERSION),
+                session=keystone_session,
+                insecure=CONF.nova_api_insecure,
+                timeout=timeout,
+                global_request_id=context.global_id,
+                region_name=CONF.os_region_name,
+                endpoint_type=endpoint_type,
+                service_type=service_type,
+                service_name=service_name,
+                cacert=CONF.nova_ca_certificates_file,
+                extensions=nova_extensions)
+
+            self._clients[client_key] = client_obj
+            while len(self._clients) > CONF.nova_client_cache_size:
+                self._clients.popitem(last=False)
+
+        return client_obj
+
+    def stats(self):
+        """Returns the pool hit/miss counters and current sizes."""
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'sessions': len(self._sessions),
+                    'clients': len(self._clients)}
+
+    def reset(self):
+        """Drops all pooled sessions and clients."""
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+CLIENT_POOL = NovaClientPool()
+
+
 def novaclient(context, timeout=None):
     """Returns a Nova client
 
+    The client and its Keystone session are taken from the process wide
+    :data:`CLIENT_POOL` so that tokens and connections are reused.
+
     @param timeout: Number of seconds to wait for an answer before raising a
         Timeout exception (None to disable)
     """
-    nova_catalog_info = CONF.nova_catalog_admin_info
-    service_type, service_name, endpoint_type = nova_catalog_info.split(':')
-
-    context = ctx.RequestContext(
-        user_id=CONF.os_privileged_user_name,
-        project_id=None,
-        auth_token=CONF.os_privileged_user_password,
-        project_name=CONF.os_privileged_user_tenant,
-        service_catalog=context.service_catalog,
-        global_request_id=context.global_id)
-
-    # User needs to authenticate to Keystone before querying Nova, so we set
-    # auth_url to the identity service endpoint
-    url = CONF.os_privileged_user_auth_url
-
-    LOG.debug('Creating a Nova client using "%s" user',
-              CONF.os_privileged_user_name)
-
-    # Now that we have the correct auth_url, username, password and
-    # project_name, let's build a Keystone session.
-    loader = keystoneauth1.loading.get_plugin_loader(
-        CONF.keystone_authtoken.auth_type)
-    auth = loader.load_from_options(
-        auth_url=url,
-        username=context.user_id,
-        password=context.auth_token,
-        project_name=context.project_name,
-        user_domain_name=CONF.os_user_domain_name,
-        project_domain_name=CONF.os_project_domain_name,
-        system_scope=CONF.os_system_scope)
-    session_loader = keystoneauth1.loading.session.Session()
-    keystone_session = session_loader.load_from_options(
-        auth=auth, cacert=CONF.nova_ca_certificates_file,
-        insecure=CONF.nova_api_insecure)
-
-    client_obj = nova_client.Client(
-        api_versions.APIVersion(NOVA_API_VERSION),
-        session=keystone_session,
-        insecure=CONF.nova_api_insecure,
-        timeout=timeout,
-        global_request_id=context.global_id,
-        region_name=CONF.os_region_name,
-        endpoint_type=endpoint_type,
-        service_type=service_type,
-        service_name=service_name,
-        cacert=CONF.nova_ca_certificates_file,
-        extensions=nova_extensions)
-
-    return client_obj
+    return CLIENT_POOL.get_client(context, timeout=timeout)
 
 
 class API(object):
@@ -149,6 +245,17 @@ class API(object):
         LOG.info('Fetch Server list on %s', host)
         return nova.servers.list(detailed=True, search_opts=opts)
 
+    @translate_nova_exception
+    def get_servers_changed_since(self, context, changes_since):
+        """Get all servers of all projects changed since the given time."""
+        opts = {
+            'changes-since': changes_since.isoformat(),
+            'all_tenants': True
+        }
+        nova = novaclient(context)
+        LOG.debug('Fetch Server list changed since %s', opts['changes-since'])
+        return nova.servers.list(detailed=True, search_opts=opts, limit=-1)
+
     @translate_nova_exception
     def enable_disable_service(self, context, host_name, enable=False,
                                reason=None):
@@ -173,6 +280,22 @@ class API(object):
         service = nova.services.list(host=host_name, binary=binary)[0]
         return service.status == 'disabled'
 
+    @translate_nova_exception
+    def is_service_down(self, context, host_name, binary):
+        """Check whether nova considers the service on given host down."""
+        nova = novaclient(context)
+        service = nova.services.list(host=host_name, binary=binary)[0]
+        return service.state == 'down' or service.forced_down
+
+    @translate_nova_exception
+    def force_down_service(self, context, host_name, binary):
+        """Mark the service on given host as forced down."""
+        nova = novaclient(context)
+        service = nova.services.list(host=host_name, binary=binary)[0]
+        LOG.info('Force down %(binary)s on %(host)s',
+                 {'binary': binary, 'host': host_name})
+        nova.services.force_down(service.id, True)
+
     @translate_nova_exception
     def evacuate_instance(self, context, uuid, target=None):
         """Evacuate an instance from failed host to specified host."""
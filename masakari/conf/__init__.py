@@ -22,6 +22,7 @@ from masakari.conf import database
 from masakari.conf import engine
 from masakari.conf import engine_driver
 from masakari.conf import exceptions
+from masakari.conf import notifications
 from masakari.conf import nova
 from masakari.conf import osapi_v1
 from masakari.conf import paths
@@ -38,6 +39,7 @@ database.register_opts(CONF)
 engine.register_opts(CONF)
 engine_driver.register_opts(CONF)
 exceptions.register_opts(CONF)
+notifications.register_opts(CONF)
 nova.register_opts(CONF)
 osapi_v1.register_opts(CONF)
 paths.register_opts(CONF)
@@ -98,6 +98,29 @@ unchanged.
 
   ``masakari-api``
 
+* Related options:
+
+  None
+"""),
+    cfg.IntOpt("notification_idempotency_window",
+        default=600,
+        min=0,
+        help="""
+Number of seconds during which a notification create request carrying an
+``Idempotency-Key`` header is answered with the notification created by the
+first request with the same key.
+
+Host monitors retry their requests on timeouts, the replays are answered from
+an indexed lookup without running the notification ingestion again.
+
+* Possible values:
+
+  Any positive integer. Default is 600. 0 to ignore the header.
+
+* Services that use this:
+
+  ``masakari-api``
+
 * Related options:
 
   None
@@ -105,7 +128,13 @@ unchanged.
     cfg.IntOpt("notification_delay_max",
         default=5,
         min=0,
+        deprecated_for_removal=True,
+        deprecated_reason="""
+Concurrent duplicate notifications are rejected by a unique deduplication key
+in the database, the delay isn't applied anymore.""",
         help="""
+*DEPRECATED*
+
 Maximum random delay, in seconds, applied before creating a notification
 when the coordination backend is not configured.
 
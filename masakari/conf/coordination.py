@@ -22,7 +22,9 @@ coordination_opts = [
                help="The backend URL to use for distributed coordination."
                     "By default it's None which means that coordination is "
                     "disabled. The coordination is implemented for "
-                    "distributed lock management and was tested with etcd."
+                    "distributed lock management and the election of the "
+                    "masakari-engine running the periodic tasks which scan "
+                    "the notifications, and was tested with etcd."
                     "Coordination doesn't work for file driver because lock "
                     "files aren't removed after lock releasing."),
 ]
@@ -88,6 +88,42 @@ notification_opts = [
                default=120,
                help='Interval in seconds for processing notifications which '
                     'are in error or new state.'),
+    cfg.IntOpt('process_unfinished_notifications_workers',
+               default=4,
+               min=1,
+               help="Number of green threads used by the "
+                    "'process_unfinished_notifications' periodic task to "
+                    "recover notifications concurrently. Notifications of "
+                    "the same source host are always processed one after "
+                    "another, so this bounds how many hosts are recovered "
+                    "in parallel. Set it to 1 to process all notifications "
+                    "sequentially."),
+    cfg.IntOpt('process_unfinished_notifications_batch_size',
+               default=100,
+               min=1,
+               help="Maximum number of notifications claimed at once by the "
+                    "'process_unfinished_notifications' periodic task of an "
+                    "engine. The engines running the task at the same time "
+                    "claim disjoint batches of notifications, so each "
+                    "notification is recovered by a single engine."),
+    cfg.IntOpt('notification_lease_time',
+               default=300,
+               min=1,
+               help="Number of seconds an engine keeps the notifications "
+                    "claimed by its 'process_unfinished_notifications' "
+                    "periodic task and the notifications it is recovering. "
+                    "The lease is renewed as long as the engine runs, the "
+                    "notifications of an engine which stopped renewing it, "
+                    "including the running ones, are claimed by another "
+                    "engine once it expires."),
+    cfg.IntOpt('notification_batch_workers',
+               default=4,
+               min=1,
+               help="Number of green threads used to recover the "
+                    "notifications created together by a batch request. "
+                    "Notifications of the same source host are always "
+                    "processed one after another, so this bounds how many "
+                    "hosts of a batch are recovered in parallel."),
     cfg.IntOpt('retry_notification_new_status_interval',
                default=60,
                mutable=True,
@@ -113,7 +149,48 @@ notification_opts = [
 ]
 
 
-ALL_OPTS = (rpcapi_opts + notification_opts + driver_opts)
+nova_notification_opts = [
+    cfg.BoolOpt('nova_notifications_listener',
+                default=False,
+                help="""
+Listen to the versioned notifications sent by nova when an instance is
+evacuated, powered off or powered on. These notifications wake up the
+recovery tasks waiting for the instance state to change, which then confirm
+the new state with a single request to nova-api instead of polling it every
+``verify_interval`` seconds. Nova must be configured to send versioned
+notifications, the transport of ``[oslo_messaging_notifications]`` is used.
+
+* Related options:
+
+  ``nova_notifications_verify_interval``
+"""),
+    cfg.StrOpt('nova_notifications_exchange',
+               default='nova',
+               help='Exchange nova sends its versioned notifications to.'),
+    cfg.ListOpt('nova_notifications_topics',
+                default=['versioned_notifications'],
+                help='Topics nova sends its versioned notifications to, '
+                     'see ``[notifications]\\versioned_notifications_topics`` '
+                     'in nova.conf.'),
+    cfg.StrOpt('nova_notifications_pool',
+               help="""
+Name of the pool of listeners consuming the nova notifications. Every engine
+must receive all the notifications, the default is a pool per engine host
+named ``masakari-engine-<host>``. A pool is needed so that the notifications
+are not taken away from the other consumers of the same topics.
+"""),
+    cfg.IntOpt('nova_notifications_verify_interval',
+               default=30,
+               min=1,
+               help="""
+Interval in seconds at which the state of an instance is still polled when
+``nova_notifications_listener`` is enabled, in case a notification is lost.
+"""),
+]
+
+
+ALL_OPTS = (rpcapi_opts + notification_opts + driver_opts +
+            nova_notification_opts)
 
 
 def register_opts(conf):
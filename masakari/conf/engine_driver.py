@@ -89,6 +89,74 @@ will not be added to the aggregate group of failed compute host."""),
                default="Masakari detected host failed.",
                help="Compute disable reason in case Masakari detects host "
                     "failure."),
+    cfg.BoolOpt("wait_for_compute_service_down",
+                default=False,
+                help="""
+Operators can decide whether the host failure workflows should wait until
+nova considers the nova-compute service of the failed host down, instead of
+always sleeping ``wait_period_after_service_update`` seconds after disabling
+it. When set to True, the state of the service is checked every
+``verify_interval`` seconds and the recovery continues as soon as nova reports
+it down or forced down, ``wait_period_after_service_update`` being the upper
+bound of the wait. When set to False, the recovery always sleeps
+``wait_period_after_service_update`` seconds."""),
+    cfg.BoolOpt("force_down_compute_service",
+                default=False,
+                help="""
+Operators can decide whether the host failure workflows should mark the
+nova-compute service of the failed host as forced down through the nova API,
+so that nova considers it down right away and the recovery doesn't have to
+wait for it. When set to True, the forced down flag has to be unset by the
+operator once the host is repaired, otherwise nova keeps considering the
+service down. When set to False, the service is only disabled."""),
+    cfg.BoolOpt("batch_server_state_polling",
+                default=False,
+                help="""
+Operators can decide whether the state of the evacuated instances should be
+confirmed with one shared server list request per ``verify_interval`` instead
+of one server show request per instance. When set to True, all instances
+evacuated from a failed compute node are polled together using the
+``changes-since`` filter of the nova server list API, which reduces the load
+on nova-api by a factor of the number of evacuated instances. When set to
+False, every instance is polled on its own."""),
+    cfg.IntOpt("initial_concurrent_evacuations",
+               default=3,
+               min=1,
+               help="""
+Number of instances evacuated and confirmed at the same time by an engine when
+it starts, across all the host failures it is recovering. The number then
+adapts to the latency and errors of nova-api, see
+``[host_failure]\\max_concurrent_evacuations``. The instances of a single
+failed host are still evacuated by at most ``host_failure_recovery_threads``
+threads."""),
+    cfg.IntOpt("max_concurrent_evacuations",
+               default=10,
+               min=1,
+               help="""
+Maximum number of instances evacuated and confirmed at the same time by an
+engine, across all the host failures it is recovering. The number of
+concurrent evacuations starts at
+``[host_failure]\\initial_concurrent_evacuations``, grows by one after as
+many fast and successful evacuate requests and is halved when nova-api fails
+an evacuate request, rejects it with a conflict or answers slower than
+``[host_failure]\\evacuation_latency_threshold``. It never goes above this
+value."""),
+    cfg.FloatOpt("evacuation_latency_threshold",
+                 default=5.0,
+                 min=0.1,
+                 help="""
+Number of seconds above which an evacuate request is considered slow. A slow
+request halves the number of concurrent evacuations of the engine, see
+``[host_failure]\\max_concurrent_evacuations``."""),
+    cfg.StrOpt("evacuation_priority_metadata_key",
+               default="HA_Priority",
+               help="""
+Operators can decide on the instance metadata key holding the evacuation
+priority of an instance. The instances of the failed compute nodes are
+evacuated in the following order: instances having
+``[host_failure]\\ha_enabled_instance_metadata_key`` set to ``True`` first,
+then the instances with the highest integer value of this metadata key.
+Instances without the key have the priority 0."""),
 ]
 
 instance_failure_options = [
@@ -121,6 +189,54 @@ taskflow_options = [
                secret=True,
                help="""
 The SQLAlchemy connection string to use to connect to the taskflow database.
+"""),
+    cfg.IntOpt('max_pool_size',
+               min=1,
+               help="""
+Maximum number of SQL connections kept open in the pool of the taskflow
+persistence backend shared by all recovery workflows and progress details
+requests of a process. If not set, the SQLAlchemy default is used. Not used
+for SQLite.
+"""),
+    cfg.IntOpt('max_overflow',
+               min=0,
+               help="""
+If set, use this value for max_overflow with the taskflow persistence backend
+connection pool. Not used for SQLite.
+"""),
+    cfg.IntOpt('pool_timeout',
+               min=1,
+               help="""
+If set, use this value for pool_timeout with the taskflow persistence backend
+connection pool. Not used for SQLite.
+"""),
+    cfg.BoolOpt('pool_pre_ping',
+                default=True,
+                help="""
+Test the connections of the taskflow persistence backend pool for liveness
+when they are checked out, so connections closed by the database server are
+replaced transparently instead of failing the first request that uses them.
+"""),
+    cfg.IntOpt('progress_batch_size',
+               default=10,
+               min=1,
+               help="""
+Number of progress messages of a recovery task that are buffered before they
+are persisted to the taskflow database. Only the messages of a batch are
+persisted, taskflow then keeps the last batch as the progress of the running
+task, and the complete progress history is persisted once when the task
+finishes. The progress reported by the notification progress details API may
+lag behind by up to this number of messages while a task is running. Set to 1
+to persist every message immediately.
+"""),
+    cfg.IntOpt('progress_flush_interval',
+               default=5,
+               min=0,
+               help="""
+Maximum number of seconds buffered progress messages of a recovery task are
+kept before they are persisted to the taskflow database, regardless of
+``[taskflow]\\progress_batch_size``. The interval is checked whenever the task
+reports a new message. Set to 0 to flush based on the batch size only.
 """),
 ]
 
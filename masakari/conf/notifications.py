@@ -0,0 +1,108 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+
+
+notifications_group = cfg.OptGroup(
+    'notifications',
+    title='Versioned notifications options',
+    help="""
+Options controlling how the versioned notifications about segments, hosts and
+notifications are emitted by the masakari-api and masakari-engine services.
+""")
+
+notifications_opts = [
+    cfg.IntOpt('emitter_queue_size',
+               default=1000,
+               min=0,
+               help="""
+Number of versioned notifications waiting to be sent by the background
+emitter of a process.
+
+The notifications are queued by the API requests and the recovery workflows
+and sent to the message bus by a background green thread, which takes the
+latency of the bus off the requests and recovery workflows. The queued
+notifications are sent before the service stops.
+
+* Possible values:
+
+  0 to send the notifications synchronously, as they are emitted.
+
+* Related options:
+
+  ``emitter_overflow_policy``
+"""),
+    cfg.IntOpt('emitter_batch_size',
+               default=100,
+               min=1,
+               help="""
+Maximum number of queued versioned notifications sent together by the
+background emitter before it checks for new notifications again. The
+notifications of a batch are grouped per publisher and sent in order with
+the notifier of the publisher.
+"""),
+    cfg.StrOpt('emitter_overflow_policy',
+               default='block',
+               choices=[
+                   ('block', 'Wait for the emitter to make room in the '
+                             'queue.'),
+                   ('drop', 'Drop the notification and log a warning.'),
+               ],
+               help="""
+What to do with a versioned notification emitted while the queue of the
+background emitter is full.
+
+* Related options:
+
+  ``emitter_queue_size``
+"""),
+    cfg.ListOpt('include_event_types',
+                default=['*'],
+                help="""
+Event types of the versioned notifications to emit.
+
+The event type of a versioned notification is its action followed by its
+phase, for example ``host.update.start`` or ``notification.create.error``.
+Shell-style wildcards are supported. The payload of the notifications which
+aren't emitted isn't built.
+
+* Possible values:
+
+  A list of event type patterns. For example ``*.end,*.error`` to only emit
+  the notifications sent once an operation completed or failed.
+
+* Related options:
+
+  ``exclude_event_types``
+"""),
+    cfg.ListOpt('exclude_event_types',
+                default=[],
+                help="""
+Event types of the versioned notifications not to emit, even if they match
+``include_event_types``. Shell-style wildcards are supported, for example
+``*.start`` or ``segment.*``.
+
+* Related options:
+
+  ``include_event_types``
+"""),
+]
+
+
+def register_opts(conf):
+    conf.register_group(notifications_group)
+    conf.register_opts(notifications_opts, group=notifications_group)
+
+
+def list_opts():
+    return {notifications_group.name: notifications_opts}
@@ -55,6 +55,26 @@ nova_opts = [
                     'privileged account.'),
     cfg.StrOpt('os_system_scope',
                help='Scope for system operations.'),
+    cfg.IntOpt('nova_client_pool_connections',
+               default=10,
+               min=1,
+               help='Number of distinct hosts for which keep-alive '
+                    'connections are pooled by the shared Keystone session '
+                    'used for nova client requests.'),
+    cfg.IntOpt('nova_client_pool_maxsize',
+               default=10,
+               min=1,
+               help='Maximum number of keep-alive connections kept open per '
+                    'host by the shared Keystone session used for nova '
+                    'client requests. Requests block until a connection is '
+                    'free once this limit is reached.'),
+    cfg.IntOpt('nova_client_cache_size',
+               default=64,
+               min=1,
+               help='Maximum number of nova client objects cached per '
+                    'process. Clients are cached per global request id, so '
+                    'this bounds how many in-flight recoveries reuse their '
+                    'own client.'),
 ]
 
 
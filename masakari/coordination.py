@@ -19,8 +19,12 @@ import decorator
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import timeutils
+import tooz
 from tooz import coordination
 
+from masakari import context as masakari_context
+from masakari import db
+
 LOG = log.getLogger(__name__)
 
 
@@ -40,6 +44,7 @@ class Coordinator(object):
         self.agent_id = agent_id or str(uuid.uuid4())
         self.started = False
         self.prefix = prefix
+        self._leader_locks = {}
 
     def start(self):
         """Starts coordination
@@ -58,6 +63,7 @@ class Coordinator(object):
     def stop(self):
         """Disconnect from coordination backend and stop heartbeat."""
         if self.started:
+            self._resign()
             self.coordinator.stop()
             self.coordinator = None
             self.started = False
@@ -65,21 +71,82 @@ class Coordinator(object):
     def get_lock(self, name):
         """Return a Tooz backend lock.
 
+        None is returned when the coordination isn't configured or started.
+
         :param str name: The lock name that is used to identify it
             across all nodes.
         """
         # Tooz expects lock name as a byte string.
         lock_name = (self.prefix + name).encode('ascii')
-        if cfg.CONF.coordination.backend_url:
+        if cfg.CONF.coordination.backend_url and self.started:
             return self.coordinator.get_lock(lock_name)
-        LOG.debug("Cannot get lock %s, because coordination is not configured",
-                  lock_name)
+        LOG.debug("Cannot get lock %s, because coordination is not "
+                  "configured or not started", lock_name)
+
+    def is_leader(self, election):
+        """Whether this member is the leader of an election.
+
+        The leader of an election is the member holding its lock, which is
+        tried to be acquired without blocking at every call. The lock is kept
+        alive by the heartbeat of the leader, once it isn't renewed anymore
+        the lock expires and the next member calling this method becomes the
+        leader.
+
+        Every member is a leader when the coordination isn't started or the
+        backend can't be reached, so that the callers carry on as without
+        coordination.
+
+        :param str election: The election name that is used to identify it
+            across all nodes.
+        """
+        if not self.started:
+            return True
+
+        lock = self._leader_locks.get(election)
+        try:
+            if lock is not None:
+                if self._is_still_owner(lock):
+                    return True
+                LOG.warning("Lost the leadership of %s.", election)
+                del self._leader_locks[election]
+
+            lock = self.get_lock(election)
+            if not lock.acquire(blocking=False):
+                return False
+        except tooz.ToozError as error:
+            LOG.warning("Cannot elect the leader of %(election)s, acting as "
+                        "the leader: %(error)s",
+                        {'election': election, 'error': error})
+            return True
+
+        LOG.info("Elected as the leader of %s.", election)
+        self._leader_locks[election] = lock
+        return True
+
+    @staticmethod
+    def _is_still_owner(lock):
+        try:
+            return lock.is_still_owner()
+        except tooz.NotImplemented:
+            # The lock is held as long as it is renewed by the heartbeat.
+            return True
+
+    def _resign(self):
+        for election, lock in self._leader_locks.items():
+            try:
+                lock.release()
+            except tooz.ToozError as error:
+                LOG.warning("Error occurred while resigning the leadership "
+                            "of %(election)s: %(error)s",
+                            {'election': election, 'error': error})
+        self._leader_locks = {}
 
 
 COORDINATOR = Coordinator(prefix='masakari-')
 
 
-def synchronized(lock_name, blocking=True, coordinator=COORDINATOR):
+def synchronized(lock_name, blocking=True, coordinator=COORDINATOR,
+                 fencing=False):
     """Synchronization decorator.
 
     :param str lock_name: Lock name.
@@ -89,6 +156,9 @@ def synchronized(lock_name, blocking=True, coordinator=COORDINATOR):
             after this number of seconds exception is raised.
     :param coordinator: Coordinator class to use when creating lock.
         Defaults to the global coordinator.
+    :param fencing: If True, a fencing token is issued once the lock is
+        acquired and passed to the decorated function as its `fencing_token`
+        keyword argument.
     :raises tooz.coordination.LockAcquireFailed: if lock is not acquired
 
     Decorating a method like so::
@@ -119,6 +189,17 @@ def synchronized(lock_name, blocking=True, coordinator=COORDINATOR):
 
     Available field names are: decorated function parameters and
     `function_name` as a decorated function name.
+
+    The fencing tokens of a lock increase with every holder of the lock.
+    Recording the fencing token on the resources updated under the lock lets
+    them reject the updates of a previous holder, which lost the lock without
+    noticing it, for example because its heartbeat was late::
+
+        @synchronized('{function_name}-{host}', fencing=True)
+        def foo(self, host, fencing_token=None):
+           ...
+
+    No fencing token is passed when coordination is not configured.
     """
 
     @decorator.decorator
@@ -137,6 +218,13 @@ def synchronized(lock_name, blocking=True, coordinator=COORDINATOR):
                               {'name': lock.name,
                                'function': f.__name__,
                                'wait_secs': (t2 - t1)})
+                    if fencing:
+                        call = inspect.signature(f).bind(*a, **k)
+                        call.arguments['fencing_token'] = (
+                            db.fencing_token_issue(
+                                masakari_context.get_admin_context(),
+                                lock.name.decode('ascii')))
+                        return f(*call.args, **call.kwargs)
                     return f(*a, **k)
             finally:
                 t3 = timeutils.now()
@@ -161,6 +161,10 @@ def is_failover_segment_under_recovery(context, failover_segment_id,
     :returns: Returns True if any of the host belonging to a failover segment
               is being used for processing any notifications which are in
               new, error or running status otherwise it will return False.
+
+    When filtering on exactly the new, error and running statuses, the
+    active notifications counter of the segment is read instead of counting
+    the notifications.
     """
     return IMPL.is_failover_segment_under_recovery(
         context, failover_segment_id, filters=filters)
@@ -297,6 +301,69 @@ def notifications_get_all_by_filters(
                                                  marker=marker)
 
 
+def notifications_claim(context, owner, lease_expires_at,
+                        new_generated_before, limit):
+    """Claim the notifications to be processed again by an engine.
+
+    The notifications in error and the new notifications generated before
+    'new_generated_before' are claimed, unless another owner holds a lease
+    on them which didn't expire yet. The running notifications are claimed
+    once their lease expired.
+
+    :param context: context to query under
+    :param owner: identifier of the engine claiming the notifications
+    :param lease_expires_at: time until which the notifications are claimed
+    :param new_generated_before: the new notifications generated before this
+                                 time are claimed along with the
+                                 notifications in error
+    :param limit: maximum number of notifications to claim
+
+    :returns: list of dictionary-like objects containing the claimed
+              notifications
+    """
+    return IMPL.notifications_claim(context, owner, lease_expires_at,
+                                    new_generated_before, limit)
+
+
+def notifications_renew_leases(context, owner, lease_expires_at):
+    """Renew the leases of the new, error and running notifications of an
+    owner.
+
+    :param context: context to query under
+    :param owner: identifier of the engine which claimed the notifications
+    :param lease_expires_at: time until which the notifications are claimed
+
+    :returns: number of notifications whose lease was renewed
+    """
+    return IMPL.notifications_renew_leases(context, owner, lease_expires_at)
+
+
+def notifications_release(context, owner):
+    """Release the notifications claimed by an owner, but the running ones.
+
+    :param context: context to query under
+    :param owner: identifier of the engine which claimed the notifications
+
+    :returns: number of released notifications
+    """
+    return IMPL.notifications_release(context, owner)
+
+
+def notifications_expire(context, generated_before):
+    """Mark the expired notifications as failed.
+
+    The new, running and error notifications generated before the given time
+    are updated in a single statement.
+
+    :param context: context to query under
+    :param generated_before: the notifications generated before this time
+                             are expired
+
+    :returns: list of the uuids of the expired notifications
+    """
+    return IMPL.notifications_expire(context, generated_before)
+
+
 def notification_get_by_uuid(context, notification_uuid):
     """Get notification information by uuid.
 
@@ -311,6 +378,23 @@ def notification_get_by_uuid(context, notification_uuid):
     return IMPL.notification_get_by_uuid(context, notification_uuid)
 
 
+def notification_get_by_idempotency_key(context, idempotency_key,
+                                        created_since):
+    """Get the latest notification created with an idempotency key.
+
+    :param context: context to query under
+    :param idempotency_key: idempotency key of the create request
+    :param created_since: only consider the notifications created after it
+
+    :returns: dictionary-like object containing notification
+
+    :raises: exception.NotificationNotFound if no notification was created
+             with 'idempotency_key' since 'created_since'
+    """
+    return IMPL.notification_get_by_idempotency_key(
+        context, idempotency_key, created_since)
+
+
 def notification_get_by_id(context, notification_id):
     """Get notification information by id.
 
@@ -325,6 +409,24 @@ def notification_get_by_id(context, notification_id):
     return IMPL.notification_get_by_id(context, notification_id)
 
 
+def notification_duplicate_exists(context, notification_type,
+                                  source_host_uuid, payload_hash,
+                                  generated_since):
+    """Check whether an identical notification was already received.
+
+    :param context: context to query under
+    :param notification_type: type of the notification
+    :param source_host_uuid: uuid of the host which sent the notification
+    :param payload_hash: hash of the canonical notification payload
+    :param generated_since: only look at the notifications generated after
+
+    :returns: True if such a notification exists, False otherwise
+    """
+    return IMPL.notification_duplicate_exists(
+        context, notification_type, source_host_uuid, payload_hash,
+        generated_since)
+
+
 def notification_create(context, values):
     """Create a notification.
 
@@ -332,23 +434,55 @@ def notification_create(context, values):
     :param values: dictionary of notification attributes to create
 
     :returns: dictionary-like object containing created notification
+
+    :raises: exception.DuplicateNotification if a notification with the same
+             deduplication key already exists
     """
     return IMPL.notification_create(context, values)
 
 
-def notification_update(context, notification_uuid, values):
+def notification_create_many(context, values_list):
+    """Create notifications in a single transaction.
+
+    :param context: context to query under
+    :param values_list: list of dictionaries of notification attributes to
+                        create
+
+    :returns: list of dictionary-like objects containing the created
+              notifications, the duplicates aren't created nor returned
+    """
+    return IMPL.notification_create_many(context, values_list)
+
+
+def notification_update(context, notification_uuid, values,
+                        expected_status=None, fencing_token=None):
     """Update notification information in the database.
 
     :param context: context to query under
     :param notification_uuid: uuid of notification to be updated
     :param values: dictionary of notification attributes to be updated
+    :param expected_status: if given, the notification is only updated if
+                            its status is still this one, with a single
+                            statement
+    :param fencing_token: if given, the notification is only updated if it
+                          wasn't updated with a newer fencing token, and
+                          the fencing token is recorded on it
+
+    The 'owner' and 'lease_expires_at' values set the lease held on the
+    notification by an engine.
 
     :returns: dictionary-like object containing updated notification
 
     :raises: exception.NotificationNotFound if notification with given
              'notification_uuid' doesn't exist
+             exception.UnexpectedNotificationStatus if the status of the
+             notification isn't 'expected_status'
+             exception.StaleFencingToken if the notification was updated
+             with a newer fencing token
     """
-    return IMPL.notification_update(context, notification_uuid, values)
+    return IMPL.notification_update(context, notification_uuid, values,
+                                    expected_status=expected_status,
+                                    fencing_token=fencing_token)
 
 
 def notification_delete(context, notification_uuid):
@@ -415,19 +549,44 @@ def vmove_create(context, values):
     return IMPL.vmove_create(context, values)
 
 
-def vmove_update(context, uuid, values):
+def vmove_create_many(context, values_list):
+    """Create many vm moves in a single transaction.
+
+    :param context: context to query under
+    :param values_list: list of dictionaries of the vm move attributes to
+                        create, each of them must contain the 'uuid' key
+
+    :returns: list of dictionary-like objects containing the created vm
+              moves, in the same order as 'values_list'
+    """
+    return IMPL.vmove_create_many(context, values_list)
+
+
+def vmove_update(context, uuid, values, expected_status=None,
+                 fencing_token=None):
     """Update one vm move information in the database.
 
     :param context: context to query under
     :param uuid: uuid of the vm move to be updated
     :param values: dictionary of the vm move attributes to be updated
+    :param expected_status: if given, the vm move is only updated if its
+                            status is still this one
+    :param fencing_token: if given, the vm move is only updated if it wasn't
+                          updated with a newer fencing token, and the
+                          fencing token is recorded on it
 
     :returns: dictionary-like object containing updated one vm move
 
     :raises: exception.VMoveNotFound if the vm move with given
              'uuid' doesn't exist
+             exception.UnexpectedVMoveStatus if the status of the vm move
+             isn't 'expected_status'
+             exception.StaleFencingToken if the vm move was updated with a
+             newer fencing token
     """
-    return IMPL.vmove_update(context, uuid, values)
+    return IMPL.vmove_update(context, uuid, values,
+                             expected_status=expected_status,
+                             fencing_token=fencing_token)
 
 
 def vmove_delete(context, uuid):
@@ -441,6 +600,53 @@ def vmove_delete(context, uuid):
     return IMPL.vmove_delete(context, uuid)
 
 
+def recovery_workflow_details_get_by_notification_uuid(context,
+                                                       notification_uuid):
+    """Get the cached recovery workflow details of a notification.
+
+    :param context: context to query under
+    :param notification_uuid: uuid of the notification
+
+    :returns: dictionary-like object containing the recovery workflow details
+
+    :raises: exception.RecoveryWorkflowDetailsNotFound if nothing is cached
+             for the notification
+    """
+    return IMPL.recovery_workflow_details_get_by_notification_uuid(
+        context, notification_uuid)
+
+
+def recovery_workflow_details_update(context, notification_uuid, values):
+    """Create or update the cached recovery workflow details.
+
+    The details are left untouched once they have been saved with
+    'finished' set to True.
+
+    :param context: context to query under
+    :param notification_uuid: uuid of the notification
+    :param values: dictionary of the recovery workflow details attributes
+                   to be updated
+
+    :returns: dictionary-like object containing the recovery workflow details
+    """
+    return IMPL.recovery_workflow_details_update(context, notification_uuid,
+                                                 values)
+
+
+def fencing_token_issue(context, name):
+    """Issue a new fencing token for a distributed lock.
+
+    The fencing tokens of a lock are increasing integers, each holder of the
+    lock gets a bigger one than the previous holders.
+
+    :param context: context to query under
+    :param name: name of the lock
+
+    :returns: the fencing token
+    """
+    return IMPL.fencing_token_issue(context, name)
+
+
 def purge_deleted_rows(context, age_in_days, max_rows):
     """Purge the soft deleted rows.
 
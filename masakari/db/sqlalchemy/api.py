@@ -14,6 +14,7 @@
 #    under the License.
 """Implementation of SQLAlchemy backend."""
 
+import collections
 import datetime
 import sys
 
@@ -42,6 +43,10 @@ CONF = masakari.conf.CONF
 
 context_manager = enginefacade.transaction_context()
 
+# Statuses of the notifications counted in the active_notifications column of
+# their failover segment.
+ACTIVE_NOTIFICATION_STATUSES = ('new', 'running', 'error')
+
 
 def _get_db_conf(conf_group, connection=None):
     kw = dict(conf_group.items())
@@ -101,6 +106,57 @@ def model_query(context, model, args=None, read_deleted=None):
     return query
 
 
+def _update_returning(context, model, values, conditions=None, criteria=(),
+                      **key):
+    """Update a row with a single UPDATE statement and return it.
+
+    :param context: MasakariContext of the update.
+    :param model: Model of the row.
+    :param values: Values to update.
+    :param conditions: Values the row must have to be updated.
+    :param criteria: Other criteria the row must match to be updated.
+    :param key: Values identifying the row.
+
+    The updated row is returned by the UPDATE statement itself on the
+    database backends supporting RETURNING and read again otherwise. None is
+    returned if no row was updated.
+    """
+    statement = sa.update(model).filter_by(
+        deleted=0, **dict(conditions or {}, **key)).where(*criteria).values(
+        values).execution_options(synchronize_session=False)
+
+    if context.session.get_bind().dialect.update_returning:
+        return context.session.execute(
+            statement.returning(model),
+            execution_options={'populate_existing': True}
+        ).scalars().first()
+
+    if not context.session.execute(statement).rowcount:
+        return None
+    return model_query(context, model).filter_by(**key).first()
+
+
+def _fencing_criteria(model, values, fencing_token):
+    """Criteria and values of an update fenced by a fencing token.
+
+    The row is only updated if it wasn't updated with a newer fencing token,
+    and the fencing token is recorded on it.
+    """
+    if fencing_token is None:
+        return values, ()
+    return (dict(values, fencing_token=fencing_token),
+            (sa.or_(model.fencing_token.is_(None),
+                    model.fencing_token <= fencing_token),))
+
+
+def _check_fencing_token(resource, uuid, row, fencing_token):
+    if (fencing_token is not None and row.fencing_token is not None and
+            row.fencing_token > fencing_token):
+        raise exception.StaleFencingToken(
+            resource=resource, uuid=uuid, fencing_token=fencing_token,
+            actual=row.fencing_token)
+
+
 def _process_sort_params(sort_keys, sort_dirs,
                          default_keys=['created_at', 'id'],
                          default_dir='desc'):
@@ -305,6 +361,17 @@ def is_failover_segment_under_recovery(context, failover_segment_id,
                                        filters=None):
     filters = filters or {}
 
+    status = filters.get('status')
+    if (isinstance(status, (list, tuple, set, frozenset)) and
+            set(status) == set(ACTIVE_NOTIFICATION_STATUSES)):
+        # The active notifications of the segment are counted as their
+        # status changes.
+        active_notifications = model_query(
+            context, models.FailoverSegment,
+            (models.FailoverSegment.active_notifications,)).filter_by(
+            uuid=failover_segment_id).scalar()
+        return bool(active_notifications)
+
     # get all hosts against the failover_segment
     inner_select = model_query(
         context, models.Host, (models.Host.uuid,)).filter(
@@ -314,7 +381,6 @@ def is_failover_segment_under_recovery(context, failover_segment_id,
     query = model_query(context, models.Notification,
                         (func.count(models.Notification.id),))
     if 'status' in filters:
-        status = filters['status']
         if isinstance(status, (list, tuple, set, frozenset)):
             column_attr = getattr(models.Notification, 'status')
             query = query.filter(column_attr.in_(status))
@@ -322,11 +388,26 @@ def is_failover_segment_under_recovery(context, failover_segment_id,
             query = query.filter(models.Notification.status == status)
 
     query = query.filter(
-        models.Notification.source_host_uuid.in_(inner_select.subquery()))
+        models.Notification.source_host_uuid.in_(
+            inner_select.scalar_subquery()))
 
     return query.first()[0] > 0
 
 
+def _update_active_notifications(context, failover_segment_uuid, delta):
+    if not delta:
+        return
+    # NOTE: The counter is incremented in the database, so concurrent
+    # updates of the notifications of a segment don't overwrite each
+    # other, and the updated_at column of the segment is left unchanged.
+    model_query(context, models.FailoverSegment).filter_by(
+        uuid=failover_segment_uuid).update(
+        {'active_notifications': (
+            models.FailoverSegment.active_notifications + delta),
+         'updated_at': models.FailoverSegment.updated_at},
+        synchronize_session=False)
+
+
 # db apis for host
 
 
@@ -351,6 +432,13 @@ def host_get_all_by_filters(
         orm.joinedload(models.Host.failover_segment),
     )
 
+    if 'name' in filters:
+        name = filters['name']
+        if isinstance(name, (list, tuple, set, frozenset)):
+            query = query.filter(models.Host.name.in_(name))
+        else:
+            query = query.filter(models.Host.name == name)
+
     if 'failover_segment_id' in filters:
         query = query.filter(models.Host.failover_segment_id == filters[
             'failover_segment_id'])
@@ -465,15 +553,16 @@ def host_create(context, values):
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.writer
 def host_update(context, host_uuid, values):
-    host = _host_get_by_uuid(context, host_uuid)
-
-    host.update(values)
     try:
-        host.save(session=context.session)
+        count = model_query(context, models.Host).filter_by(
+            uuid=host_uuid).update(values, synchronize_session=False)
     except db_exc.DBDuplicateEntry:
         raise exception.HostExists(name=values.get('name'))
 
-    return _host_get_by_uuid(context, host.uuid)
+    if count == 0:
+        raise exception.HostNotFound(id=host_uuid)
+
+    return _host_get_by_uuid(context, host_uuid)
 
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
@@ -509,8 +598,17 @@ def notifications_get_all_by_filters(
     query = model_query(context, models.Notification)
 
     if 'source_host_uuid' in filters:
-        query = query.filter(models.Notification.source_host_uuid == filters[
-            'source_host_uuid'])
+        source_host_uuid = filters['source_host_uuid']
+        if isinstance(source_host_uuid, (list, tuple, set, frozenset)):
+            query = query.filter(
+                models.Notification.source_host_uuid.in_(source_host_uuid))
+        else:
+            query = query.filter(
+                models.Notification.source_host_uuid == source_host_uuid)
+
+    if 'payload_hash' in filters:
+        query = query.filter(
+            models.Notification.payload_hash.in_(filters['payload_hash']))
 
     if 'failover_segment_uuid' in filters:
         query = query.filter(
@@ -571,6 +669,22 @@ def _notification_get_by_uuid(context, notification_uuid):
     return result
 
 
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.reader
+def notification_get_by_idempotency_key(context, idempotency_key,
+                                        created_since):
+    query = model_query(context, models.Notification).filter_by(
+        idempotency_key=idempotency_key).filter(
+        models.Notification.created_at >= timeutils.normalize_time(
+            created_since)).order_by(models.Notification.created_at.desc())
+
+    result = query.first()
+    if not result:
+        raise exception.NotificationNotFound(id=idempotency_key)
+
+    return result
+
+
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.reader
 def notification_get_by_id(context, notification_id):
@@ -585,32 +699,223 @@ def notification_get_by_id(context, notification_id):
     return result
 
 
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.reader
+def notification_duplicate_exists(context, notification_type,
+                                  source_host_uuid, payload_hash,
+                                  generated_since):
+    query = model_query(context, models.Notification).filter_by(
+        type=notification_type, source_host_uuid=source_host_uuid,
+        payload_hash=payload_hash).filter(
+        models.Notification.generated_time >= timeutils.normalize_time(
+            generated_since))
+
+    return context.session.query(query.exists()).scalar()
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def notifications_claim(context, owner, lease_expires_at,
+                        new_generated_before, limit):
+    # The notifications in error and the new ones which weren't processed in
+    # time, which aren't claimed by another engine or whose lease expired,
+    # and the running ones whose lease expired, as the engine recovering
+    # them stopped.
+    now = timeutils.utcnow()
+    claimable = sa.or_(
+        sa.and_(
+            sa.or_(
+                models.Notification.status == 'error',
+                sa.and_(
+                    models.Notification.status == 'new',
+                    models.Notification.generated_time <
+                    timeutils.normalize_time(new_generated_before))),
+            sa.or_(
+                models.Notification.owner.is_(None),
+                models.Notification.lease_expires_at < now)),
+        sa.and_(
+            models.Notification.status == 'running',
+            models.Notification.lease_expires_at < now))
+    order_by = (models.Notification.created_at.desc(),
+                models.Notification.id.desc())
+
+    ids = [row.id for row in model_query(
+        context, models.Notification, (models.Notification.id,)).filter(
+        claimable).order_by(*order_by).limit(limit)]
+    if not ids:
+        return []
+
+    # NOTE: The claimable condition is checked again by the UPDATE
+    # statement, so a notification selected concurrently by several engines
+    # is only claimed by one of them.
+    model_query(context, models.Notification).filter(
+        models.Notification.id.in_(ids)).filter(claimable).update(
+        {'owner': owner,
+         'lease_expires_at': timeutils.normalize_time(lease_expires_at),
+         'updated_at': models.Notification.updated_at},
+        synchronize_session=False)
+
+    return model_query(context, models.Notification).filter(
+        models.Notification.id.in_(ids)).filter_by(owner=owner).order_by(
+        *order_by).all()
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def notifications_renew_leases(context, owner, lease_expires_at):
+    return model_query(context, models.Notification).filter_by(
+        owner=owner).filter(
+        models.Notification.status.in_(ACTIVE_NOTIFICATION_STATUSES)).update(
+        {'lease_expires_at': timeutils.normalize_time(lease_expires_at),
+         'updated_at': models.Notification.updated_at},
+        synchronize_session=False)
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def notifications_release(context, owner):
+    # The running notifications are kept until they are recovered.
+    return model_query(context, models.Notification).filter_by(
+        owner=owner).filter(
+        models.Notification.status != 'running').update(
+        {'owner': None,
+         'lease_expires_at': None,
+         'updated_at': models.Notification.updated_at},
+        synchronize_session=False)
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def notifications_expire(context, generated_before):
+    generated_before = timeutils.normalize_time(generated_before)
+    expired = sa.and_(
+        models.Notification.status.in_(ACTIVE_NOTIFICATION_STATUSES),
+        models.Notification.generated_time < generated_before)
+
+    # Only the columns needed to maintain the counters of the segments are
+    # read, and the rows are locked until they are updated.
+    rows = model_query(
+        context, models.Notification,
+        (models.Notification.id, models.Notification.notification_uuid,
+         models.Notification.failover_segment_uuid)).filter(
+        expired).with_for_update().all()
+    if not rows:
+        return []
+
+    model_query(context, models.Notification).filter(
+        models.Notification.id.in_([row.id for row in rows])).filter(
+        expired).update({'status': 'failed'}, synchronize_session=False)
+
+    active_notifications = collections.Counter(
+        row.failover_segment_uuid for row in rows)
+    for failover_segment_uuid, count in active_notifications.items():
+        _update_active_notifications(context, failover_segment_uuid, -count)
+
+    return [row.notification_uuid for row in rows]
+
+
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.writer
 def notification_create(context, values):
     notification = models.Notification()
     notification.update(values)
 
-    notification.save(session=context.session)
+    try:
+        notification.save(session=context.session)
+    except db_exc.DBDuplicateEntry as e:
+        if 'dedup_key' not in e.columns:
+            raise
+        raise exception.DuplicateNotification(type=values.get('type'))
+
+    if notification.status in ACTIVE_NOTIFICATION_STATUSES:
+        _update_active_notifications(
+            context, notification.failover_segment_uuid, 1)
 
     return _notification_get_by_uuid(context, notification.notification_uuid)
 
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.writer
-def notification_update(context, notification_uuid, values):
-    notification = _notification_get_by_uuid(context, notification_uuid)
+def notification_create_many(context, values_list):
+    # Every notification is inserted in its own savepoint of the transaction
+    # so that a duplicate only rejects itself and not the whole batch.
+    notifications = []
+    for values in values_list:
+        notification = models.Notification()
+        notification.update(values)
+        try:
+            with context.session.begin_nested():
+                context.session.add(notification)
+        except db_exc.DBDuplicateEntry as e:
+            if 'dedup_key' not in e.columns:
+                raise
+            LOG.info("Notification %(notification_uuid)s of host "
+                     "%(host)s is a duplicate and isn't created.",
+                     {'notification_uuid': values.get('notification_uuid'),
+                      'host': values.get('source_host_uuid')})
+            continue
+        notifications.append(notification)
 
-    notification.update(values)
+    active_notifications = collections.Counter(
+        notification.failover_segment_uuid for notification in notifications
+        if notification.status in ACTIVE_NOTIFICATION_STATUSES)
+    for failover_segment_uuid, count in active_notifications.items():
+        _update_active_notifications(context, failover_segment_uuid, count)
 
-    notification.save(session=context.session)
+    return notifications
 
-    return _notification_get_by_uuid(context, notification.notification_uuid)
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def notification_update(context, notification_uuid, values,
+                        expected_status=None, fencing_token=None):
+    conditions = None
+    status = values.get('status')
+    if expected_status is not None:
+        conditions = {'status': expected_status}
+        was_active = expected_status in ACTIVE_NOTIFICATION_STATUSES
+    elif status is not None:
+        # The previous status is needed to maintain the active
+        # notifications counter of the segment.
+        previous_status = model_query(
+            context, models.Notification,
+            (models.Notification.status,)).filter_by(
+            notification_uuid=notification_uuid).with_for_update().scalar()
+        if previous_status is None:
+            raise exception.NotificationNotFound(id=notification_uuid)
+        was_active = previous_status in ACTIVE_NOTIFICATION_STATUSES
+
+    if values.get('lease_expires_at'):
+        values = dict(values, lease_expires_at=timeutils.normalize_time(
+            values['lease_expires_at']))
+    values, criteria = _fencing_criteria(models.Notification, values,
+                                         fencing_token)
+    notification = _update_returning(context, models.Notification, values,
+                                     conditions=conditions,
+                                     criteria=criteria,
+                                     notification_uuid=notification_uuid)
+    if notification is None:
+        if expected_status is None and fencing_token is None:
+            raise exception.NotificationNotFound(id=notification_uuid)
+        current = _notification_get_by_uuid(context, notification_uuid)
+        _check_fencing_token('Notification', notification_uuid, current,
+                             fencing_token)
+        raise exception.UnexpectedNotificationStatus(
+            uuid=notification_uuid, expected=expected_status,
+            actual=current.status)
+
+    if status is not None:
+        _update_active_notifications(
+            context, notification.failover_segment_uuid,
+            int(status in ACTIVE_NOTIFICATION_STATUSES) - int(was_active))
+
+    return notification
 
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.writer
 def notification_delete(context, notification_uuid):
+    notification = _notification_get_by_uuid(context, notification_uuid)
 
     count = model_query(context, models.Notification
                         ).filter_by(notification_uuid=notification_uuid
@@ -619,6 +924,10 @@ def notification_delete(context, notification_uuid):
     if count == 0:
         raise exception.NotificationNotFound(id=notification_uuid)
 
+    if notification.status in ACTIVE_NOTIFICATION_STATUSES:
+        _update_active_notifications(
+            context, notification.failover_segment_uuid, -1)
+
     model_query(context, models.VMove).filter_by(
         notification_uuid=notification_uuid).soft_delete(
         synchronize_session=False)
@@ -707,13 +1016,58 @@ def vmove_create(context, values):
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @context_manager.writer
-def vmove_update(context, uuid, values):
-    vm_move = _vmove_get_by_uuid(context, uuid)
-    vm_move.update(values)
+def vmove_create_many(context, values_list):
+    if not values_list:
+        return []
 
-    vm_move.save(session=context.session)
+    # Insert all the vm moves with a single multi-row INSERT statement and
+    # read them back with a single SELECT within the same transaction.
+    context.session.execute(
+        sa.insert(models.VMove).values(
+            [dict(values) for values in values_list]))
 
-    return _vmove_get_by_uuid(context, vm_move.uuid)
+    uuids = [values['uuid'] for values in values_list]
+    vm_moves = model_query(context, models.VMove).filter(
+        models.VMove.uuid.in_(uuids)).all()
+
+    vm_moves_by_uuid = {vm_move.uuid: vm_move for vm_move in vm_moves}
+    return [vm_moves_by_uuid[uuid] for uuid in uuids]
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.writer
+def vmove_update(context, uuid, values, expected_status=None,
+                 fencing_token=None):
+    conditions = None
+    if expected_status is not None:
+        conditions = {'status': expected_status}
+
+    values, criteria = _fencing_criteria(models.VMove, values, fencing_token)
+    if fencing_token is not None:
+        # NOTE: The engine taking the recovery of a notification over records
+        # its fencing token on the notification first, the vm moves of the
+        # notification are fenced by it too.
+        criteria += (~sa.exists().where(
+            models.Notification.notification_uuid ==
+            models.VMove.notification_uuid,
+            models.Notification.deleted == 0,
+            models.Notification.fencing_token > fencing_token),)
+    vm_move = _update_returning(context, models.VMove, values,
+                                conditions=conditions, criteria=criteria,
+                                uuid=uuid)
+    if vm_move is None:
+        current = _vmove_get_by_uuid(context, uuid)
+        _check_fencing_token('VM move', uuid, current, fencing_token)
+        notification = model_query(context, models.Notification).filter_by(
+            notification_uuid=current.notification_uuid).first()
+        if notification is not None:
+            _check_fencing_token('notification',
+                                 current.notification_uuid, notification,
+                                 fencing_token)
+        raise exception.UnexpectedVMoveStatus(
+            uuid=uuid, expected=expected_status, actual=current.status)
+
+    return vm_move
 
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
@@ -727,6 +1081,70 @@ def vmove_delete(context, vmove_uuid):
         raise exception.VMoveNotFound(id=vmove_uuid)
 
 
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@context_manager.reader
+def recovery_workflow_details_get_by_notification_uuid(context,
+                                                       notification_uuid):
+    return _recovery_workflow_details_get_by_notification_uuid(
+        context, notification_uuid)
+
+
+def _recovery_workflow_details_get_by_notification_uuid(context,
+                                                        notification_uuid):
+    query = model_query(context, models.RecoveryWorkflowDetails
+                        ).filter_by(notification_uuid=notification_uuid)
+
+    result = query.first()
+    if not result:
+        raise exception.RecoveryWorkflowDetailsNotFound(id=notification_uuid)
+
+    return result
+
+
+# NOTE: The engine and the API may race to create the row of a notification,
+# the loser of the race updates the row created by the winner on retry.
+@oslo_db_api.wrap_db_retry(
+    max_retries=5, retry_on_deadlock=True,
+    exception_checker=lambda exc: isinstance(exc, db_exc.DBDuplicateEntry))
+@context_manager.writer
+def recovery_workflow_details_update(context, notification_uuid, values):
+    try:
+        details = _recovery_workflow_details_get_by_notification_uuid(
+            context, notification_uuid)
+    except exception.RecoveryWorkflowDetailsNotFound:
+        details = models.RecoveryWorkflowDetails(
+            notification_uuid=notification_uuid)
+    else:
+        if details.finished:
+            # The details of a finished notification are immutable.
+            return details
+
+    details.update(values)
+    details.save(session=context.session)
+
+    return details
+
+
+# NOTE: The first fencing token of a lock is issued by inserting its row,
+# the loser of a race to insert it increments the row of the winner on retry.
+@oslo_db_api.wrap_db_retry(
+    max_retries=5, retry_on_deadlock=True,
+    exception_checker=lambda exc: isinstance(exc, db_exc.DBDuplicateEntry))
+@context_manager.writer
+def fencing_token_issue(context, name):
+    count = model_query(context, models.FencingToken).filter_by(
+        name=name).update({'token': models.FencingToken.token + 1},
+                          synchronize_session=False)
+    if not count:
+        fencing_token = models.FencingToken(name=name, token=1)
+        fencing_token.save(session=context.session)
+        return fencing_token.token
+
+    return model_query(context, models.FencingToken,
+                       (models.FencingToken.token,)).filter_by(
+        name=name).scalar()
+
+
 class DeleteFromSelect(sa_sql.expression.UpdateBase):
     inherit_cache = False
 
@@ -0,0 +1,58 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add segment active notifications
+
+Revision ID: 135c0af01e37
+Revises: b3d5f7a9c1e4
+Create Date: 2026-10-17 17:05:41.328145
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '135c0af01e37'
+down_revision = 'b3d5f7a9c1e4'
+branch_labels = None
+depends_on = None
+
+# NOTE: Must stay in sync with
+# masakari.db.sqlalchemy.api.ACTIVE_NOTIFICATION_STATUSES.
+ACTIVE_NOTIFICATION_STATUSES = ('new', 'running', 'error')
+
+
+def upgrade() -> None:
+    op.add_column(
+        'failover_segments',
+        sa.Column('active_notifications', sa.Integer(), nullable=False,
+                  server_default='0'))
+
+    segments = sa.table(
+        'failover_segments',
+        sa.column('uuid', sa.String(36)),
+        sa.column('active_notifications', sa.Integer))
+    notifications = sa.table(
+        'notifications',
+        sa.column('id', sa.Integer),
+        sa.column('failover_segment_uuid', sa.String(36)),
+        sa.column('status', sa.String(255)),
+        sa.column('deleted', sa.Integer))
+
+    active_notifications = (
+        sa.select(sa.func.count(notifications.c.id))
+        .where(notifications.c.failover_segment_uuid == segments.c.uuid)
+        .where(notifications.c.deleted == 0)
+        .where(notifications.c.status.in_(ACTIVE_NOTIFICATION_STATUSES))
+        .scalar_subquery())
+    op.get_bind().execute(
+        segments.update().values(active_notifications=active_notifications))
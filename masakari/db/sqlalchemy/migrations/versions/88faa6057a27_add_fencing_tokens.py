@@ -0,0 +1,56 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add fencing tokens
+
+Revision ID: 88faa6057a27
+Revises: 8b3c2c88fb9a
+Create Date: 2026-10-17 19:04:51.227634
+"""
+
+from alembic import op
+from oslo_db.sqlalchemy import types as oslo_db_types
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '88faa6057a27'
+down_revision = '8b3c2c88fb9a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'fencing_tokens',
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column(
+            'deleted',
+            oslo_db_types.SoftDeleteInteger(),
+            nullable=True,
+        ),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('token', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'name', 'deleted',
+            name='uniq_fencing_token0name0deleted',
+        ),
+    )
+    op.add_column(
+        'notifications',
+        sa.Column('fencing_token', sa.BigInteger(), nullable=True))
+    op.add_column(
+        'vmoves',
+        sa.Column('fencing_token', sa.BigInteger(), nullable=True))
@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add notification lease
+
+Revision ID: 8b3c2c88fb9a
+Revises: 135c0af01e37
+Create Date: 2026-10-17 18:12:27.540931
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8b3c2c88fb9a'
+down_revision = '135c0af01e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'notifications',
+        sa.Column('owner', sa.String(length=255), nullable=True))
+    op.add_column(
+        'notifications',
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'notifications_owner_idx',
+        'notifications',
+        ['owner'],
+        unique=False,
+    )
@@ -0,0 +1,37 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add notification deduplication key
+
+Revision ID: a9c3e5f7b1d2
+Revises: f4b2d8e6a1c9
+Create Date: 2026-10-17 15:02:41.273518
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a9c3e5f7b1d2'
+down_revision = 'f4b2d8e6a1c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The existing notifications are left without a key, NULL values never
+    # conflict with each other.
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(
+            sa.Column('dedup_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint(
+            'uniq_notifications0dedup_key0deleted', ['dedup_key', 'deleted'])
@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add notification idempotency key
+
+Revision ID: b3d5f7a9c1e4
+Revises: a9c3e5f7b1d2
+Create Date: 2026-10-17 15:48:12.904716
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b3d5f7a9c1e4'
+down_revision = 'a9c3e5f7b1d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'notifications',
+        sa.Column('idempotency_key', sa.String(length=255), nullable=True))
+    op.create_index(
+        'notifications_idempotency_key_idx',
+        'notifications',
+        ['idempotency_key'],
+        unique=False,
+    )
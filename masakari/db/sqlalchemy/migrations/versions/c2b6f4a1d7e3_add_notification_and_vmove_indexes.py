@@ -0,0 +1,50 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add indexes on notifications and vmoves hot query columns
+
+Revision ID: c2b6f4a1d7e3
+Revises: 13adff5efb9a
+Create Date: 2026-10-17 09:12:31.482113
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c2b6f4a1d7e3'
+down_revision = '13adff5efb9a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Used by the periodic tasks looking for new, running and error
+    # notifications, optionally older than a given generated_time.
+    op.create_index(
+        'notifications_status_generated_time_idx',
+        'notifications',
+        ['status', 'generated_time'],
+        unique=False,
+    )
+    # Used by the duplicate notification detection.
+    op.create_index(
+        'notifications_host_type_generated_time_idx',
+        'notifications',
+        ['source_host_uuid', 'type', 'generated_time'],
+        unique=False,
+    )
+    op.create_index(
+        'vmoves_notification_uuid_status_idx',
+        'vmoves',
+        ['notification_uuid', 'status'],
+        unique=False,
+    )
@@ -0,0 +1,56 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add recovery workflow details table
+
+Revision ID: e7a1c9d3b5f2
+Revises: c2b6f4a1d7e3
+Create Date: 2026-10-17 11:02:47.913254
+"""
+
+from alembic import op
+from oslo_db.sqlalchemy import types as oslo_db_types
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'e7a1c9d3b5f2'
+down_revision = 'c2b6f4a1d7e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recovery_workflow_details',
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column(
+            'deleted',
+            oslo_db_types.SoftDeleteInteger(),
+            nullable=True,
+        ),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('notification_uuid', sa.String(length=36), nullable=False),
+        sa.Column(
+            'details',
+            sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'),
+            nullable=True,
+        ),
+        sa.Column('finished', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'notification_uuid',
+            name='uniq_recovery_workflow_details0notification_uuid',
+        ),
+    )
@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add notification payload hash
+
+Revision ID: f4b2d8e6a1c9
+Revises: e7a1c9d3b5f2
+Create Date: 2026-10-17 14:26:05.618392
+"""
+
+import hashlib
+
+from alembic import op
+from oslo_serialization import jsonutils
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f4b2d8e6a1c9'
+down_revision = 'e7a1c9d3b5f2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _payload_hash(payload):
+    # NOTE: Must stay in sync with
+    # masakari.objects.notification.payload_hash().
+    canonical = jsonutils.dumps(
+        (jsonutils.loads(payload) if payload else None) or {},
+        sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def upgrade() -> None:
+    op.add_column(
+        'notifications',
+        sa.Column('payload_hash', sa.String(length=64), nullable=True))
+
+    notifications = sa.table(
+        'notifications',
+        sa.column('id', sa.Integer),
+        sa.column('payload', sa.Text),
+        sa.column('payload_hash', sa.String(64)))
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(notifications.c.id, notifications.c.payload)
+            .where(notifications.c.id > last_id)
+            .order_by(notifications.c.id)
+            .limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        # A single statement updates the rows of a batch.
+        connection.execute(
+            notifications.update()
+            .where(notifications.c.id.in_([row.id for row in rows]))
+            .values(payload_hash=sa.case(
+                {row.id: _payload_hash(row.payload) for row in rows},
+                value=notifications.c.id)))
+        last_id = rows[-1].id
+
+    # Used by the duplicate notification detection, which doesn't need the
+    # index on the host, type and generated time alone anymore.
+    op.create_index(
+        'notifications_duplicate_idx',
+        'notifications',
+        ['source_host_uuid', 'type', 'payload_hash', 'generated_time'],
+        unique=False,
+    )
+    op.drop_index(
+        'notifications_host_type_generated_time_idx',
+        table_name='notifications',
+    )
@@ -15,8 +15,9 @@
 
 from oslo_db.sqlalchemy import models
 from oslo_utils import timeutils
-from sqlalchemy import (Column, DateTime, Index, Integer, Enum, String,
-                        schema)
+from sqlalchemy import (BigInteger, Column, DateTime, Index, Integer, Enum,
+                        String, schema)
+from sqlalchemy.dialects import mysql
 from sqlalchemy import orm
 from sqlalchemy import ForeignKey, Boolean, Text
 
@@ -91,6 +92,10 @@ class FailoverSegment(BASE, MasakariAPIBase, models.SoftDeleteMixin):
     recovery_method = Column(Enum('auto', 'reserved_host', 'auto_priority',
                                   'rh_priority',
                                   name='recovery_methods'), nullable=False)
+    # Number of the notifications of the segment which are new, running or
+    # in error, maintained along with the status of the notifications.
+    active_notifications = Column(Integer, nullable=False, default=0,
+                                  server_default='0')
 
 
 class Host(BASE, MasakariAPIBase, models.SoftDeleteMixin):
@@ -129,6 +134,14 @@ class Notification(BASE, MasakariAPIBase, models.SoftDeleteMixin):
     __table_args__ = (
         schema.UniqueConstraint('notification_uuid',
                                 name='uniq_notification0uuid'),
+        schema.UniqueConstraint('dedup_key', 'deleted',
+                                name='uniq_notifications0dedup_key0deleted'),
+        Index('notifications_status_generated_time_idx',
+              'status', 'generated_time'),
+        Index('notifications_duplicate_idx',
+              'source_host_uuid', 'type', 'payload_hash', 'generated_time'),
+        Index('notifications_idempotency_key_idx', 'idempotency_key'),
+        Index('notifications_owner_idx', 'owner'),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -136,12 +149,23 @@ class Notification(BASE, MasakariAPIBase, models.SoftDeleteMixin):
     generated_time = Column(DateTime, nullable=False)
     type = Column(String(36), nullable=False)
     payload = Column(Text)
+    payload_hash = Column(String(64), nullable=True)
+    dedup_key = Column(String(64), nullable=True)
+    idempotency_key = Column(String(255), nullable=True)
+    idempotency_fingerprint = Column(String(64), nullable=True)
     status = Column(Enum('new', 'running', 'error', 'failed',
                          'ignored', 'finished', name='notification_status'),
                     nullable=False)
     source_host_uuid = Column(String(36), nullable=False)
     failover_segment_uuid = Column(String(36), nullable=False)
     message = Column(Text)
+    # The engine which claimed the notification to recover it, until the
+    # lease expires.
+    owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # The fencing token of the recovery lock of the source host held by the
+    # engine which last updated the notification.
+    fencing_token = Column(BigInteger, nullable=True)
 
 
 class VMove(BASE, MasakariAPIBase, models.SoftDeleteMixin):
@@ -150,6 +174,8 @@ class VMove(BASE, MasakariAPIBase, models.SoftDeleteMixin):
     __table_args__ = (
         schema.UniqueConstraint('uuid',
                                 name='uniq_vmove0uuid'),
+        Index('vmoves_notification_uuid_status_idx',
+              'notification_uuid', 'status'),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -164,3 +190,32 @@ class VMove(BASE, MasakariAPIBase, models.SoftDeleteMixin):
     type = Column(String(36), nullable=True)
     status = Column(String(255), nullable=True)
     message = Column(Text)
+    fencing_token = Column(BigInteger, nullable=True)
+
+
+class RecoveryWorkflowDetails(BASE, MasakariAPIBase, models.SoftDeleteMixin):
+    """Represents the cached recovery workflow details of a notification."""
+    __tablename__ = 'recovery_workflow_details'
+    __table_args__ = (
+        schema.UniqueConstraint('notification_uuid',
+                                name='uniq_recovery_workflow_details0'
+                                     'notification_uuid'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    notification_uuid = Column(String(36), nullable=False)
+    details = Column(Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'))
+    finished = Column(Boolean, default=False, nullable=False)
+
+
+class FencingToken(BASE, MasakariAPIBase, models.SoftDeleteMixin):
+    """Represents the last fencing token issued for a distributed lock."""
+    __tablename__ = 'fencing_tokens'
+    __table_args__ = (
+        schema.UniqueConstraint('name', 'deleted',
+                                name='uniq_fencing_token0name0deleted'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=False)
+    token = Column(BigInteger, nullable=False, default=0)
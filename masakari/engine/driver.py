@@ -37,7 +37,7 @@ LOG = logging.getLogger(__name__)
 class NotificationDriver(object, metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def execute_host_failure(self, context, host_name, recovery_method,
-                             notification_uuid, **kwargs):
+                             notification_uuid, fencing_token=None, **kwargs):
         pass
 
     @abc.abstractmethod
@@ -60,6 +60,10 @@ class NotificationDriver(object, metaclass=abc.ABCMeta):
     def upgrade_backend(self, backend):
         pass
 
+    def reset(self):
+        """Hook called on SIGHUP to drop any state cached by the driver."""
+        pass
+
 
 def load_masakari_driver(masakari_driver=None):
     """Load a masakari driver module.
@@ -12,24 +12,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import contextlib
 import os
+import threading
 
 from oslo_log import log as logging
 from oslo_utils import timeutils
+import sqlalchemy as sa
 from stevedore import named
 # For more information please visit: https://wiki.openstack.org/wiki/TaskFlow
 import taskflow.engines
+from taskflow.engines.action_engine import compiler
 from taskflow import exceptions
 from taskflow import formatters
 from taskflow.listeners import base
 from taskflow.listeners import logging as logging_listener
 from taskflow.persistence import backends
 from taskflow.persistence import models
+from taskflow import states
 from taskflow import task
 
 import masakari.conf
 from masakari import exception
+from masakari import objects
 
 CONF = masakari.conf.CONF
 PERSISTENCE_BACKEND = CONF.taskflow.connection
@@ -54,6 +60,10 @@ class MasakariTask(task.Task):
         self.context = context
         self.novaclient = novaclient
         self.progress = []
+        self._unsaved_progress = 0
+        self._unsaved_progress_since = None
+        self._progress_offset = None
+        self._last_progress = 0.0
 
     def update_details(self, progress_data, progress=0.0):
         progress_details = {
@@ -62,10 +72,51 @@ class MasakariTask(task.Task):
             'message': progress_data
         }
 
+        if not self._unsaved_progress:
+            self._unsaved_progress_since = timeutils.utcnow()
         self.progress.append(progress_details)
-        self._notifier.notify('update_progress', {'progress': progress,
-                                                  "progress_details":
-                                                      self.progress})
+        self._unsaved_progress += 1
+        self._last_progress = progress
+        if self._progress_flush_due():
+            self.flush_progress()
+
+    def _progress_flush_due(self):
+        if self._unsaved_progress >= CONF.taskflow.progress_batch_size:
+            return True
+        interval = CONF.taskflow.progress_flush_interval
+        return bool(interval) and timeutils.is_older_than(
+            self._unsaved_progress_since, interval)
+
+    def flush_progress(self, complete=False):
+        """Persist the progress messages buffered by update_details.
+
+        Only the messages added since the last flush are sent, along with
+        the offset of the first one in the progress history of the task.
+        Taskflow stores the progress sent last as a whole, so the complete
+        history is sent once more when the task ends.
+        """
+        if complete:
+            if not self.progress or (not self._unsaved_progress and
+                                     self._progress_offset == 0):
+                return
+            offset = 0
+        else:
+            if not self._unsaved_progress:
+                return
+            offset = len(self.progress) - self._unsaved_progress
+
+        self._unsaved_progress = 0
+        self._progress_offset = offset
+        self._notifier.notify('update_progress',
+                              {'progress': self._last_progress,
+                               'progress_details': self.progress[offset:],
+                               'progress_offset': offset})
+
+    def post_execute(self):
+        self.flush_progress(complete=True)
+
+    def post_revert(self):
+        self.flush_progress(complete=True)
 
 
 class SpecialFormatter(formatters.FailureFormatter):
@@ -108,17 +159,258 @@ class DynamicLogListener(logging_listener.DynamicLoggingListener):
             log=logger, fail_formatter=SpecialFormatter(engine))
 
 
+class RecoveryWorkflowDetailsListener(base.Listener):
+    """Caches the recovery workflow details of a notification.
+
+    The progress and state of the tasks run by the engine are saved, after
+    the details of the flows previously run for the same notification, when
+    a task changes state or persists its progress. The tasks only persist
+    their progress in batches, see ``[taskflow]/progress_batch_size``, so
+    the details aren't saved for every progress message. The API reads the
+    details back instead of asking the engine to load all the flows and
+    atoms of the notification from the taskflow database.
+    """
+
+    def __init__(self, engine, context, notification_uuid):
+        super(RecoveryWorkflowDetailsListener, self).__init__(
+            engine, task_listen_for=base.DEFAULT_LISTEN_FOR,
+            flow_listen_for=[], retry_listen_for=[])
+        self._context = context
+        self._notification_uuid = notification_uuid
+        self._previous_details = None
+        self._details = collections.OrderedDict()
+        self._saved_details = []
+        self._tasks = {}
+
+    def register(self):
+        super(RecoveryWorkflowDetailsListener, self).register()
+        try:
+            workflow_details = (
+                objects.RecoveryWorkflowDetails.get_by_notification_uuid(
+                    self._context, self._notification_uuid))
+        except exception.RecoveryWorkflowDetailsNotFound:
+            self._previous_details = []
+        except Exception:
+            LOG.warning("Failed to load the cached recovery workflow "
+                        "details of notification %s, they won't be "
+                        "updated.", self._notification_uuid, exc_info=True)
+        else:
+            if not workflow_details.finished:
+                self._previous_details = workflow_details.details
+
+    def deregister(self):
+        for atom, callback in self._tasks.values():
+            atom.notifier.deregister(task.EVENT_UPDATE_PROGRESS, callback)
+        self._tasks.clear()
+        super(RecoveryWorkflowDetailsListener, self).deregister()
+
+    def _find_task(self, task_name):
+        graph = self._engine.compilation.execution_graph
+        for atom, node_data in graph.nodes(data=True):
+            if (node_data.get('kind') == compiler.TASK and
+                    atom.name == task_name):
+                return atom
+
+    def _watch_progress(self, task_name):
+        if task_name in self._tasks:
+            return
+        atom = self._find_task(task_name)
+        if atom is None:
+            return
+
+        def on_progress(event_type, details):
+            self._update(task_name,
+                         progress=details.get('progress'),
+                         progress_details=details.get('progress_details'),
+                         progress_offset=details.get('progress_offset', 0))
+            self._save()
+
+        atom.notifier.register(task.EVENT_UPDATE_PROGRESS, on_progress)
+        self._tasks[task_name] = (atom, on_progress)
+
+    def _task_receiver(self, state, details):
+        task_name = details['task_name']
+        if state == states.RUNNING:
+            self._watch_progress(task_name)
+        # Same as taskflow, the progress is complete once the task succeeded
+        # or reverted.
+        progress = (1.0 if state in (states.SUCCESS, states.REVERTED)
+                    else None)
+        self._update(task_name, state=state, progress=progress)
+        self._save()
+
+    def _update(self, task_name, state=None, progress=None,
+                progress_details=None, progress_offset=0):
+        entry = self._details.setdefault(
+            task_name, {'name': task_name, 'progress': 0.0,
+                        'progress_details': [], 'state': states.RUNNING})
+        if state is not None:
+            entry['state'] = state
+        if progress is not None:
+            entry['progress'] = progress
+        if progress_details is not None:
+            entry['progress_details'][progress_offset:] = progress_details
+
+    def _save(self):
+        if self._previous_details is None:
+            return
+
+        # Same as the taskflow driver, only the tasks which reported
+        # progress are part of the details.
+        entries = [(entry['name'], entry['progress'], entry['state'],
+                    len(entry['progress_details']))
+                   for entry in self._details.values()
+                   if entry['progress_details']]
+        if entries == self._saved_details:
+            # The details didn't change since they were last saved.
+            return
+
+        details = list(self._previous_details)
+        for entry in self._details.values():
+            if entry['progress_details']:
+                details.append(objects.NotificationProgressDetails.create(
+                    entry['name'], entry['progress'],
+                    entry['progress_details'], entry['state']))
+
+        workflow_details = objects.RecoveryWorkflowDetails(
+            context=self._context,
+            notification_uuid=self._notification_uuid, details=details)
+        try:
+            workflow_details.save()
+        except Exception:
+            LOG.warning("Failed to cache the recovery workflow details of "
+                        "notification %s.", self._notification_uuid,
+                        exc_info=True)
+        else:
+            self._saved_details = entries
+
+
+# Task classes resolved from the 'masakari.task_flow.tasks' entry points,
+# keyed by the tuple of configured task names.
+_TASK_CLASSES = {}
+
+
+def _get_task_classes(task_list):
+    key = tuple(task_list)
+    task_classes = _TASK_CLASSES.get(key)
+    if task_classes is None:
+        extensions = named.NamedExtensionManager(
+            'masakari.task_flow.tasks', names=task_list,
+            name_order=True, invoke_on_load=False)
+        task_classes = [extension.plugin
+                        for extension in extensions.extensions]
+        _TASK_CLASSES[key] = task_classes
+    return task_classes
+
+
+def reset_task_classes_cache():
+    """Forget the task classes resolved by get_recovery_flow.
+
+    The entry points are scanned again on the next flow construction.
+    """
+    _TASK_CLASSES.clear()
+
+
 def get_recovery_flow(task_list, **kwargs):
-    """This is used create extension object from provided task_list.
+    """This is used create task objects from provided task_list.
+
+    The task classes are resolved from the 'masakari.task_flow.tasks' entry
+    points using stevedore once per task list and cached, this method
+    returns a new instance of each task provided in the list.
+    """
+    for task_class in _get_task_classes(task_list):
+        yield task_class(**kwargs)
+
+
+def _mask_connection(connection):
+    try:
+        return sa.engine.url.make_url(connection).render_as_string(
+            hide_password=True)
+    except sa.exc.ArgumentError:
+        return connection
+
 
-    This method returns the extension object of the each task provided
-    in a list using stevedore extension manager.
+class PersistenceBackendPool(object):
+    """Process wide cache of taskflow persistence backends.
+
+    Fetching a taskflow backend creates a new SQLAlchemy engine, and with it
+    a new connection pool. Backends are created once per connection string
+    and shared by all the recovery workflows and progress details requests
+    of the process.
     """
-    extensions = named.NamedExtensionManager(
-        'masakari.task_flow.tasks', names=task_list,
-        name_order=True, invoke_on_load=True, invoke_kwds=kwargs)
-    for extension in extensions.extensions:
-        yield extension.obj
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._stats = {}
+
+    def _backend_conf(self, connection):
+        conf = {'connection': connection}
+        for option, key in (('max_pool_size', 'max_pool_size'),
+                            ('max_overflow', 'max_overflow'),
+                            ('pool_timeout', 'pool_timeout')):
+            value = getattr(CONF.taskflow, option)
+            if value is not None:
+                conf[key] = value
+        if CONF.taskflow.pool_pre_ping:
+            conf['engine_args'] = {'pool_pre_ping': True}
+        return conf
+
+    def _track(self, connection, backend):
+        stats = {'connects': 0, 'checkouts': 0}
+        self._stats[connection] = stats
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            return
+
+        def on_connect(dbapi_connection, connection_record):
+            stats['connects'] += 1
+
+        def on_checkout(dbapi_connection, connection_record,
+                        connection_proxy):
+            stats['checkouts'] += 1
+
+        sa.event.listen(engine, 'connect', on_connect)
+        sa.event.listen(engine, 'checkout', on_checkout)
+
+    def get_backend(self, connection):
+        with self._lock:
+            backend = self._backends.get(connection)
+            if backend is None:
+                LOG.debug("Creating taskflow persistence backend for %s",
+                          _mask_connection(connection))
+                backend = backends.fetch(self._backend_conf(connection))
+                self._track(connection, backend)
+                self._backends[connection] = backend
+            return backend
+
+    def stats(self):
+        """Return the connection statistics of every backend.
+
+        For each backend, keyed by its connection string with the password
+        masked, the number of new database connections opened, the number
+        of connections checked out of the pool and the pool status.
+        """
+        stats = {}
+        with self._lock:
+            for connection, backend in self._backends.items():
+                backend_stats = dict(self._stats[connection])
+                engine = getattr(backend, 'engine', None)
+                if engine is not None:
+                    backend_stats['pool'] = engine.pool.status()
+                stats[_mask_connection(connection)] = backend_stats
+        return stats
+
+    def reset(self):
+        """Close all the backends, new ones are created on next use."""
+        with self._lock:
+            for backend in self._backends.values():
+                backend.close()
+            self._backends.clear()
+            self._stats.clear()
+
+
+PERSISTENCE_BACKENDS = PersistenceBackendPool()
 
 
 def load_taskflow_into_engine(action, nested_flow,
@@ -126,7 +418,7 @@ def load_taskflow_into_engine(action, nested_flow,
     book = None
     backend = None
     if PERSISTENCE_BACKEND:
-        backend = backends.fetch(PERSISTENCE_BACKEND)
+        backend = PERSISTENCE_BACKENDS.get_backend(PERSISTENCE_BACKEND)
         with contextlib.closing(backend.get_connection()) as conn:
             try:
                 book = conn.get_logbook(process_what['notification_uuid'])
@@ -33,6 +33,7 @@ from masakari.engine.drivers.taskflow import base
 from masakari.engine.drivers.taskflow import host_failure
 from masakari.engine.drivers.taskflow import instance_failure
 from masakari.engine.drivers.taskflow import process_failure
+from masakari.engine import evacuation_scheduler
 from masakari import exception
 from masakari.i18n import _
 from masakari import objects
@@ -53,6 +54,11 @@ class TaskFlowDriver(driver.NotificationDriver):
                 "this driver.")
         self._taskflow_conf = CONF.taskflow_driver_recovery_flows
 
+    def reset(self):
+        base.reset_task_classes_cache()
+        base.PERSISTENCE_BACKENDS.reset()
+        evacuation_scheduler.SCHEDULER.reset()
+
     def _execute_auto_workflow(self, context, novaclient, process_what):
         flow_engine = host_failure.get_auto_flow(context, novaclient,
                                                  process_what)
@@ -60,7 +66,9 @@ class TaskFlowDriver(driver.NotificationDriver):
         # Attaching this listener will capture all of the notifications
         # that taskflow sends out and redirect them to a more useful
         # log for masakari's debugging (or error reporting) usage.
-        with base.DynamicLogListener(flow_engine, logger=LOG):
+        with base.DynamicLogListener(flow_engine, logger=LOG), \
+                base.RecoveryWorkflowDetailsListener(
+                    flow_engine, context, process_what['notification_uuid']):
             flow_engine.run()
 
     def _execute_rh_workflow(self, context, novaclient, process_what,
@@ -74,7 +82,9 @@ class TaskFlowDriver(driver.NotificationDriver):
                                                process_what,
                                                **kwargs)
 
-        with base.DynamicLogListener(flow_engine, logger=LOG):
+        with base.DynamicLogListener(flow_engine, logger=LOG), \
+                base.RecoveryWorkflowDetailsListener(
+                    flow_engine, context, process_what['notification_uuid']):
             try:
                 flow_engine.run()
             except exception.LockAlreadyAcquired as ex:
@@ -132,12 +142,13 @@ class TaskFlowDriver(driver.NotificationDriver):
                 self._execute_auto_workflow(context, novaclient, process_what)
 
     def execute_host_failure(self, context, host_name, recovery_method,
-                             notification_uuid, **kwargs):
+                             notification_uuid, fencing_token=None, **kwargs):
         novaclient = nova.API()
         # get flow for host failure
         process_what = {
             'host_name': host_name,
-            'notification_uuid': notification_uuid
+            'notification_uuid': notification_uuid,
+            'fencing_token': fencing_token
         }
 
         try:
@@ -187,7 +198,9 @@ class TaskFlowDriver(driver.NotificationDriver):
         # Attaching this listener will capture all of the notifications that
         # taskflow sends out and redirect them to a more useful log for
         # masakari's debugging (or error reporting) usage.
-        with base.DynamicLogListener(flow_engine, logger=LOG):
+        with base.DynamicLogListener(flow_engine, logger=LOG), \
+                base.RecoveryWorkflowDetailsListener(
+                    flow_engine, context, notification_uuid):
             try:
                 flow_engine.run()
             except Exception as exc:
@@ -233,7 +246,9 @@ class TaskFlowDriver(driver.NotificationDriver):
         # Attaching this listener will capture all of the notifications that
         # taskflow sends out and redirect them to a more useful log for
         # masakari's debugging (or error reporting) usage.
-        with base.DynamicLogListener(flow_engine, logger=LOG):
+        with base.DynamicLogListener(flow_engine, logger=LOG), \
+                base.RecoveryWorkflowDetailsListener(
+                    flow_engine, context, notification_uuid):
             try:
                 flow_engine.run()
             except Exception as exc:
@@ -298,7 +313,8 @@ class TaskFlowDriver(driver.NotificationDriver):
                                                    notification):
         """Retrieve progress details in notification"""
 
-        backend = backends.fetch(self._persistence_backend)
+        backend = base.PERSISTENCE_BACKENDS.get_backend(
+            self._persistence_backend)
         with contextlib.closing(backend.get_connection()) as conn:
             progress_details = []
             flow_details = conn.get_flows_for_book(
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import eventlet
 from eventlet import greenpool
 
@@ -24,9 +26,14 @@ from oslo_utils import strutils
 from oslo_utils import timeutils
 from taskflow.patterns import linear_flow
 from taskflow import retry
+from tooz import coordination as tooz_coordination
 
 import masakari.conf
+from masakari import coordination
 from masakari.engine.drivers.taskflow import base
+from masakari.engine import evacuation_scheduler
+from masakari.engine import nova_events
+from masakari.engine import server_poller as server_poller_mod
 from masakari import exception
 from masakari import objects
 from masakari.objects import fields
@@ -47,16 +54,68 @@ class DisableComputeServiceTask(base.MasakariTask):
         super(DisableComputeServiceTask, self).__init__(context, novaclient,
                                                         **kwargs)
 
+    def _force_down_compute_service(self, host_name):
+        try:
+            self.novaclient.force_down_service(self.context, host_name,
+                                               'nova-compute')
+        except Exception as e:
+            LOG.warning("Failed to force down compute service on host "
+                        "'%(host_name)s', waiting for nova to recognize "
+                        "the node down: %(error)s",
+                        {'host_name': host_name, 'error': e})
+            return
+        msg = "Forced down compute service on host: '%s'" % host_name
+        self.update_details(msg, 0.5)
+
+    def _wait_for_compute_service_down(self, host_name):
+        def _check_compute_service_down():
+            try:
+                if self.novaclient.is_service_down(self.context, host_name,
+                                                   'nova-compute'):
+                    raise loopingcall.LoopingCallDone()
+            except loopingcall.LoopingCallDone:
+                raise
+            except Exception as e:
+                # Checked again on the next interval.
+                LOG.warning("Failed to get the state of compute service on "
+                            "host '%(host_name)s': %(error)s",
+                            {'host_name': host_name, 'error': e})
+
+        LOG.info("Waiting up to %(wait)s sec before starting recovery "
+                 "thread until nova recognizes the node down.",
+                 {'wait': CONF.wait_period_after_service_update})
+        timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
+            _check_compute_service_down)
+        try:
+            timer.start(interval=CONF.verify_interval,
+                        timeout=CONF.wait_period_after_service_update).wait()
+        except loopingcall.LoopingCallTimeOut:
+            LOG.warning("Nova didn't recognize compute service on host "
+                        "'%(host_name)s' down within %(wait)s sec, starting "
+                        "recovery anyway.",
+                        {'host_name': host_name,
+                         'wait': CONF.wait_period_after_service_update})
+        finally:
+            timer.stop()
+
     def execute(self, host_name):
         msg = "Disabling compute service on host: '%s'" % host_name
         self.update_details(msg)
         self.novaclient.enable_disable_service(self.context, host_name,
             reason=CONF.host_failure.service_disable_reason)
-        # Sleep until nova-compute service is marked as disabled.
-        log_msg = ("Sleeping %(wait)s sec before starting recovery "
-               "thread until nova recognizes the node down.")
-        LOG.info(log_msg, {'wait': CONF.wait_period_after_service_update})
-        eventlet.sleep(CONF.wait_period_after_service_update)
+
+        if CONF.host_failure.force_down_compute_service:
+            self._force_down_compute_service(host_name)
+
+        if (CONF.host_failure.wait_for_compute_service_down or
+                CONF.host_failure.force_down_compute_service):
+            self._wait_for_compute_service_down(host_name)
+        else:
+            # Sleep until nova-compute service is marked as disabled.
+            log_msg = ("Sleeping %(wait)s sec before starting recovery "
+                   "thread until nova recognizes the node down.")
+            LOG.info(log_msg, {'wait': CONF.wait_period_after_service_update})
+            eventlet.sleep(CONF.wait_period_after_service_update)
         msg = "Disabled compute service on host: '%s'" % host_name
         self.update_details(msg, 1.0)
 
@@ -65,12 +124,14 @@ class PrepareHAEnabledInstancesTask(base.MasakariTask):
     """Get all HA_Enabled instances."""
 
     def __init__(self, context, novaclient, **kwargs):
-        kwargs['requires'] = ["host_name", "notification_uuid"]
+        kwargs['requires'] = ["host_name", "notification_uuid",
+                              "fencing_token"]
+        kwargs['provides'] = "evacuation_priorities"
         super(PrepareHAEnabledInstancesTask, self).__init__(context,
                                                             novaclient,
                                                             **kwargs)
 
-    def execute(self, host_name, notification_uuid):
+    def execute(self, host_name, notification_uuid, fencing_token=None):
         def _filter_instances(instance_list):
             ha_enabled_instances = []
             non_ha_enabled_instances = []
@@ -113,6 +174,24 @@ class PrepareHAEnabledInstancesTask(base.MasakariTask):
 
             return ha_enabled_instances
 
+        def _get_evacuation_priorities(instance_list):
+            # HA_Enabled instances come first, then the instances with the
+            # highest priority declared in their metadata.
+            ha_enabled_key = CONF.host_failure.ha_enabled_instance_metadata_key
+            priority_key = CONF.host_failure.evacuation_priority_metadata_key
+
+            priorities = {}
+            for instance in instance_list:
+                is_instance_ha_enabled = strutils.bool_from_string(
+                    instance.metadata.get(ha_enabled_key, False))
+                try:
+                    priority = int(instance.metadata.get(priority_key, 0))
+                except (TypeError, ValueError):
+                    priority = 0
+                priorities[instance.id] = [not is_instance_ha_enabled,
+                                           -priority]
+            return priorities
+
         msg = "Preparing instances for evacuation"
         self.update_details(msg)
 
@@ -132,16 +211,22 @@ class PrepareHAEnabledInstancesTask(base.MasakariTask):
             LOG.info(msg)
             raise exception.SkipHostRecoveryException(message=msg)
 
-        # persist vm moves
+        # persist vm moves, with the fencing token of the recovery lock held
+        # by this engine
+        vmoves = []
         for instance in instance_list:
             vmove = objects.VMove(context=self.context)
+            vmove.fencing_token = fencing_token
             vmove.instance_uuid = instance.id
             vmove.instance_name = instance.name
             vmove.notification_uuid = notification_uuid
             vmove.source_host = host_name
             vmove.status = fields.VMoveStatus.PENDING
             vmove.type = fields.VMoveType.EVACUATION
-            vmove.create()
+            vmoves.append(vmove)
+        objects.VMoveList.create_all(self.context, vmoves)
+
+        priorities = _get_evacuation_priorities(instance_list)
 
         # List of instance UUID
         instance_list = [instance.id for instance in instance_list]
@@ -149,17 +234,22 @@ class PrepareHAEnabledInstancesTask(base.MasakariTask):
         msg = "Instances to be evacuated are: '%s'" % ','.join(instance_list)
         self.update_details(msg, 1.0)
 
+        return priorities
+
 
 class EvacuateInstancesTask(base.MasakariTask):
 
     def __init__(self, context, novaclient, **kwargs):
-        kwargs['requires'] = ["host_name", "notification_uuid"]
+        kwargs['requires'] = ["host_name", "notification_uuid",
+                              "fencing_token"]
         self.update_host_method = kwargs['update_host_method']
         super(EvacuateInstancesTask, self).__init__(context, novaclient,
                                                     **kwargs)
 
-    def _get_state_and_host_of_instance(self, context, instance):
-        new_instance = self.novaclient.get_server(context, instance.id)
+    def _get_state_and_host_of_instance(self, context, instance,
+                                        new_instance=None):
+        if new_instance is None:
+            new_instance = self.novaclient.get_server(context, instance.id)
         instance_host = getattr(new_instance,
                                 "OS-EXT-SRV-ATTR:hypervisor_hostname")
         old_vm_state = getattr(instance, "OS-EXT-STS:vm_state")
@@ -167,35 +257,54 @@ class EvacuateInstancesTask(base.MasakariTask):
 
         return (old_vm_state, new_vm_state, instance_host)
 
-    def _stop_after_evacuation(self, context, instance):
-        def _wait_for_stop_confirmation():
+    def _stop_after_evacuation(self, context, instance, server_poller=None):
+        def _wait_for_stop_confirmation(new_instance=None):
             old_vm_state, new_vm_state, instance_host = (
-                self._get_state_and_host_of_instance(context, instance))
+                self._get_state_and_host_of_instance(context, instance,
+                                                     new_instance))
 
             if new_vm_state == 'stopped':
                 raise loopingcall.LoopingCallDone()
 
+        timer = None
         try:
             # confirm instance is stopped after recovery
             self.novaclient.stop_server(context, instance.id)
-            timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
-                _wait_for_stop_confirmation)
-            timer.start(interval=CONF.verify_interval,
-                        timeout=CONF.wait_period_after_power_off).wait()
+            if nova_events.NOVA_EVENTS.listening:
+                nova_events.NOVA_EVENTS.wait(
+                    instance.id, _wait_for_stop_confirmation,
+                    CONF.wait_period_after_power_off)
+            elif server_poller:
+                server_poller.wait(instance.id, _wait_for_stop_confirmation,
+                                   CONF.wait_period_after_power_off)
+            else:
+                timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
+                    _wait_for_stop_confirmation)
+                timer.start(interval=CONF.verify_interval,
+                            timeout=CONF.wait_period_after_power_off).wait()
         except loopingcall.LoopingCallTimeOut:
             with excutils.save_and_reraise_exception():
                 msg = ("Instance '%(uuid)s' is successfully evacuated but "
                        "timeout to stop.") % {'uuid': instance.id}
                 LOG.warning(msg)
         finally:
-            timer.stop()
+            if timer:
+                timer.stop()
+
+    def _schedule_evacuation(self, context, vmove, priority,
+                             reserved_host=None, server_poller=None):
+        with evacuation_scheduler.SCHEDULER.slot(priority) as slot:
+            self._evacuate_and_confirm(context, vmove, reserved_host,
+                                       server_poller=server_poller,
+                                       slot=slot)
 
     def _evacuate_and_confirm(self, context, vmove,
-                              reserved_host=None):
+                              reserved_host=None, server_poller=None,
+                              slot=None):
 
         def _update_vmove(vmove, status=None, start_time=None,
                           end_time=None, dest_host=None,
-                          message=None):
+                          message=None, save=True, expected_status=None):
             if status:
                 vmove.status = status
             if start_time:
@@ -206,8 +315,14 @@ class EvacuateInstancesTask(base.MasakariTask):
                 vmove.dest_host = dest_host
             if message:
                 vmove.message = message
-            vmove.save()
-
+            if save:
+                vmove.save(expected_status=expected_status)
+
+        # NOTE: The status of the vm move is changed by compare-and-swap,
+        # from pending to ongoing and from there to succeeded or failed, so
+        # that an instance is evacuated once even if its vm move is taken by
+        # someone else meanwhile.
+        saved_status = vmove.status
         instance_uuid = vmove.instance_uuid
         instance = self.novaclient.get_server(context, instance_uuid)
 
@@ -222,9 +337,10 @@ class EvacuateInstancesTask(base.MasakariTask):
             # on the instance.
             self.novaclient.lock_server(context, instance.id)
 
-        def _wait_for_evacuation_confirmation():
+        def _wait_for_evacuation_confirmation(new_instance=None):
             old_vm_state, new_vm_state, instance_host = (
-                self._get_state_and_host_of_instance(context, instance))
+                self._get_state_and_host_of_instance(context, instance,
+                                                     new_instance))
 
             if (new_vm_state == 'error' and
                     new_vm_state != old_vm_state):
@@ -238,12 +354,23 @@ class EvacuateInstancesTask(base.MasakariTask):
                     raise loopingcall.LoopingCallDone()
 
         def _wait_for_evacuation():
+            timer = None
             try:
-                # add a timeout to the periodic call.
-                timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
-                    _wait_for_evacuation_confirmation)
-                timer.start(interval=CONF.verify_interval,
-                            timeout=CONF.wait_period_after_evacuation).wait()
+                if nova_events.NOVA_EVENTS.listening:
+                    nova_events.NOVA_EVENTS.wait(
+                        instance.id, _wait_for_evacuation_confirmation,
+                        CONF.wait_period_after_evacuation)
+                elif server_poller:
+                    server_poller.wait(instance.id,
+                                       _wait_for_evacuation_confirmation,
+                                       CONF.wait_period_after_evacuation)
+                else:
+                    # add a timeout to the periodic call.
+                    timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
+                        _wait_for_evacuation_confirmation)
+                    timer.start(
+                        interval=CONF.verify_interval,
+                        timeout=CONF.wait_period_after_evacuation).wait()
             except loopingcall.LoopingCallTimeOut:
                 with excutils.save_and_reraise_exception():
                     msg = ("Timeout for instance '%(uuid)s' evacuation."
@@ -252,7 +379,8 @@ class EvacuateInstancesTask(base.MasakariTask):
             finally:
                 # stop the periodic call, in case of exceptions or
                 # Timeout.
-                timer.stop()
+                if timer:
+                    timer.stop()
 
         try:
             vm_state = getattr(instance, "OS-EXT-STS:vm_state")
@@ -289,15 +417,21 @@ class EvacuateInstancesTask(base.MasakariTask):
             _update_vmove(
                 vmove,
                 status=fields.VMoveStatus.ONGOING,
-                start_time=timeutils.utcnow())
-            self.novaclient.evacuate_instance(context, instance.id,
-                                              target=reserved_host)
+                start_time=timeutils.utcnow(),
+                expected_status=fields.VMoveStatus.PENDING)
+            saved_status = vmove.status
+            # Let the scheduler adapt the number of concurrent evacuations
+            # to how fast nova-api handles the evacuate requests.
+            with slot.measure() if slot else contextlib.nullcontext():
+                self.novaclient.evacuate_instance(context, instance.id,
+                                                  target=reserved_host)
 
             _wait_for_evacuation()
 
             if vm_state != 'active':
                 if stop_instance:
-                    self._stop_after_evacuation(self.context, instance)
+                    self._stop_after_evacuation(
+                        self.context, instance, server_poller=server_poller)
                     # If the instance was in 'error' state before failure
                     # it should be set to 'error' after recovery.
                     if vm_state == 'error':
@@ -307,17 +441,25 @@ class EvacuateInstancesTask(base.MasakariTask):
             instance = self.novaclient.get_server(context, instance_uuid)
             dest_host = getattr(
                 instance, "OS-EXT-SRV-ATTR:hypervisor_hostname")
+            # NOTE: The result of the evacuation is saved along with its end
+            # time below.
             _update_vmove(
                 vmove,
                 status=fields.VMoveStatus.SUCCEEDED,
-                dest_host=dest_host)
+                dest_host=dest_host, save=False)
+        except exception.UnexpectedVMoveStatus as e:
+            LOG.warning("Evacuation of instance '%(uuid)s' is skipped, its "
+                        "vm move is already %(status)s.",
+                        {'uuid': instance_uuid,
+                         'status': e.kwargs['actual']})
+            saved_status = None
         except loopingcall.LoopingCallTimeOut:
             # Instance is not stop in the expected time_limit.
             msg = "Failed reason: timeout."
             _update_vmove(
                 vmove,
                 status=fields.VMoveStatus.FAILED,
-                message=msg)
+                message=msg, save=False)
         except Exception as e:
             # Exception is raised while resetting instance state or
             # evacuating the instance itself.
@@ -325,16 +467,26 @@ class EvacuateInstancesTask(base.MasakariTask):
             _update_vmove(
                 vmove,
                 status=fields.VMoveStatus.FAILED,
-                message=str(e))
+                message=str(e), save=False)
         finally:
-            _update_vmove(vmove, end_time=timeutils.utcnow())
-            if not instance_already_locked:
-                # Unlock the server after evacuation and confirmation
-                self.novaclient.unlock_server(context, instance.id)
+            try:
+                if not instance_already_locked:
+                    # Unlock the server after evacuation and confirmation
+                    self.novaclient.unlock_server(context, instance.id)
+            finally:
+                if saved_status is not None:
+                    _update_vmove(vmove, end_time=timeutils.utcnow(),
+                                  expected_status=saved_status)
 
-    def execute(self, host_name, notification_uuid, reserved_host=None):
+    def execute(self, host_name, notification_uuid, fencing_token=None,
+                reserved_host=None, evacuation_priorities=None):
         all_vmoves = objects.VMoveList.get_all_vmoves(
             self.context, notification_uuid, status=fields.VMoveStatus.PENDING)
+        # The vm moves may have been created by another engine which
+        # recovered the notification before, they are saved with the
+        # fencing token of the recovery lock held by this engine.
+        for vmove in all_vmoves:
+            vmove.fencing_token = fencing_token
         instance_list = [i.instance_uuid for i in all_vmoves]
         msg = ("Start evacuation of instances from failed host '%(host_name)s'"
                ", instance uuids are: '%(instance_list)s'") % {
@@ -381,17 +533,37 @@ class EvacuateInstancesTask(base.MasakariTask):
                 # Set reserved property of reserved_host to False
                 self.update_host_method(context, reserved_host)
 
+            # The evacuation scheduler shared by all the recoveries of the
+            # engine further bounds the instances evacuated at the same time.
             thread_pool = greenpool.GreenPool(
                 CONF.host_failure_recovery_threads)
 
+            server_poller = None
+            if CONF.host_failure.batch_server_state_polling:
+                # Confirm the state of all evacuated instances with a single
+                # server list request per interval.
+                server_poller = server_poller_mod.ServerStatePoller(
+                    self.context, self.novaclient)
+
             nonlocal all_vmoves
 
-            for vmove in all_vmoves:
+            # The priorities are computed from the server list fetched by
+            # PrepareHAEnabledInstancesTask, they are missing when the task
+            # isn't part of the flow.
+            priorities = evacuation_priorities or {}
+
+            def _priority(vmove):
+                return tuple(priorities.get(
+                    vmove.instance_uuid,
+                    evacuation_scheduler.LOWEST_PRIORITY))
+
+            for vmove in sorted(all_vmoves, key=_priority):
                 msg = ("Evacuation of instance started: '%s'"
                        % vmove.instance_uuid)
                 self.update_details(msg, 0.5)
-                thread_pool.spawn_n(self._evacuate_and_confirm, self.context,
-                                    vmove, reserved_host)
+                thread_pool.spawn_n(self._schedule_evacuation, self.context,
+                                    vmove, _priority(vmove), reserved_host,
+                                    server_poller=server_poller)
             thread_pool.waitall()
 
             all_vmoves = objects.VMoveList.get_all_vmoves(
@@ -424,16 +596,23 @@ class EvacuateInstancesTask(base.MasakariTask):
 
         lock_name = reserved_host if reserved_host else None
 
+        # NOTE: The reserved host is locked by the engines of every node
+        # when the coordination is configured.
         @utils.synchronized(lock_name)
+        @coordination.synchronized('reserved-host-{reserved_host}',
+                                   blocking=False)
         def do_evacuate_with_reserved_host(context, host_name,
                 notification_uuid, reserved_host):
             _do_evacuate(context, host_name,
                          reserved_host=reserved_host)
 
         if lock_name:
-            do_evacuate_with_reserved_host(self.context, host_name,
-                                           notification_uuid,
-                                           reserved_host)
+            try:
+                do_evacuate_with_reserved_host(self.context, host_name,
+                                               notification_uuid,
+                                               reserved_host)
+            except tooz_coordination.LockAcquireFailed:
+                raise exception.LockAlreadyAcquired(resource=reserved_host)
         else:
             # No need to acquire lock on reserved_host when recovery_method is
             # 'auto' as the selection of compute host will be decided by nova.
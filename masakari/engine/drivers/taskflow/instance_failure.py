@@ -21,6 +21,7 @@ from taskflow.patterns import linear_flow
 
 import masakari.conf
 from masakari.engine.drivers.taskflow import base
+from masakari.engine import nova_events
 from masakari import exception
 
 
@@ -91,12 +92,18 @@ class StopInstanceTask(base.MasakariTask):
             if vm_state == 'stopped':
                 raise loopingcall.LoopingCallDone()
 
+        timer = None
         try:
-            # add a timeout to the periodic call.
-            timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
-                _wait_for_power_off)
-            timer.start(interval=CONF.verify_interval,
-                        timeout=CONF.wait_period_after_power_off).wait()
+            if nova_events.NOVA_EVENTS.listening:
+                nova_events.NOVA_EVENTS.wait(
+                    instance_uuid, _wait_for_power_off,
+                    CONF.wait_period_after_power_off)
+            else:
+                # add a timeout to the periodic call.
+                timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
+                    _wait_for_power_off)
+                timer.start(interval=CONF.verify_interval,
+                            timeout=CONF.wait_period_after_power_off).wait()
             msg = "Stopped instance: '%s'" % instance_uuid
             self.update_details(msg, 1.0)
         except loopingcall.LoopingCallTimeOut:
@@ -108,7 +115,8 @@ class StopInstanceTask(base.MasakariTask):
                 message=msg)
         finally:
             # stop the periodic call, in case of exceptions or Timeout.
-            timer.stop()
+            if timer:
+                timer.stop()
 
 
 class StartInstanceTask(base.MasakariTask):
@@ -155,15 +163,21 @@ class ConfirmInstanceActiveTask(base.MasakariTask):
             if vm_state == 'active':
                 raise loopingcall.LoopingCallDone()
 
+        timer = None
         try:
             msg = "Confirming instance '%s' vm_state is ACTIVE" % instance_uuid
             self.update_details(msg)
 
-            # add a timeout to the periodic call.
-            timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
-                _wait_for_active)
-            timer.start(interval=CONF.verify_interval,
-                        timeout=CONF.wait_period_after_power_on).wait()
+            if nova_events.NOVA_EVENTS.listening:
+                nova_events.NOVA_EVENTS.wait(
+                    instance_uuid, _wait_for_active,
+                    CONF.wait_period_after_power_on)
+            else:
+                # add a timeout to the periodic call.
+                timer = loopingcall.FixedIntervalWithTimeoutLoopingCall(
+                    _wait_for_active)
+                timer.start(interval=CONF.verify_interval,
+                            timeout=CONF.wait_period_after_power_on).wait()
             msg = "Confirmed instance '%s' vm_state is ACTIVE" % instance_uuid
             self.update_details(msg, 1.0)
         except loopingcall.LoopingCallTimeOut:
@@ -175,7 +189,8 @@ class ConfirmInstanceActiveTask(base.MasakariTask):
                 message=msg)
         finally:
             # stop the periodic call, in case of exceptions or Timeout.
-            timer.stop()
+            if timer:
+                timer.stop()
 
 
 def get_instance_recovery_flow(context, novaclient, process_what):
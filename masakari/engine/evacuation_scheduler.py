@@ -0,0 +1,175 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Process wide scheduling of instance evacuations.
+
+All the host failure recoveries run by an engine process share a single
+:py:class:`EvacuationScheduler`. It bounds the number of instances that are
+evacuated at the same time and hands the free slots to the most important
+instances first. The bound adapts to how nova-api copes with the load: it
+grows by one after a window of fast and successful evacuate requests and is
+halved when a request fails, is rejected with a conflict or is slower than
+``[host_failure]\\evacuation_latency_threshold``.
+"""
+
+import contextlib
+import heapq
+import itertools
+
+from eventlet import event
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+import masakari.conf
+from masakari import exception
+
+CONF = masakari.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Priority of the instances which don't declare any, they are evacuated
+# after all the others.
+LOWEST_PRIORITY = (True, 0)
+
+
+class _Slot(object):
+    """An evacuation allowed to run by the scheduler."""
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._generation = scheduler._generation
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Report the outcome and latency of the wrapped nova request."""
+        start = timeutils.now()
+        try:
+            yield
+        except exception.Conflict:
+            self._scheduler._decrease(self._generation, 'conflict')
+            raise
+        except Exception:
+            self._scheduler._decrease(self._generation, 'error')
+            raise
+
+        latency = timeutils.now() - start
+        if latency > CONF.host_failure.evacuation_latency_threshold:
+            self._scheduler._decrease(self._generation, 'latency')
+        else:
+            self._scheduler._increase()
+
+
+class EvacuationScheduler(object):
+    """Bounds and orders the evacuations of an engine process.
+
+    The number of concurrent evacuations starts at
+    ``[host_failure]\\initial_concurrent_evacuations`` and is kept between
+    1 and ``[host_failure]\\max_concurrent_evacuations``. Waiting
+    evacuations are started in priority order, lowest value first, and in
+    arrival order for the same priority.
+    """
+
+    def __init__(self):
+        self._limit = None
+        self._in_flight = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._successes = 0
+        # Bumped every time the limit is decreased, the failures of requests
+        # started before only count once.
+        self._generation = 0
+
+    @property
+    def limit(self):
+        if self._limit is None:
+            self._limit = min(CONF.host_failure.initial_concurrent_evacuations,
+                              CONF.host_failure.max_concurrent_evacuations)
+        return self._limit
+
+    @contextlib.contextmanager
+    def slot(self, priority=LOWEST_PRIORITY):
+        """Wait for a free slot and hold it while the evacuation runs.
+
+        :param priority: sort key of the evacuation, lowest first
+        """
+        self._acquire(priority)
+        try:
+            yield _Slot(self)
+        finally:
+            self._release()
+
+    def _acquire(self, priority):
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+
+        waiter = event.Event()
+        entry = (priority, next(self._counter), waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            waiter.wait()
+        except BaseException:
+            if waiter.ready():
+                # The slot was handed over while we were being killed.
+                self._release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._in_flight < self.limit:
+            waiter = heapq.heappop(self._waiters)[2]
+            self._in_flight += 1
+            waiter.send()
+
+    def _increase(self):
+        self._successes += 1
+        if (self._successes >= self.limit and
+                self.limit < CONF.host_failure.max_concurrent_evacuations):
+            self._limit += 1
+            self._successes = 0
+            LOG.debug("Increased the number of concurrent evacuations to "
+                      "%d.", self._limit)
+            self._wake()
+
+    def _decrease(self, generation, reason):
+        if generation != self._generation:
+            return
+        self._generation += 1
+        self._successes = 0
+        limit = max(1, self.limit // 2)
+        if limit != self._limit:
+            self._limit = limit
+            LOG.info("Decreased the number of concurrent evacuations to "
+                     "%(limit)d after a nova-api %(reason)s.",
+                     {'limit': limit, 'reason': reason})
+
+    def stats(self):
+        return {'limit': self.limit, 'in_flight': self._in_flight,
+                'waiting': len(self._waiters)}
+
+    def reset(self):
+        """Start again from the configured number of evacuations.
+
+        The running and waiting evacuations are kept.
+        """
+        self._limit = None
+        self._successes = 0
+        self._generation += 1
+        self._wake()
+
+
+SCHEDULER = EvacuationScheduler()
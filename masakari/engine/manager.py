@@ -21,16 +21,25 @@ notifications. It is responsible for processing notifications and executing
 workflows.
 
 """
+import collections
+import datetime
 import traceback
 
+from eventlet import greenpool
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_service import loopingcall
 from oslo_service import periodic_task
 from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import tooz
 
 import masakari.conf
+from masakari import context as masakari_context
+from masakari import coordination
 from masakari.engine import driver
 from masakari.engine import instance_events as virt_events
+from masakari.engine import nova_events
 from masakari.engine import rpcapi
 from masakari.engine import utils as engine_utils
 from masakari import exception
@@ -44,6 +53,10 @@ CONF = masakari.conf.CONF
 
 LOG = logging.getLogger(__name__)
 
+# Name of the election of the engine running the periodic tasks which scan
+# the notifications.
+PERIODIC_TASKS_ELECTION = 'engine-periodic-tasks'
+
 
 def update_host_method(context, host_name, reserved=False):
     reserved_host = objects.Host.get_by_name(context, host_name)
@@ -63,6 +76,59 @@ class MasakariManager(manager.Manager):
                                              *args, **kwargs)
 
         self.driver = driver.load_masakari_driver(masakari_driver)
+        self._unfinished_notifications_queued = 0
+        # Owner of the notifications claimed by this engine.
+        self._claim_owner = '%s:%s' % (CONF.host,
+                                       uuidutils.generate_uuid())
+        self._lease_renewal = None
+
+    def reset(self):
+        super(MasakariManager, self).reset()
+        self.driver.reset()
+
+    def post_start_hook(self):
+        if CONF.coordination.backend_url:
+            try:
+                coordination.COORDINATOR.start()
+            except tooz.ToozError as error:
+                # NOTE: The engine carries on without coordination, the
+                # notifications of a host are still recovered one at a time
+                # by this engine.
+                LOG.error('Failed to start masakari coordination, the '
+                          'engine runs without it: %s', error)
+        if CONF.nova_notifications_listener:
+            nova_events.NOVA_EVENTS.start()
+        if self._lease_renewal is None:
+            # The leases of the notifications claimed or running on this
+            # engine are renewed as long as it runs.
+            self._lease_renewal = loopingcall.FixedIntervalLoopingCall(
+                self._renew_notification_leases,
+                masakari_context.get_admin_context())
+            renewal_interval = CONF.notification_lease_time / 3.0
+            self._lease_renewal.start(interval=renewal_interval,
+                                      initial_delay=renewal_interval)
+
+    def cleanup_host(self):
+        if self._lease_renewal is not None:
+            self._lease_renewal.stop()
+            self._lease_renewal = None
+        nova_events.NOVA_EVENTS.stop()
+        try:
+            coordination.COORDINATOR.stop()
+        except Exception as error:
+            LOG.warning('Error occurred during masakari coordination was '
+                        'stopped: %s', error)
+
+    @staticmethod
+    def _is_periodic_task_leader(task_name):
+        # NOTE: The periodic tasks scanning the notifications only run on
+        # the engine elected as their leader, the other engines skip them.
+        # Every engine runs them when the coordination isn't configured.
+        if coordination.COORDINATOR.is_leader(PERIODIC_TASKS_ELECTION):
+            return True
+        LOG.debug("Periodic task '%s': skipped, another engine is the "
+                  "leader.", task_name)
+        return False
 
     def _handle_notification_type_process(self, context, notification):
         notification_status = fields.NotificationStatus.FINISHED
@@ -171,7 +237,8 @@ class MasakariManager(manager.Manager):
 
         return notification_status
 
-    def _handle_notification_type_host(self, context, notification):
+    def _handle_notification_type_host(self, context, notification,
+                                       fencing_token=None):
         host_status = notification.payload.get('host_status')
         notification_status = fields.NotificationStatus.FINISHED
         notification_event = notification.payload.get('event')
@@ -234,6 +301,7 @@ class MasakariManager(manager.Manager):
                 self.driver.execute_host_failure(
                     context, host_name, recovery_method,
                     notification.notification_uuid,
+                    fencing_token=fencing_token,
                     update_host_method=update_host_method,
                     reserved_host_list=reserved_host_list)
             except exception.SkipHostRecoveryException:
@@ -271,22 +339,40 @@ class MasakariManager(manager.Manager):
         return notification_status
 
     def _process_notification(self, context, notification):
+        # NOTE: The notifications of a host are recovered one at a time, by
+        # the engines of every node when the coordination is configured.
+        # The fencing token of the lock is recorded on the notification and
+        # its vm moves, so that an engine which lost the lock while still
+        # recovering can't overwrite them anymore.
         @utils.synchronized(notification.source_host_uuid, blocking=True)
-        def do_process_notification(notification):
+        @coordination.synchronized(
+            'host-recovery-{notification.source_host_uuid}', fencing=True)
+        def do_process_notification(notification, fencing_token=None):
             LOG.info('Processing notification %(notification_uuid)s of '
                      'type: %(type)s',
                      {'notification_uuid': notification.notification_uuid,
                       'type': notification.type})
 
-            # Get notification from db
-            notification_db = objects.Notification.get_by_uuid(context,
-                                        notification.notification_uuid)
-
             # NOTE(tpatil): To fix bug 1773132, process notification only
-            # if the notification status is New and the current notification
-            # from DB status is Not New to avoid recovering from failure twice
-            if (notification.status == fields.NotificationStatus.NEW and
-                    notification_db.status != fields.NotificationStatus.NEW):
+            # if its status in db is still the status it was received with,
+            # to avoid recovering from failure twice. The status is checked
+            # and changed to running by a single statement, so that
+            # concurrent requests can't both process the notification.
+            # The engine holds a lease on the running notification, which
+            # is claimed again by the 'process_unfinished_notifications'
+            # periodic task once the lease expired if the engine stops while
+            # recovering it.
+            received_status = notification.status
+            notification.status = fields.NotificationStatus.RUNNING
+            if fencing_token is not None:
+                notification.fencing_token = fencing_token
+            try:
+                notification.save(expected_status=received_status,
+                                  owner=self._claim_owner,
+                                  lease_expires_at=self._lease_expires_at())
+            except exception.UnexpectedNotificationStatus as e:
+                notification.status = received_status
+                notification.obj_reset_changes(['status'])
                 LOG.warning("Processing of notification is skipped to avoid "
                             "recovering from failure twice. "
                             "Notification received is '%(uuid)s' "
@@ -294,15 +380,9 @@ class MasakariManager(manager.Manager):
                             "current status of same notification in db "
                             "is '%(old_status)s'",
                             {"uuid": notification.notification_uuid,
-                            "new_status": notification.status,
-                            "old_status": notification_db.status})
-                return
-
-            update_data = {
-                'status': fields.NotificationStatus.RUNNING,
-            }
-            notification.update(update_data)
-            notification.save()
+                            "new_status": received_status,
+                            "old_status": e.kwargs['actual']})
+                return e.kwargs['actual']
 
             if notification.type == fields.NotificationType.PROCESS:
                 notification_status = self._handle_notification_type_process(
@@ -312,7 +392,7 @@ class MasakariManager(manager.Manager):
                     context, notification)
             elif notification.type == fields.NotificationType.COMPUTE_HOST:
                 notification_status = self._handle_notification_type_host(
-                    context, notification)
+                    context, notification, fencing_token=fencing_token)
 
             LOG.info("Notification %(notification_uuid)s exits with "
                      "status: %(status)s.",
@@ -324,13 +404,14 @@ class MasakariManager(manager.Manager):
             }
             notification.update(update_data)
             notification.save()
+            return notification_status
 
         engine_utils.notify_about_notification_update(context,
             notification,
             action=fields.EventNotificationAction.NOTIFICATION_PROCESS,
             phase=fields.EventNotificationPhase.START)
 
-        do_process_notification(notification)
+        return do_process_notification(notification)
 
     def process_notification(self, context, notification=None):
         """Processes the notification"""
@@ -351,71 +432,168 @@ class MasakariManager(manager.Manager):
 
         self._process_notification(context, notification)
 
+    def process_notifications(self, context, notifications=None):
+        """Processes the notifications received together in a batch"""
+        notifications_by_host = collections.OrderedDict()
+        for notification in notifications or []:
+            notifications_by_host.setdefault(
+                notification.source_host_uuid, []).append(notification)
+
+        # NOTE: Like for the unfinished notifications, the notifications of
+        # the same source host are processed in order and the hosts in
+        # parallel.
+        pool = greenpool.GreenPool(CONF.notification_batch_workers)
+        for host_notifications in notifications_by_host.values():
+            pool.spawn_n(self._process_notifications_of_host, context,
+                         host_notifications)
+        pool.waitall()
+
+    def _process_notifications_of_host(self, context, notifications):
+        for notification in notifications:
+            try:
+                self.process_notification(context, notification)
+            except Exception:
+                LOG.exception("Failed to process notification "
+                              "%(notification_uuid)s of a batch.",
+                              {'notification_uuid':
+                                  notification.notification_uuid})
+
     @periodic_task.periodic_task(
         spacing=CONF.process_unfinished_notifications_interval)
     def _process_unfinished_notifications(self, context):
-        filters = {
-            'status': [fields.NotificationStatus.ERROR,
-                       fields.NotificationStatus.NEW]
-        }
-        notifications_list = objects.NotificationList.get_all(context,
-                                                              filters=filters)
-
+        if not self._is_periodic_task_leader(
+                'process_unfinished_notifications'):
+            return
+
+        # NOTE: The notifications are claimed with a lease so that the
+        # engines running this task at the same time recover disjoint
+        # notifications. The notifications of an engine which stopped are
+        # claimed again once its lease expired.
+        now = timeutils.utcnow()
+        new_generated_before = now - datetime.timedelta(
+            seconds=CONF.retry_notification_new_status_interval)
+        notifications_list = objects.NotificationList.claim(
+            context, self._claim_owner, self._lease_expires_at(now),
+            new_generated_before,
+            CONF.process_unfinished_notifications_batch_size)
+
+        # NOTE: Notifications of the same source host must not be recovered
+        # concurrently, group them per host and let every worker process
+        # the notifications of one host in order. Independent hosts are
+        # recovered in parallel, bounded by the size of the pool.
+        notifications_by_host = collections.OrderedDict()
         for notification in notifications_list:
-            if (notification.status == fields.NotificationStatus.ERROR or
-                    (notification.status == fields.NotificationStatus.NEW and
-                timeutils.is_older_than(
-                    notification.generated_time,
-                    CONF.retry_notification_new_status_interval))):
-                self._process_notification(context, notification)
-
-            # get updated notification from db after workflow execution
-            notification_db = objects.Notification.get_by_uuid(
-                context, notification.notification_uuid)
-
-            if notification_db.status == fields.NotificationStatus.ERROR:
-                # update notification status as failed
-                notification_status = fields.NotificationStatus.FAILED
-                update_data = {
-                    'status': notification_status
-                }
-
-                notification_db.update(update_data)
-                notification_db.save()
-                LOG.error(
+            notifications_by_host.setdefault(
+                notification.source_host_uuid, []).append(notification)
+
+        if not notifications_by_host:
+            return
+
+        self._unfinished_notifications_queued = len(notifications_by_host)
+        LOG.info("Periodic task 'process_unfinished_notifications': "
+                 "processing %(count)d notification(s) of %(hosts)d "
+                 "host(s) with %(workers)d worker(s).",
+                 {'count': len(notifications_list),
+                  'hosts': len(notifications_by_host),
+                  'workers': CONF.process_unfinished_notifications_workers})
+
+        # The notifications waiting for a worker are kept claimed, the
+        # engine renews their lease.
+        try:
+            pool = greenpool.GreenPool(
+                CONF.process_unfinished_notifications_workers)
+            for source_host_uuid, notifications in (
+                    notifications_by_host.items()):
+                pool.spawn_n(self._process_unfinished_notifications_of_host,
+                             context, source_host_uuid, notifications)
+            pool.waitall()
+        finally:
+            objects.NotificationList.release(context, self._claim_owner)
+
+    @staticmethod
+    def _lease_expires_at(now=None):
+        return (now or timeutils.utcnow()) + datetime.timedelta(
+            seconds=CONF.notification_lease_time)
+
+    def _renew_notification_leases(self, context):
+        try:
+            objects.NotificationList.renew_leases(
+                context, self._claim_owner, self._lease_expires_at())
+        except Exception:
+            LOG.exception("Failed to renew the lease of the notifications "
+                          "claimed or running on this engine.")
+
+    def _process_unfinished_notifications_of_host(self, context,
+                                                  source_host_uuid,
+                                                  notifications):
+        self._unfinished_notifications_queued -= 1
+        LOG.debug("Periodic task 'process_unfinished_notifications': "
+                  "processing %(count)d notification(s) of host "
+                  "%(host)s, %(queued)d host(s) still queued.",
+                  {'count': len(notifications), 'host': source_host_uuid,
+                   'queued': self._unfinished_notifications_queued})
+
+        for notification in notifications:
+            try:
+                self._process_unfinished_notification(context, notification)
+            except Exception:
+                LOG.exception("Periodic task "
+                              "'process_unfinished_notifications': failed to "
+                              "process notification %(notification_uuid)s "
+                              "of host %(host)s.",
+                              {'notification_uuid':
+                                  notification.notification_uuid,
+                               'host': source_host_uuid})
+
+    def _process_unfinished_notification(self, context, notification):
+        # NOTE: The notification is up to date with the database once
+        # processed, and the status of the notification in the database is
+        # returned when it was already processed by another request.
+        notification_status = self._process_notification(context,
+                                                         notification)
+
+        if notification_status == fields.NotificationStatus.ERROR:
+            # update notification status as failed
+            notification_status = fields.NotificationStatus.FAILED
+            update_data = {
+                'status': notification_status
+            }
+
+            notification.update(update_data)
+            try:
+                notification.save(
+                    expected_status=fields.NotificationStatus.ERROR)
+            except exception.UnexpectedNotificationStatus as e:
+                LOG.warning(
                     "Periodic task 'process_unfinished_notifications': "
-                    "Notification %(notification_uuid)s exits with "
-                    "status: %(status)s.",
+                    "Notification %(notification_uuid)s isn't marked "
+                    "failed as its status changed to %(status)s.",
                     {'notification_uuid': notification.notification_uuid,
-                     'status': notification_status})
+                     'status': e.kwargs['actual']})
+                return
+            LOG.error(
+                "Periodic task 'process_unfinished_notifications': "
+                "Notification %(notification_uuid)s exits with "
+                "status: %(status)s.",
+                {'notification_uuid': notification.notification_uuid,
+                 'status': notification_status})
 
     @periodic_task.periodic_task(
         spacing=CONF.check_expired_notifications_interval)
     def _check_expired_notifications(self, context):
-        filters = {
-            'status': [fields.NotificationStatus.RUNNING,
-                       fields.NotificationStatus.ERROR,
-                       fields.NotificationStatus.NEW]
-        }
-        notifications_list = objects.NotificationList.get_all(context,
-                                                              filters=filters)
-
-        for notification in notifications_list:
-            if timeutils.is_older_than(
-                    notification.generated_time,
-                    CONF.notifications_expired_interval):
-                # update running expired notification status as failed
-                notification_status = fields.NotificationStatus.FAILED
-                update_data = {
-                    'status': notification_status
-                }
-
-                notification.update(update_data)
-                notification.save()
-                LOG.error(
-                    "Periodic task 'check_expired_notifications': "
-                    "Notification %(notification_uuid)s is expired.",
-                    {'notification_uuid': notification.notification_uuid})
+        if not self._is_periodic_task_leader('check_expired_notifications'):
+            return
+
+        generated_before = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.notifications_expired_interval)
+        # update running expired notification status as failed
+        expired = objects.NotificationList.expire(context, generated_before)
+
+        for notification_uuid in expired:
+            LOG.error(
+                "Periodic task 'check_expired_notifications': "
+                "Notification %(notification_uuid)s is expired.",
+                {'notification_uuid': notification_uuid})
 
     def get_notification_recovery_workflow_details(self, context,
                                                    notification):
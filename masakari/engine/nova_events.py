@@ -0,0 +1,140 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Instance state changes pushed by nova.
+
+When ``nova_notifications_listener`` is enabled, the engine consumes the
+versioned notifications nova sends when an instance is evacuated, powered off
+or powered on. Every notification wakes up the recovery tasks waiting for the
+instance, which confirm the new state right away instead of polling nova-api
+every ``verify_interval`` seconds.
+"""
+
+from eventlet import queue
+from oslo_log import log as logging
+import oslo_messaging as messaging
+from oslo_service import loopingcall
+from oslo_utils import timeutils
+
+import masakari.conf
+from masakari import rpc
+
+CONF = masakari.conf.CONF
+LOG = logging.getLogger(__name__)
+
+EVENT_TYPES = (r'^instance\.(evacuate(\..+)?|power_off\.end|'
+               r'power_on\.end)$')
+
+
+class NovaNotificationEndpoint(object):
+    """Hands the instance notifications of nova to the waiting tasks."""
+
+    filter_rule = messaging.NotificationFilter(event_type=EVENT_TYPES)
+
+    def __init__(self, nova_events):
+        self.nova_events = nova_events
+
+    def info(self, ctxt, publisher_id, event_type, payload, metadata):
+        try:
+            instance_uuid = payload['nova_object.data']['uuid']
+        except (KeyError, TypeError):
+            LOG.debug("Ignoring %(event_type)s notification from "
+                      "%(publisher_id)s without instance uuid.",
+                      {'event_type': event_type,
+                       'publisher_id': publisher_id})
+            return
+        self.nova_events.notify(instance_uuid, event_type)
+
+
+class NovaEvents(object):
+    """Waits for instance state changes notified by nova."""
+
+    def __init__(self):
+        self._waiters = {}
+        self._listener = None
+
+    @property
+    def listening(self):
+        return self._listener is not None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        targets = [messaging.Target(exchange=CONF.nova_notifications_exchange,
+                                    topic=topic)
+                   for topic in CONF.nova_notifications_topics]
+        pool = (CONF.nova_notifications_pool or
+                'masakari-engine-%s' % CONF.host)
+        listener = rpc.get_notification_listener(
+            targets, [NovaNotificationEndpoint(self)], pool=pool)
+        listener.start()
+        self._listener = listener
+        LOG.info("Listening to nova notifications on topics %(topics)s "
+                 "with pool %(pool)s.",
+                 {'topics': ','.join(CONF.nova_notifications_topics),
+                  'pool': pool})
+
+    def stop(self):
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        listener.stop()
+        listener.wait()
+
+    def notify(self, instance_uuid, event_type):
+        for waiter in self._waiters.get(instance_uuid, []):
+            waiter.put(event_type)
+
+    def wait(self, instance_uuid, condition, timeout):
+        """Block until ``condition`` is satisfied for the given instance.
+
+        ``condition`` follows the looping call protocol: it raises
+        :py:class:`loopingcall.LoopingCallDone` once the expected state is
+        reached, any other exception is re-raised to the caller. It is called
+        right away, whenever nova sends a notification for the instance and
+        every ``nova_notifications_verify_interval`` seconds in case a
+        notification is lost.
+
+        :raises: loopingcall.LoopingCallTimeOut if the condition is not met
+            within ``timeout`` seconds
+        """
+        waiter = queue.LightQueue()
+        self._waiters.setdefault(instance_uuid, []).append(waiter)
+        deadline = timeutils.now() + timeout
+        try:
+            while True:
+                try:
+                    condition()
+                except loopingcall.LoopingCallDone:
+                    return
+
+                remaining = deadline - timeutils.now()
+                if remaining <= 0:
+                    raise loopingcall.LoopingCallTimeOut(
+                        'Timed out waiting for instance %s' % instance_uuid)
+                try:
+                    event_type = waiter.get(timeout=min(
+                        remaining, CONF.nova_notifications_verify_interval))
+                except queue.Empty:
+                    continue
+                LOG.debug("Received %(event_type)s notification for instance "
+                          "%(instance_uuid)s.",
+                          {'event_type': event_type,
+                           'instance_uuid': instance_uuid})
+        finally:
+            waiters = self._waiters.get(instance_uuid, [])
+            waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(instance_uuid, None)
+
+
+NOVA_EVENTS = NovaEvents()
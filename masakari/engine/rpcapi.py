@@ -32,9 +32,10 @@ class EngineAPI(rpc.RPCAPI):
         1.0 - Initial version.
         1.1 - Added get_notification_recovery_workflow_details method to
               retrieve progress details from notification driver.
+        1.2 - Added process_notifications method.
     """
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
     TOPIC = CONF.masakari_topic
     BINARY = 'masakari-engine'
 
@@ -50,6 +51,17 @@ class EngineAPI(rpc.RPCAPI):
         cctxt = self.client.prepare(version=version)
         cctxt.cast(context, 'process_notification', notification=notification)
 
+    def process_notifications(self, context, notifications):
+        version = '1.2'
+        if not self.client.can_send_version(version):
+            # The engine doesn't know about batches yet.
+            for notification in notifications:
+                self.process_notification(context, notification)
+            return
+        cctxt = self.client.prepare(version=version)
+        cctxt.cast(context, 'process_notifications',
+                   notifications=notifications)
+
     def get_notification_recovery_workflow_details(self, context,
                                                    notification):
         version = '1.1'
@@ -0,0 +1,141 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Shared polling of server states for recovery workflows.
+
+Instead of every waiting instance polling ``GET /servers/{id}`` on its own,
+a :py:class:`ServerStatePoller` lists all servers changed since it started
+with a single request per tick and hands each server to the waiters
+registered for it.
+"""
+
+import datetime
+
+import eventlet
+from eventlet import event
+from eventlet import timeout as eventlet_timeout
+from oslo_log import log as logging
+from oslo_service import loopingcall
+from oslo_utils import timeutils
+
+import masakari.conf
+from masakari import utils
+
+CONF = masakari.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# NOTE: 'changes-since' is compared against timestamps written by nova
+# services, go back a little further than the poller start time so that
+# clock skew between hosts doesn't make us miss an update.
+CHANGES_SINCE_MARGIN = 60
+
+
+class _Waiter(object):
+
+    def __init__(self, condition):
+        self.condition = condition
+        self.event = event.Event()
+
+    def check(self, server):
+        if self.event.ready():
+            return
+        try:
+            self.condition(server)
+        except loopingcall.LoopingCallDone:
+            self.event.send(True)
+        except Exception as e:
+            self.event.send_exception(e)
+
+
+class ServerStatePoller(object):
+    """Polls nova once per interval for all the awaited servers.
+
+    :param context: context used for the nova requests
+    :param novaclient: :py:class:`masakari.compute.nova.API` instance
+    :param interval: seconds between two list requests, defaults to
+        ``verify_interval``
+    """
+
+    def __init__(self, context, novaclient, interval=None):
+        self.context = context
+        self.novaclient = novaclient
+        self.interval = interval or CONF.verify_interval
+        self._waiters = {}
+        self._thread = None
+        self._changes_since = None
+
+    def wait(self, instance_uuid, condition, timeout):
+        """Block until ``condition`` is satisfied for the given server.
+
+        ``condition`` is called with the server returned by nova every time
+        the server shows up in a list response. It follows the looping call
+        protocol: raise :py:class:`loopingcall.LoopingCallDone` once the
+        expected state is reached, any other exception aborts the wait and
+        is re-raised to the caller.
+
+        :raises: loopingcall.LoopingCallTimeOut if the condition is not met
+            within ``timeout`` seconds
+        """
+        waiter = _Waiter(condition)
+        self._waiters.setdefault(instance_uuid, []).append(waiter)
+        self._ensure_running()
+
+        timer = eventlet_timeout.Timeout(timeout)
+        try:
+            waiter.event.wait()
+        except eventlet_timeout.Timeout as exc:
+            if exc is not timer:
+                raise
+            raise loopingcall.LoopingCallTimeOut(
+                'Timed out waiting for server %s' % instance_uuid)
+        finally:
+            timer.cancel()
+            self._remove_waiter(instance_uuid, waiter)
+
+    def _remove_waiter(self, instance_uuid, waiter):
+        waiters = self._waiters.get(instance_uuid, [])
+        if waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            self._waiters.pop(instance_uuid, None)
+
+    def _ensure_running(self):
+        if self._thread is not None:
+            return
+        self._changes_since = timeutils.utcnow() - datetime.timedelta(
+            seconds=CHANGES_SINCE_MARGIN)
+        self._thread = utils.spawn(self._run)
+
+    def _run(self):
+        try:
+            while self._waiters:
+                self._poll()
+                if self._waiters:
+                    eventlet.sleep(self.interval)
+        finally:
+            self._thread = None
+
+    def _poll(self):
+        try:
+            servers = self.novaclient.get_servers_changed_since(
+                self.context, self._changes_since)
+        except Exception as e:
+            # The waiters time out on their own, a failed tick is retried
+            # on the next interval.
+            LOG.warning("Failed to list servers changed since %(since)s: "
+                        "%(error)s", {'since': self._changes_since,
+                                      'error': e})
+            return
+
+        for server in servers:
+            for waiter in list(self._waiters.get(server.id, [])):
+                waiter.check(server)
@@ -13,12 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import socket
-
 from masakari.notifications.objects import base as notification_base
 from masakari.notifications.objects import exception as notification_exception
 from masakari.notifications.objects import notification as event_notification
 from masakari.objects import fields
+from masakari import rpc
 
 
 def _get_fault_and_priority_from_exc_and_tb(exception, tb):
@@ -33,6 +32,7 @@ def _get_fault_and_priority_from_exc_and_tb(exception, tb):
     return fault, priority
 
 
+@rpc.if_notifications_enabled
 def notify_about_notification_update(context, notification, action, phase=None,
                           binary='masakari-engine', exception=None, tb=None):
     """Send versioned notification about a notification update.
@@ -50,8 +50,8 @@ def notify_about_notification_update(context, notification, action, phase=None,
     engine_notification = event_notification.NotificationApiNotification(
         context=context,
         priority=priority,
-        publisher=notification_base.NotificationPublisher(
-            context=context, host=socket.gethostname(), binary=binary),
+        publisher=notification_base.NotificationPublisher.from_binary(
+            binary),
         event_type=notification_base.EventType(
             action=action,
             phase=phase),
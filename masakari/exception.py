@@ -285,6 +285,11 @@ class VMoveNotFound(NotFound):
     msg_fmt = _("No vm move with id %(id)s.")
 
 
+class RecoveryWorkflowDetailsNotFound(NotFound):
+    msg_fmt = _("No recovery workflow details cached for notification "
+                "%(id)s.")
+
+
 class NotificationWithoutVMoves(Invalid):
     msg_fmt = _("This notification %(id)s without vm moves.")
 
@@ -315,6 +320,12 @@ class DuplicateNotification(Invalid):
     code = HTTPStatus.CONFLICT
 
 
+class IdempotencyKeyReused(Invalid):
+    msg_fmt = _('Idempotency key %(key)s was already used by a different '
+                'notification request.')
+    code = HTTPStatus.CONFLICT
+
+
 class HostOnMaintenanceError(Invalid):
     msg_fmt = _('Host %(host_name)s is already under maintenance.')
     code = HTTPStatus.CONFLICT
@@ -359,6 +370,22 @@ class HostInUse(Conflict):
                 "notifications.")
 
 
+class UnexpectedNotificationStatus(Conflict):
+    msg_fmt = _("Notification %(uuid)s can't be updated as its status is "
+                "%(actual)s instead of %(expected)s.")
+
+
+class UnexpectedVMoveStatus(Conflict):
+    msg_fmt = _("VM move %(uuid)s can't be updated as its status is "
+                "%(actual)s instead of %(expected)s.")
+
+
+class StaleFencingToken(Conflict):
+    msg_fmt = _("%(resource)s %(uuid)s can't be updated with fencing token "
+                "%(fencing_token)s as it was updated with fencing token "
+                "%(actual)s.")
+
+
 class ReservedHostsUnavailable(MasakariException):
     msg_fmt = _('No reserved_hosts available for evacuation.')
 
@@ -12,25 +12,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import datetime
-import random
-import time
 import traceback
 
 from oslo_log import log as logging
 from oslo_utils import excutils
 from oslo_utils import strutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from masakari.api import utils as api_utils
 from masakari.compute import nova
 import masakari.conf
-from masakari.coordination import synchronized
 from masakari.engine import rpcapi as engine_rpcapi
 from masakari import exception
 from masakari.i18n import _
 from masakari import objects
 from masakari.objects import fields
+from masakari.objects import notification as notification_obj
 
 
 CONF = masakari.conf.CONF
@@ -275,62 +275,71 @@ class NotificationAPI(object):
 
     @staticmethod
     def _is_duplicate_notification(context, notification):
-        # Get all the notifications by filters
+        # A notification with the same payload from the same host is
+        # considered as duplicate, the payloads are compared by hash.
+        generated_since = (notification.generated_time - datetime.timedelta(
+            seconds=CONF.duplicate_notification_detection_interval))
+        return objects.Notification.duplicate_exists(
+            context, notification.type, notification.source_host_uuid,
+            notification.payload, generated_since)
 
-        filters = {
-            'type': notification.type,
-            'source_host_uuid': notification.source_host_uuid,
-            'generated-since': (notification.generated_time -
-                datetime.timedelta(
-                    seconds=CONF.duplicate_notification_detection_interval))
-        }
-        notifications_list = objects.NotificationList.get_all(context,
-                                                              filters=filters)
-        for db_notification in notifications_list:
-            # if payload is same notification should be considered as
-            # duplicate
-            if db_notification.payload == notification.payload:
-                return True
+    @staticmethod
+    def _get_idempotent_notification(context, idempotency_key):
+        created_since = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.notification_idempotency_window)
+        try:
+            return objects.Notification.get_by_idempotency_key(
+                context, idempotency_key, created_since)
+        except exception.NotificationNotFound:
+            return None
 
-        return False
+    def create_notification(self, context, notification_data,
+                            idempotency_key=None):
+        """Create notification"""
+        if idempotency_key and CONF.notification_idempotency_window:
+            fingerprint = notification_obj.request_fingerprint(
+                notification_data.get('hostname'),
+                notification_data.get('type'),
+                notification_obj.payload_hash(
+                    notification_data.get('payload')))
+            notification = self._get_idempotent_notification(
+                context, idempotency_key)
+            if notification:
+                # NOTE: The notifications created before the fingerprints
+                # were recorded have none, they are replayed on the key.
+                if notification.idempotency_fingerprint not in (
+                        None, fingerprint):
+                    raise exception.IdempotencyKeyReused(key=idempotency_key)
+                LOG.info("Notification %(notification_uuid)s was already "
+                         "created with idempotency key %(key)s.",
+                         {'notification_uuid': notification.notification_uuid,
+                          'key': idempotency_key})
+                return notification
+        else:
+            idempotency_key = fingerprint = None
 
-    def _create_notification(self, context, notification_data):
         # Check whether host from which the notification came is already
         # present in failover segment or not
         host_name = notification_data.get('hostname')
         host_object = objects.Host.get_by_name(context, host_name)
-        host_on_maintenance = host_object.on_maintenance
-
-        if host_on_maintenance:
-            message = (_("Notification received from host %(host)s of type "
-                         "'%(type)s' is ignored as the host is already under "
-                         "maintenance.") % {
-                'host': host_name,
-                'type': notification_data.get('type')
-            })
-            raise exception.HostOnMaintenanceError(message=message)
-
-        notification = objects.Notification(context=context)
-
-        # Populate notification object for create
-        notification.type = notification_data.get('type')
-        notification.generated_time = notification_data.get('generated_time')
-        notification.source_host_uuid = host_object.uuid
-        notification.payload = notification_data.get('payload')
-        notification.status = fields.NotificationStatus.NEW
+        if host_object.on_maintenance:
+            raise self._host_on_maintenance_error(notification_data)
 
-        segment = host_object.failover_segment
-        notification.failover_segment_uuid = segment.uuid
+        notification = self._make_notification(context, notification_data,
+                                               host_object)
+        notification.idempotency_key = idempotency_key
+        notification.idempotency_fingerprint = fingerprint
 
         if self._is_duplicate_notification(context, notification):
-            message = (_("Notification received from host %(host)s of "
-                         "type %(type)s is duplicate.") %
-                       {'host': host_name, 'type': notification.type})
-            raise exception.DuplicateNotification(message=message)
+            raise self._duplicate_error(notification_data)
 
         try:
             notification.create()
             self.engine_rpcapi.process_notification(context, notification)
+        except exception.DuplicateNotification:
+            # A concurrent request for the same event won the race, the
+            # unique deduplication key rejected this one.
+            raise self._duplicate_error(notification_data)
         except Exception as e:
             with excutils.save_and_reraise_exception():
                 tb = traceback.format_exc()
@@ -341,31 +350,140 @@ class NotificationAPI(object):
                     tb=tb)
         return notification
 
-    @synchronized('create_host_notification-{notification_data[hostname]}')
-    def _create_host_type_notification(self, context, notification_data):
-        return self._create_notification(context, notification_data)
+    def create_notifications(self, context, notifications_data):
+        """Create the notifications received together in a batch.
 
-    def create_notification(self, context, notification_data):
-        """Create notification"""
-        create_notification_function = '_create_notification'
-        """If coordination is NOT configured, synchronized becomes effectively
-        a no-op across multiple API workers, which can lead to duplicate
-        notifications due to race conditions. Introduce a small randomized
-        pause to reduce probability of concurrent inserts.
-
-        This random pause only applies if notification_delay_max config is
-        set to a non-zero number.
+        The hosts are looked up with a single query, the duplicates are
+        detected with a single query, the notifications are stored in a
+        single transaction and sent to the engine in a single message.
+
+        :returns: a list with, for every item of notifications_data, either
+                  the created notification or the exception telling why it
+                  wasn't created
         """
-        if not CONF.coordination.backend_url:
-            delay_max = CONF.notification_delay_max
-            if delay_max > 0:
-                time.sleep(random.uniform(0, delay_max))
+        results = [None] * len(notifications_data)
+        host_names = {data['hostname'] for data in notifications_data}
+        hosts = {host.name: host for host in objects.HostList.get_all(
+            context, filters={'name': sorted(host_names)})}
+
+        candidates = []
+        for index, notification_data in enumerate(notifications_data):
+            host_object = hosts.get(notification_data['hostname'])
+            if host_object is None:
+                results[index] = exception.HostNotFoundByName(
+                    host_name=notification_data['hostname'])
+            elif host_object.on_maintenance:
+                results[index] = self._host_on_maintenance_error(
+                    notification_data)
+            else:
+                candidates.append((index, self._make_notification(
+                    context, notification_data, host_object)))
+
+        # The notifications of the batch are also checked against each
+        # other, the first one wins.
+        interval = datetime.timedelta(
+            seconds=CONF.duplicate_notification_detection_interval)
+        generated_times = collections.defaultdict(list)
+        recent_notifications = self._get_recent_notifications(
+            context, [candidate[1] for candidate in candidates])
+        for existing in recent_notifications:
+            generated_times[self._duplicate_key(existing)].append(
+                existing.generated_time)
+
+        accepted = []
+        for index, notification in candidates:
+            key = self._duplicate_key(notification)
+            since = notification.generated_time - interval
+            if any(generated_time >= since
+                   for generated_time in generated_times[key]):
+                results[index] = self._duplicate_error(
+                    notifications_data[index])
+                continue
+            generated_times[key].append(notification.generated_time)
+            accepted.append((index, notification))
+
+        if not accepted:
+            return results
 
-        if notification_data.get('type') == \
-                fields.NotificationType.COMPUTE_HOST:
-            create_notification_function = '_create_host_type_notification'
-        return getattr(self, create_notification_function)(context,
-                                                           notification_data)
+        try:
+            created = objects.NotificationList.create_all(
+                context, [candidate[1] for candidate in accepted])
+            self.engine_rpcapi.process_notifications(context, created)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                tb = traceback.format_exc()
+                for index, notification in accepted:
+                    api_utils.notify_about_notification_api(
+                        context, notification,
+                        action=(fields.EventNotificationAction.
+                                NOTIFICATION_CREATE),
+                        phase=fields.EventNotificationPhase.ERROR,
+                        exception=e, tb=tb)
+
+        created_by_uuid = {notification.notification_uuid: notification
+                           for notification in created}
+        for index, notification in accepted:
+            # Missing when a concurrent request for the same event won the
+            # race on the unique deduplication key.
+            results[index] = created_by_uuid.get(
+                notification.notification_uuid,
+                self._duplicate_error(notifications_data[index]))
+        return results
+
+    @staticmethod
+    def _make_notification(context, notification_data, host_object):
+        notification = objects.Notification(context=context)
+
+        # Populate notification object for create
+        notification.type = notification_data.get('type')
+        notification.generated_time = notification_data.get('generated_time')
+        notification.source_host_uuid = host_object.uuid
+        notification.payload = notification_data.get('payload')
+        notification.status = fields.NotificationStatus.NEW
+
+        segment = host_object.failover_segment
+        notification.failover_segment_uuid = segment.uuid
+        return notification
+
+    @staticmethod
+    def _get_recent_notifications(context, notifications):
+        if not notifications:
+            return []
+        filters = {
+            'source_host_uuid': sorted({notification.source_host_uuid
+                                        for notification in notifications}),
+            'payload_hash': sorted({
+                notification_obj.payload_hash(notification.payload)
+                for notification in notifications}),
+            'generated-since': min(
+                notification.generated_time
+                for notification in notifications) - datetime.timedelta(
+                seconds=CONF.duplicate_notification_detection_interval),
+        }
+        return objects.NotificationList.get_all(context, filters=filters)
+
+    @staticmethod
+    def _duplicate_key(notification):
+        return (notification.source_host_uuid, notification.type,
+                notification_obj.payload_hash(notification.payload))
+
+    @staticmethod
+    def _host_on_maintenance_error(notification_data):
+        message = (_("Notification received from host %(host)s of type "
+                     "'%(type)s' is ignored as the host is already under "
+                     "maintenance.") % {
+            'host': notification_data.get('hostname'),
+            'type': notification_data.get('type')
+        })
+        return exception.HostOnMaintenanceError(message=message)
+
+    @staticmethod
+    def _duplicate_error(notification_data):
+        message = (_("Notification received from host %(host)s of "
+                     "type %(type)s is duplicate.") %
+                   {'host': notification_data.get('hostname'),
+                    'type': notification_data.get('type')})
+        return exception.DuplicateNotification(message=message)
 
     def get_all(self, context, filters=None, sort_keys=None,
                 sort_dirs=None, limit=None, marker=None):
@@ -404,12 +522,42 @@ class NotificationAPI(object):
                                                    notification_uuid):
         """Get recovery workflow details details of the notification"""
         notification = self.get_notification(context, notification_uuid)
+        finished = notification.status in (
+            fields.NotificationStatus.FINISHED,
+            fields.NotificationStatus.FAILED,
+            fields.NotificationStatus.IGNORED)
+
+        # NOTE: The engine caches the details while the recovery is running.
+        # Once the notification is finished, the details are read from the
+        # engine one last time and kept as an immutable snapshot.
+        try:
+            workflow_details = (
+                objects.RecoveryWorkflowDetails.get_by_notification_uuid(
+                    context, notification_uuid))
+        except exception.RecoveryWorkflowDetailsNotFound:
+            workflow_details = None
+
+        if workflow_details and (workflow_details.finished or not finished):
+            notification.recovery_workflow_details = workflow_details.details
+            return notification
 
         LOG.debug("Fetching recovery workflow details of a notification %s ",
                   notification_uuid)
         notification = (self.engine_rpcapi.
                         get_notification_recovery_workflow_details(
                             context, notification))
+
+        if finished:
+            workflow_details = objects.RecoveryWorkflowDetails(
+                context=context, notification_uuid=notification_uuid,
+                details=notification.recovery_workflow_details,
+                finished=True)
+            try:
+                workflow_details.save()
+            except Exception:
+                LOG.warning("Failed to save the recovery workflow details "
+                            "of notification %s.", notification_uuid,
+                            exc_info=True)
         return notification
 
 
@@ -0,0 +1,197 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Background sending of the versioned notifications.
+
+The versioned notifications are emitted around every segment, host and
+notification operation, from the API requests and the recovery workflows.
+The :py:class:`NotificationEmitter` of a process queues them and a single
+green thread sends them to the message bus in batches, so the latency of the
+bus stays off those requests and workflows. The notifier of every publisher
+is prepared once and reused.
+"""
+
+import atexit
+import collections
+
+import eventlet
+from eventlet import queue
+from oslo_log import log as logging
+
+import masakari.conf
+from masakari import rpc
+from masakari import utils
+
+CONF = masakari.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Queued to stop the background worker.
+_STOP = object()
+
+# Number of seconds to wait for the queued notifications when stopping.
+STOP_TIMEOUT = 10
+
+
+class NotificationEmitter(object):
+    """Sends the versioned notifications of a process in the background.
+
+    The notifications of every publisher are sent in the order they were
+    emitted. Up to ``[notifications]\\emitter_queue_size`` notifications
+    wait to be sent, when the queue is full the emitting green thread either
+    waits or the notification is dropped, according to
+    ``[notifications]\\emitter_overflow_policy``. The queued notifications
+    are sent before the worker stops, when the service stops or else when the
+    process exits.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._worker = None
+        self._exit_registered = False
+        self._notifiers = {}
+        self._notifier_source = None
+        self._overflowing = False
+        self.dropped = 0
+
+    def emit(self, context, priority, event_type, publisher_id, payload):
+        """Send or queue a versioned notification.
+
+        :param context: the request context
+        :param priority: the priority of the notification
+        :param event_type: the wire format of the event type
+        :param publisher_id: the publisher of the notification
+        :param payload: the serialized payload
+        """
+        message = (context, priority, event_type, publisher_id, payload)
+        if not CONF.notifications.emitter_queue_size:
+            self._send(self._get_notifier(publisher_id), message)
+            return
+
+        self._start()
+        if CONF.notifications.emitter_overflow_policy == 'block':
+            self._queue.put(message)
+            return
+
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            if not self._overflowing:
+                # Logged once until the queue is drained.
+                self._overflowing = True
+                LOG.warning("The queue of versioned notifications is full, "
+                            "dropping notification %(event_type)s from "
+                            "%(publisher_id)s.",
+                            {'event_type': event_type,
+                             'publisher_id': publisher_id})
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Send the queued notifications and stop the background worker.
+
+        :param timeout: maximum number of seconds to wait for the queued
+                        notifications to be sent
+        """
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+
+        with eventlet.Timeout(timeout, False):
+            self._queue.put(_STOP)
+            worker.wait()
+            return
+        worker.kill()
+        LOG.warning("Stopped waiting for the queued versioned notifications "
+                    "to be sent, %d notification(s) are not sent.",
+                    self._queue.qsize())
+
+    def _start(self):
+        if self._worker is not None:
+            return
+        self._queue = queue.LightQueue(CONF.notifications.emitter_queue_size)
+        self._worker = utils.spawn(self._run, self._queue)
+        if not self._exit_registered:
+            atexit.register(self.stop)
+            self._exit_registered = True
+
+    def _run(self, messages):
+        while True:
+            batch = [messages.get()]
+            while len(batch) < CONF.notifications.emitter_batch_size:
+                try:
+                    batch.append(messages.get_nowait())
+                except queue.Empty:
+                    break
+            self._overflowing = False
+
+            stopping = any(message is _STOP for message in batch)
+            if stopping:
+                # The notifications emitted while stopping are sent too.
+                while True:
+                    try:
+                        batch.append(messages.get_nowait())
+                    except queue.Empty:
+                        break
+                batch = [message for message in batch
+                         if message is not _STOP]
+
+            self._send_batch(batch)
+            if stopping:
+                return
+
+    def _send_batch(self, batch):
+        # NOTE: The message bus can't send several notifications in one
+        # call, the notifications of a batch are grouped per publisher and
+        # sent one after another with the notifier of the publisher.
+        batch_by_publisher = collections.OrderedDict()
+        for message in batch:
+            batch_by_publisher.setdefault(message[3], []).append(message)
+
+        for publisher_id, messages in batch_by_publisher.items():
+            try:
+                notifier = self._get_notifier(publisher_id)
+            except Exception:
+                LOG.exception("Failed to prepare the notifier of "
+                              "%(publisher_id)s, %(count)d versioned "
+                              "notification(s) are not sent.",
+                              {'publisher_id': publisher_id,
+                               'count': len(messages)})
+                continue
+
+            for message in messages:
+                try:
+                    self._send(notifier, message)
+                except Exception:
+                    LOG.exception("Failed to send versioned notification "
+                                  "%(event_type)s from %(publisher_id)s.",
+                                  {'event_type': message[2],
+                                   'publisher_id': publisher_id})
+
+    @staticmethod
+    def _send(notifier, message):
+        context, priority, event_type, publisher_id, payload = message
+        notify = getattr(notifier, priority)
+        notify(context, event_type=event_type, payload=payload)
+
+    def _get_notifier(self, publisher_id):
+        if self._notifier_source is not rpc.NOTIFIER:
+            # The transport was set up again, the notifiers prepared from
+            # the previous one can't be used anymore.
+            self._notifiers = {}
+            self._notifier_source = rpc.NOTIFIER
+        notifier = self._notifiers.get(publisher_id)
+        if notifier is None:
+            notifier = rpc.get_versioned_notifier(publisher_id)
+            self._notifiers[publisher_id] = notifier
+        return notifier
+
+
+EMITTER = NotificationEmitter()
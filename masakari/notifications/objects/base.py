@@ -13,9 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import socket
+
+from masakari.notifications import emitter
 from masakari.objects import base
 from masakari.objects import fields
-from masakari import rpc
+
+
+# binary -> NotificationPublisher of this host
+_PUBLISHERS = {}
 
 
 @base.MasakariObjectRegistry.register_if(False)
@@ -111,6 +117,18 @@ class NotificationPublisher(NotificationObject):
     def from_service_obj(cls, service):
         return cls(host=service.host, binary=service.binary)
 
+    @classmethod
+    def from_binary(cls, binary):
+        """Get the publisher of a binary running on this host.
+
+        The publishers are shared and must not be modified.
+        """
+        publisher = _PUBLISHERS.get(binary)
+        if publisher is None:
+            publisher = cls(host=socket.gethostname(), binary=binary)
+            _PUBLISHERS[binary] = publisher
+        return publisher
+
 
 @base.MasakariObjectRegistry.register_if(False)
 class NotificationBase(NotificationObject):
@@ -128,9 +146,8 @@ class NotificationBase(NotificationObject):
     }
 
     def _emit(self, context, event_type, publisher_id, payload):
-        notifier = rpc.get_versioned_notifier(publisher_id)
-        notify = getattr(notifier, self.priority)
-        notify(context, event_type=event_type, payload=payload)
+        emitter.EMITTER.emit(context, self.priority, event_type,
+                             publisher_id, payload)
 
     def emit(self, context):
         """Send the notification."""
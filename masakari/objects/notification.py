@@ -13,23 +13,68 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import calendar
+import hashlib
+
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import uuidutils
+from oslo_utils import versionutils
 
 from masakari.api import utils as api_utils
+import masakari.conf
 from masakari import db
 from masakari import exception
 from masakari import objects
 from masakari.objects import base
 from masakari.objects import fields
 
+CONF = masakari.conf.CONF
 LOG = logging.getLogger(__name__)
 
 
 NOTIFICATION_OPTIONAL_FIELDS = ['recovery_workflow_details']
 
 
+def payload_hash(payload):
+    """Hash of the canonical JSON form of a notification payload.
+
+    A missing or empty payload has the same form as an empty object.
+    """
+    canonical = jsonutils.dumps(payload or {}, sort_keys=True,
+                                separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def dedup_key(source_host_uuid, notification_type, payload_hash,
+              generated_time):
+    """Deduplication key of a notification.
+
+    Notifications of the same type and payload from the same host which are
+    generated in the same window of
+    ``duplicate_notification_detection_interval`` seconds share the key, the
+    unique constraint on it rejects all of them but the first one. Returns
+    None when the detection is disabled.
+    """
+    interval = CONF.duplicate_notification_detection_interval
+    if not interval:
+        return None
+    bucket = calendar.timegm(generated_time.utctimetuple()) // interval
+    key = '%s:%s:%s:%d' % (source_host_uuid, notification_type,
+                           payload_hash, bucket)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def request_fingerprint(hostname, notification_type, payload_hash):
+    """Fingerprint of a notification create request.
+
+    A request replaying the idempotency key of a notification must have the
+    fingerprint of the request which created it.
+    """
+    key = '%s:%s:%s' % (hostname, notification_type, payload_hash)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
 @base.MasakariObjectRegistry.register
 class Notification(base.MasakariPersistentObject, base.MasakariObject,
                    base.MasakariObjectDictCompat):
@@ -38,7 +83,15 @@ class Notification(base.MasakariPersistentObject, base.MasakariObject,
     # Version 1.1: Added recovery_workflow_details field.
     #              Note: This field shouldn't be persisted.
     # Version 1.2: Added failover_segment_uuid and message field.
-    VERSION = '1.2'
+    # Version 1.3: Added duplicate_exists method.
+    # Version 1.4: Added idempotency_key field and get_by_idempotency_key
+    #              method.
+    # Version 1.5: Added expected_status parameter to save method.
+    # Version 1.6: Added fencing_token field.
+    # Version 1.7: Added idempotency_fingerprint field.
+    # Version 1.8: Added owner and lease_expires_at parameters to save
+    #              method.
+    VERSION = '1.8'
 
     fields = {
         'id': fields.IntegerField(),
@@ -55,8 +108,21 @@ class Notification(base.MasakariPersistentObject, base.MasakariObject,
             'NotificationProgressDetails', default=[]),
         'failover_segment_uuid': fields.UUIDField(),
         'message': fields.StringField(nullable=True),
+        'idempotency_key': fields.StringField(nullable=True),
+        'idempotency_fingerprint': fields.StringField(nullable=True),
+        'fencing_token': fields.IntegerField(nullable=True),
         }
 
+    def obj_make_compatible(self, primitive, target_version):
+        super(Notification, self).obj_make_compatible(primitive,
+                                                      target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 6) and 'fencing_token' in primitive:
+            del primitive['fencing_token']
+        if (target_version < (1, 7) and
+                'idempotency_fingerprint' in primitive):
+            del primitive['idempotency_fingerprint']
+
     @staticmethod
     def _from_db_object(context, notification, db_notification):
 
@@ -85,24 +151,52 @@ class Notification(base.MasakariPersistentObject, base.MasakariObject,
         db_notification = db.notification_get_by_uuid(context, uuid)
         return cls._from_db_object(context, cls(), db_notification)
 
+    @classmethod
     @base.remotable
-    def create(self):
+    def get_by_idempotency_key(cls, context, idempotency_key, created_since):
+        db_notification = db.notification_get_by_idempotency_key(
+            context, idempotency_key, created_since)
+        return cls._from_db_object(context, cls(), db_notification)
+
+    @classmethod
+    @base.remotable
+    def duplicate_exists(cls, context, notification_type, source_host_uuid,
+                         payload, generated_since):
+        return db.notification_duplicate_exists(
+            context, notification_type, source_host_uuid,
+            payload_hash(payload), generated_since)
+
+    def _get_create_values(self, action='create'):
         if self.obj_attr_is_set('id'):
-            raise exception.ObjectActionError(action='create',
+            raise exception.ObjectActionError(action=action,
                                               reason='already created')
+        if not self.obj_attr_is_set('notification_uuid'):
+            self.notification_uuid = uuidutils.generate_uuid()
+            LOG.debug('Generated uuid %(uuid)s for notifications',
+                      dict(uuid=self.notification_uuid))
+
         updates = self.masakari_obj_get_changes()
         # NOTE(ShilpaSD): This field doesn't exist in the Notification
         # db model so don't save it.
         updates.pop('recovery_workflow_details', None)
 
-        if 'notification_uuid' not in updates:
-            updates['notification_uuid'] = uuidutils.generate_uuid()
-            LOG.debug('Generated uuid %(uuid)s for notifications',
-                      dict(uuid=updates['notification_uuid']))
-
         if 'payload' in updates:
+            updates['payload_hash'] = payload_hash(updates['payload'])
             updates['payload'] = jsonutils.dumps(updates['payload'])
 
+        if all(updates.get(key) for key in ('source_host_uuid', 'type',
+                                            'payload_hash',
+                                            'generated_time')):
+            updates['dedup_key'] = dedup_key(
+                updates['source_host_uuid'], updates['type'],
+                updates['payload_hash'], updates['generated_time'])
+
+        return updates
+
+    @base.remotable
+    def create(self):
+        updates = self._get_create_values()
+
         api_utils.notify_about_notification_api(self._context, self,
             action=fields.EventNotificationAction.NOTIFICATION_CREATE,
             phase=fields.EventNotificationPhase.START)
@@ -116,17 +210,33 @@ class Notification(base.MasakariPersistentObject, base.MasakariObject,
         self._from_db_object(self._context, self, db_notification)
 
     @base.remotable
-    def save(self):
+    def save(self, expected_status=None, owner=None, lease_expires_at=None):
+        """Save the changes of the notification.
+
+        If expected_status is given, the notification is only saved if its
+        status in the database is still this one, otherwise
+        UnexpectedNotificationStatus is raised. If the notification has a
+        fencing token, it is only saved if it wasn't saved with a newer
+        fencing token since, otherwise StaleFencingToken is raised. If owner
+        is given, the notification is saved with a lease held by the owner
+        until lease_expires_at.
+        """
         updates = self.masakari_obj_get_changes()
 
         updates.pop('id', None)
         # NOTE(ShilpaSD): This field doesn't exist in the Notification
         # db model so don't save it.
         updates.pop('recovery_workflow_details', None)
-
-        db_notification = db.notification_update(self._context,
-                                                 self.notification_uuid,
-                                                 updates)
+        updates.pop('fencing_token', None)
+        fencing_token = (self.fencing_token
+                         if self.obj_attr_is_set('fencing_token') else None)
+        if owner is not None:
+            updates['owner'] = owner
+            updates['lease_expires_at'] = lease_expires_at
+
+        db_notification = db.notification_update(
+            self._context, self.notification_uuid, updates,
+            expected_status=expected_status, fencing_token=fencing_token)
         self._from_db_object(self._context, self, db_notification)
 
     @base.remotable
@@ -145,7 +255,12 @@ class Notification(base.MasakariPersistentObject, base.MasakariObject,
 @base.MasakariObjectRegistry.register
 class NotificationList(base.ObjectListBase, base.MasakariObject):
 
-    VERSION = '1.0'
+    # Version 1.0: Initial version
+    # Version 1.1: Added create_all method.
+    # Version 1.2: Added get_unfinished and expire methods.
+    # Version 1.3: Replaced get_unfinished method with claim, added
+    #              renew_leases and release methods.
+    VERSION = '1.3'
 
     fields = {
         'objects': fields.ListOfObjectsField('Notification'),
@@ -165,6 +280,75 @@ class NotificationList(base.ObjectListBase, base.MasakariObject):
         return base.obj_make_list(context, cls(context), objects.Notification,
                                   groups)
 
+    @classmethod
+    @base.remotable
+    def claim(cls, context, owner, lease_expires_at, new_generated_before,
+              limit):
+        """Claim the notifications in error and the new notifications
+        generated before the given time, which aren't claimed by another
+        owner, and the running notifications whose lease expired.
+        """
+        groups = db.notifications_claim(context, owner, lease_expires_at,
+                                        new_generated_before, limit)
+
+        return base.obj_make_list(context, cls(context), objects.Notification,
+                                  groups)
+
+    @classmethod
+    @base.remotable
+    def renew_leases(cls, context, owner, lease_expires_at):
+        """Renew the leases of the notifications claimed by the owner which
+        are still waiting to be processed or being processed.
+        """
+        return db.notifications_renew_leases(context, owner,
+                                             lease_expires_at)
+
+    @classmethod
+    @base.remotable
+    def release(cls, context, owner):
+        """Release the notifications claimed by the owner which aren't
+        being processed.
+        """
+        return db.notifications_release(context, owner)
+
+    @classmethod
+    @base.remotable
+    def expire(cls, context, generated_before):
+        """Mark the unfinished notifications generated before the given time
+        as failed.
+
+        Returns the uuids of the expired notifications.
+        """
+        return db.notifications_expire(context, generated_before)
+
+    @classmethod
+    @base.remotable
+    def create_all(cls, context, notifications):
+        """Persist all the given notifications in a single transaction.
+
+        The notifications rejected as duplicates by the database aren't part
+        of the returned list.
+        """
+        values_list = [
+            notification._get_create_values(action='create_all')
+            for notification in notifications]
+
+        for notification in notifications:
+            api_utils.notify_about_notification_api(context, notification,
+                action=fields.EventNotificationAction.NOTIFICATION_CREATE,
+                phase=fields.EventNotificationPhase.START)
+
+        groups = db.notification_create_many(context, values_list)
+        notification_list = base.obj_make_list(
+            context, cls(context), objects.Notification, groups)
+
+        for notification in notification_list:
+            api_utils.notify_about_notification_api(context, notification,
+                action=fields.EventNotificationAction.NOTIFICATION_CREATE,
+                phase=fields.EventNotificationPhase.END)
+
+        return notification_list
+
 
 def notification_sample(sample):
     """Class decorator to attach the notification sample information
@@ -197,3 +381,61 @@ class NotificationProgressDetails(base.MasakariObject,
     def create(cls, name, progress, progress_details, state,):
         return cls(name=name, progress=progress,
                    progress_details=progress_details, state=state)
+
+
+@base.MasakariObjectRegistry.register
+class RecoveryWorkflowDetails(base.MasakariPersistentObject,
+                              base.MasakariObject):
+    """Recovery workflow details of a notification cached by the engine."""
+
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    fields = {
+        'id': fields.IntegerField(),
+        'notification_uuid': fields.UUIDField(),
+        'details': fields.ListOfObjectsField(
+            'NotificationProgressDetails', default=[]),
+        # NOTE: Set once the notification has reached a final state, the
+        # details can't be changed anymore.
+        'finished': fields.BooleanField(default=False),
+        }
+
+    @staticmethod
+    def _from_db_object(context, workflow_details, db_workflow_details):
+        for key in workflow_details.fields:
+            if key != 'details':
+                setattr(workflow_details, key, db_workflow_details.get(key))
+            else:
+                details = jsonutils.loads(
+                    db_workflow_details.get('details') or '[]')
+                workflow_details.details = [
+                    NotificationProgressDetails.create(**detail)
+                    for detail in details]
+
+        workflow_details.obj_reset_changes()
+        workflow_details._context = context
+        return workflow_details
+
+    @classmethod
+    @base.remotable
+    def get_by_notification_uuid(cls, context, notification_uuid):
+        db_workflow_details = (
+            db.recovery_workflow_details_get_by_notification_uuid(
+                context, notification_uuid))
+        return cls._from_db_object(context, cls(), db_workflow_details)
+
+    @base.remotable
+    def save(self):
+        updates = self.masakari_obj_get_changes()
+        updates.pop('id', None)
+        updates.pop('notification_uuid', None)
+
+        if 'details' in updates:
+            updates['details'] = jsonutils.dumps([
+                {key: detail[key] for key in detail.fields}
+                for detail in updates['details']])
+
+        db_workflow_details = db.recovery_workflow_details_update(
+            self._context, self.notification_uuid, updates)
+        self._from_db_object(self._context, self, db_workflow_details)
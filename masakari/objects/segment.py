@@ -32,7 +32,8 @@ class FailoverSegment(base.MasakariPersistentObject, base.MasakariObject,
                       base.MasakariObjectDictCompat):
     # 1.0, init
     # 1.1, add enabled field
-    VERSION = '1.1'
+    # 1.2, add active_notifications field
+    VERSION = '1.2'
 
     fields = {
         'id': fields.IntegerField(),
@@ -42,6 +43,7 @@ class FailoverSegment(base.MasakariPersistentObject, base.MasakariObject,
         'enabled': fields.BooleanField(default=True),
         'description': fields.StringField(nullable=True),
         'recovery_method': fields.FailoverSegmentRecoveryMethodField(),
+        'active_notifications': fields.IntegerField(default=0),
         }
 
     def obj_make_compatible(self, primitive, target_version):
@@ -50,6 +52,9 @@ class FailoverSegment(base.MasakariPersistentObject, base.MasakariObject,
         target_version = versionutils.convert_version_to_tuple(target_version)
         if target_version < (1, 1) and 'enabled' in primitive:
             del primitive['enabled']
+        if (target_version < (1, 2) and
+                'active_notifications' in primitive):
+            del primitive['active_notifications']
 
     @staticmethod
     def _from_db_object(context, segment, db_segment):
@@ -14,6 +14,7 @@
 
 from oslo_log import log as logging
 from oslo_utils import uuidutils
+from oslo_utils import versionutils
 
 from masakari import db
 from masakari import exception
@@ -27,7 +28,10 @@ LOG = logging.getLogger(__name__)
 @base.MasakariObjectRegistry.register
 class VMove(base.MasakariPersistentObject, base.MasakariObject,
             base.MasakariObjectDictCompat):
-    VERSION = '1.0'
+    # Version 1.0: Initial version
+    # Version 1.1: Added expected_status parameter to save method
+    # Version 1.2: Added fencing_token field
+    VERSION = '1.2'
 
     fields = {
         'id': fields.IntegerField(),
@@ -42,8 +46,15 @@ class VMove(base.MasakariPersistentObject, base.MasakariObject,
         'type': fields.VMoveTypeField(nullable=True),
         'status': fields.VMoveStatusField(nullable=True),
         'message': fields.StringField(nullable=True),
+        'fencing_token': fields.IntegerField(nullable=True),
         }
 
+    def obj_make_compatible(self, primitive, target_version):
+        super(VMove, self).obj_make_compatible(primitive, target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 2) and 'fencing_token' in primitive:
+            del primitive['fencing_token']
+
     @staticmethod
     def _from_db_object(context, vmove, db_vmove):
         for key in vmove.fields:
@@ -73,18 +84,33 @@ class VMove(base.MasakariPersistentObject, base.MasakariObject,
         self._from_db_object(self._context, self, vmove)
 
     @base.remotable
-    def save(self):
+    def save(self, expected_status=None):
+        """Save the changes of the vm move.
+
+        If expected_status is given, the vm move is only saved if its status
+        in the database is still this one, otherwise UnexpectedVMoveStatus is
+        raised. If the vm move has a fencing token, it is only saved if it
+        wasn't saved with a newer fencing token since, otherwise
+        StaleFencingToken is raised.
+        """
         updates = self.masakari_obj_get_changes()
         updates.pop('id', None)
+        updates.pop('fencing_token', None)
+        fencing_token = (self.fencing_token
+                         if self.obj_attr_is_set('fencing_token') else None)
 
-        vmove = db.vmove_update(self._context, self.uuid, updates)
+        vmove = db.vmove_update(self._context, self.uuid, updates,
+                                expected_status=expected_status,
+                                fencing_token=fencing_token)
         self._from_db_object(self._context, self, vmove)
 
 
 @base.MasakariObjectRegistry.register
 class VMoveList(base.ObjectListBase, base.MasakariObject):
 
-    VERSION = '1.0'
+    # Version 1.0: Initial version
+    # Version 1.1: Added create_all method
+    VERSION = '1.1'
 
     fields = {
         'objects': fields.ListOfObjectsField('VMove'),
@@ -116,3 +142,21 @@ class VMoveList(base.ObjectListBase, base.MasakariObject):
         groups = db.vmoves_get_all_by_filters(ctxt, filters=filters)
         return base.obj_make_list(ctxt, cls(ctxt), objects.VMove,
                                   groups)
+
+    @classmethod
+    @base.remotable
+    def create_all(cls, ctxt, vmoves):
+        """Persist all the given vm moves in a single transaction."""
+        values_list = []
+        for vmove in vmoves:
+            if vmove.obj_attr_is_set('id'):
+                raise exception.ObjectActionError(action='create_all',
+                                                  reason='already created')
+            updates = vmove.masakari_obj_get_changes()
+            if 'uuid' not in updates:
+                updates['uuid'] = uuidutils.generate_uuid()
+            values_list.append(updates)
+
+        groups = db.vmove_create_many(ctxt, values_list)
+        return base.obj_make_list(ctxt, cls(ctxt), objects.VMove,
+                                  groups)
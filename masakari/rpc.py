@@ -12,6 +12,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import fnmatch
+import functools
+
 import oslo_messaging as messaging
 from oslo_messaging.rpc import dispatcher
 from oslo_serialization import jsonutils
@@ -149,11 +152,50 @@ def get_server(target, endpoints, serializer=None):
                                     access_policy=access_policy)
 
 
+def get_notification_listener(targets, endpoints, pool=None):
+    assert NOTIFICATION_TRANSPORT is not None
+    return messaging.get_notification_listener(NOTIFICATION_TRANSPORT,
+                                               targets,
+                                               endpoints,
+                                               executor='eventlet',
+                                               pool=pool)
+
+
 def get_versioned_notifier(publisher_id):
     assert NOTIFIER is not None
     return NOTIFIER.prepare(publisher_id=publisher_id)
 
 
+def is_event_type_enabled(event_type):
+    """Check whether a versioned notification of this type is emitted.
+
+    :param event_type: the wire format of the event type, ``<action>`` or
+                       ``<action>.<phase>``
+    """
+    if NOTIFIER is not None and not NOTIFIER.is_enabled():
+        return False
+    if not any(fnmatch.fnmatchcase(event_type, pattern)
+               for pattern in CONF.notifications.include_event_types):
+        return False
+    return not any(fnmatch.fnmatchcase(event_type, pattern)
+                   for pattern in CONF.notifications.exclude_event_types)
+
+
+def if_notifications_enabled(f):
+    """Calls the decorated notify function only if its event is emitted.
+
+    The decorated function takes the context, the object the notification is
+    about, the action and the phase of the event, in that order. Nothing,
+    not even the payload, is built for the events which aren't emitted.
+    """
+    @functools.wraps(f)
+    def wrapped(context, obj, action, phase=None, **kwargs):
+        event_type = '%s.%s' % (action, phase) if phase else action
+        if is_event_type_enabled(event_type):
+            return f(context, obj, action, phase=phase, **kwargs)
+    return wrapped
+
+
 class RPCAPI(object):
     """Mixin class aggregating methods related to RPC API compatibility."""
 
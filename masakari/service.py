@@ -31,6 +31,7 @@ from masakari import context
 from masakari import coordination as masakari_coordination
 from masakari import exception
 from masakari.i18n import _
+from masakari.notifications import emitter as notification_emitter
 from masakari.objects import base as objects_base
 from masakari import rpc
 from masakari import utils
@@ -94,6 +95,8 @@ class Service(service.Service):
         self.rpcserver = rpc.get_server(target, endpoints, serializer)
         self.rpcserver.start()
 
+        self.manager.post_start_hook()
+
         if self.periodic_enable:
             if self.periodic_fuzzy_delay:
                 initial_delay = random.randint(0, self.periodic_fuzzy_delay)
@@ -165,6 +168,8 @@ class Service(service.Service):
             self.rpcserver.stop()
         except Exception:
             pass
+        self.manager.cleanup_host()
+        notification_emitter.EMITTER.stop()
         super(Service, self).stop()
 
     def periodic_tasks(self, raise_on_error=False):
@@ -259,6 +264,7 @@ class WSGIService(service.Service):
                 LOG.warning('Error occurred during masakari coordination was '
                             'stopped: %s', error)
         self.server.stop()
+        notification_emitter.EMITTER.stop()
 
     def wait(self):
         """Wait for the service to stop serving this API.
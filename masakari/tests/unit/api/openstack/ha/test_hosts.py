@@ -352,6 +352,20 @@ class HostTestCase(base.TestCase):
         result = result['host']
         self._assert_host_data(self.host, _make_host_obj(result))
 
+    @mock.patch.object(ha_api.HostAPI, 'get_host')
+    def test_show_segment_active_notifications(self, mock_get_host):
+        self.failover_segment.active_notifications = 2
+        mock_get_host.return_value = self.host
+
+        for version, shown in (('1.5', False), ('1.6', True)):
+            req = fakes.HTTPRequest.blank(
+                '/v1/segments/%s/hosts' % uuidsentinel.fake_segment1,
+                use_admin_context=True, version=version)
+            result = self.controller.show(req, uuidsentinel.fake_segment1,
+                                          uuidsentinel.fake_host_1)
+            self.assertEqual(shown, result['host'][
+                'failover_segment'].obj_attr_is_set('active_notifications'))
+
     @mock.patch.object(ha_api.HostAPI, 'get_host')
     def test_show_with_non_existing_id(self, mock_get_host):
 
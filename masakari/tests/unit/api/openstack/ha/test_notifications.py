@@ -24,6 +24,7 @@ from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 from webob import exc
 
+from masakari.api import api_version_request
 from masakari.api.openstack.ha import notifications
 from masakari.engine import rpcapi as engine_rpcapi
 from masakari import exception
@@ -37,7 +38,8 @@ from masakari.tests.unit.objects import test_objects
 from masakari.tests import uuidsentinel
 
 NOW = timeutils.utcnow().replace(microsecond=0)
-OPTIONAL = ['recovery_workflow_details']
+OPTIONAL = ['recovery_workflow_details', 'idempotency_key',
+            'idempotency_fingerprint', 'fencing_token']
 
 
 def _make_notification_obj(notification_dict):
@@ -63,6 +65,8 @@ NOTIFICATION_DATA = {"type": "VM", "id": 1,
                      "notification_uuid": uuidsentinel.fake_notification,
                      "failover_segment_uuid": uuidsentinel.fake_segment,
                      "message": None,
+                     "idempotency_key": None,
+                     "fencing_token": None,
                      "created_at": NOW,
                      "updated_at": None,
                      "deleted_at": None,
@@ -131,6 +135,15 @@ class NotificationTestCase(base.TestCase):
         self.assertTrue(obj_base.obj_equal_prims(expected, actual),
                         "The notifications objects were not equal")
 
+    def _expected_notification(self, notification):
+        # The fencing token is never returned and the idempotency key only
+        # starting with microversion 1.4
+        notification = notification.obj_clone()
+        delattr(notification, 'fencing_token')
+        if not api_version_request.is_supported(self.req, min_version='1.4'):
+            delattr(notification, 'idempotency_key')
+        return notification
+
     @mock.patch.object(ha_api.NotificationAPI, 'get_all')
     def test_index(self, mock_get_all):
 
@@ -411,8 +424,9 @@ class NotificationTestCase(base.TestCase):
 
         result = self.controller.show(self.req, uuidsentinel.fake_notification)
         result = result['notification']
-        self._assert_notification_data(NOTIFICATION,
-                                       _make_notification_obj(result))
+        self._assert_notification_data(
+            self._expected_notification(NOTIFICATION),
+            _make_notification_obj(result))
 
     @mock.patch.object(ha_api.NotificationAPI, 'get_notification')
     def test_show_with_non_existing_uuid(self, mock_get_notification):
@@ -503,5 +517,192 @@ class NotificationV1_1_TestCase(NotificationTestCase):
         result = result['notification']
         self.assertCountEqual([RECOVERY_OBJ],
                               result.recovery_workflow_details)
-        self._assert_notification_data(NOTIFICATION_WITH_PROGRESS_DETAILS,
-                                       _make_notification_obj(result))
+        self._assert_notification_data(
+            self._expected_notification(NOTIFICATION_WITH_PROGRESS_DETAILS),
+            _make_notification_obj(result))
+
+
+class NotificationV1_4_TestCase(NotificationV1_1_TestCase):
+    """Test Case for notifications api for 1.4 API"""
+    api_version = '1.4'
+
+    def _create_body(self):
+        return {"notification": {
+            "hostname": "fake_host",
+            "payload": {"process_name": "nova-compute",
+                        "event": "STOPPED"},
+            "type": "PROCESS",
+            "generated_time": "2016-09-13T09:11:21.656788"}}
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_create_with_idempotency_key(self, mock_create):
+        mock_create.return_value = NOTIFICATION
+        self.req.headers['Idempotency-Key'] = 'fake-key'
+        body = self._create_body()
+
+        self.controller.create(self.req, body=body)
+
+        mock_create.assert_called_once_with(
+            self.context, body['notification'], idempotency_key='fake-key')
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_create_idempotency_key_ignored_before_1_4(self, mock_create):
+        mock_create.return_value = NOTIFICATION
+        req = fakes.HTTPRequest.blank('/v1/notifications',
+                                      use_admin_context=True,
+                                      version='1.3')
+        req.headers['Idempotency-Key'] = 'fake-key'
+        body = self._create_body()
+
+        self.controller.create(req, body=body)
+
+        mock_create.assert_called_once_with(
+            req.environ['masakari.context'], body['notification'],
+            idempotency_key=None)
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_create_returns_idempotency_key(self, mock_create):
+        notification = _make_notification_obj(
+            dict(NOTIFICATION_DATA, idempotency_key='fake-key',
+                 idempotency_fingerprint='fake-fingerprint'))
+        mock_create.return_value = notification
+        self.req.headers['Idempotency-Key'] = 'fake-key'
+
+        result = self.controller.create(self.req, body=self._create_body())
+
+        self.assertEqual('fake-key',
+                         result['notification'].idempotency_key)
+        self.assertFalse(result['notification'].obj_attr_is_set(
+            'idempotency_fingerprint'))
+
+    @mock.patch.object(ha_api.NotificationAPI, 'get_notification')
+    @mock.patch.object(ha_api.NotificationAPI, 'get_all')
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_idempotency_key_hidden_before_1_4(self, mock_create,
+                                               mock_get_all, mock_get):
+        notification = _make_notification_obj(
+            dict(NOTIFICATION_DATA, idempotency_key='fake-key'))
+        mock_create.return_value = notification
+        mock_get_all.return_value = [notification]
+        mock_get.return_value = notification
+        req = fakes.HTTPRequest.blank('/v1/notifications',
+                                      use_admin_context=True,
+                                      version='1.0')
+
+        results = [
+            self.controller.create(req, body=self._create_body())[
+                'notification'],
+            self.controller.index(req)['notifications'][0],
+            self.controller.show(req, uuidsentinel.fake_notification)[
+                'notification']]
+
+        for result in results:
+            self.assertFalse(result.obj_attr_is_set('idempotency_key'))
+        self.assertEqual('fake-key', notification.idempotency_key)
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_create_idempotency_key_reused(self, mock_create):
+        mock_create.side_effect = exception.IdempotencyKeyReused(
+            key='fake-key')
+        self.req.headers['Idempotency-Key'] = 'fake-key'
+
+        self.assertRaises(exc.HTTPConflict, self.controller.create,
+                          self.req, body=self._create_body())
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_create_with_invalid_idempotency_key(self, mock_create):
+        for key in ('', 'x' * 256):
+            self.req.headers['Idempotency-Key'] = key
+            self.assertRaises(exc.HTTPBadRequest, self.controller.create,
+                              self.req, body=self._create_body())
+        mock_create.assert_not_called()
+
+
+class NotificationV1_5_TestCase(NotificationV1_4_TestCase):
+    """Test Case for notifications api for 1.5 API"""
+    api_version = '1.5'
+
+    def _batch_body(self):
+        return {"notifications": [self._create_body()["notification"],
+                                  self._create_body()["notification"],
+                                  self._create_body()["notification"],
+                                  self._create_body()["notification"]]}
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notifications')
+    def test_batch(self, mock_create_notifications):
+        mock_create_notifications.return_value = [
+            NOTIFICATION,
+            exception.HostNotFoundByName(host_name='fake_host'),
+            exception.DuplicateNotification(type='PROCESS'),
+            exception.HostOnMaintenanceError(host_name='fake_host')]
+        body = self._batch_body()
+
+        result = self.controller.batch(self.req, body=body)
+
+        self.assertEqual(
+            [HTTPStatus.ACCEPTED, HTTPStatus.BAD_REQUEST,
+             HTTPStatus.CONFLICT, HTTPStatus.CONFLICT],
+            [item['code'] for item in result['notifications']])
+        self._assert_notification_data(
+            self._expected_notification(NOTIFICATION),
+            result['notifications'][0]['notification'])
+        self.assertIn('fake_host', result['notifications'][1]['message'])
+        mock_create_notifications.assert_called_once_with(
+            self.context, body['notifications'])
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notifications')
+    def test_batch_invalid_body(self, mock_create_notifications):
+        for body in ({"notifications": []},
+                     {"notification": self._create_body()["notification"]},
+                     {"notifications": [{"hostname": "fake_host"}]}):
+            self.assertRaises(exception.ValidationError,
+                              self.controller.batch, self.req, body=body)
+        mock_create_notifications.assert_not_called()
+
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notifications')
+    def test_batch_invalid_payload(self, mock_create_notifications):
+        body = self._batch_body()
+        body["notifications"][1]["payload"] = {"event": "STOPPED"}
+
+        self.assertRaises(exception.ValidationError, self.controller.batch,
+                          self.req, body=body)
+        mock_create_notifications.assert_not_called()
+
+    @mock.patch.object(ha_api.NotificationAPI,
+                       'get_notification_recovery_workflow_details')
+    @mock.patch.object(ha_api.NotificationAPI, 'get_all')
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notifications')
+    @mock.patch.object(ha_api.NotificationAPI, 'create_notification')
+    def test_fencing_token_hidden(self, mock_create,
+                                  mock_create_notifications, mock_get_all,
+                                  mock_get):
+        notification = _make_notification_obj(
+            dict(NOTIFICATION_DATA, fencing_token=7))
+        mock_create.return_value = notification
+        mock_create_notifications.return_value = [notification]
+        mock_get_all.return_value = [notification]
+        mock_get.return_value = notification
+
+        results = [
+            self.controller.create(self.req, body=self._create_body())[
+                'notification'],
+            self.controller.batch(self.req, body={
+                "notifications": [self._create_body()["notification"]]})[
+                'notifications'][0]['notification'],
+            self.controller.index(self.req)['notifications'][0],
+            self.controller.show(self.req, uuidsentinel.fake_notification)[
+                'notification']]
+
+        for result in results:
+            self.assertFalse(result.obj_attr_is_set('fencing_token'))
+            self.assertNotIn('fencing_token', jsonutils.dumps(result))
+        self.assertEqual(7, notification.fencing_token)
+
+    def test_batch_before_1_5(self):
+        req = fakes.HTTPRequest.blank('/v1/notifications/batch',
+                                      use_admin_context=True,
+                                      version='1.4')
+
+        self.assertRaises(exception.VersionNotFoundForAPIMethod,
+                          self.controller.batch, req,
+                          body=self._batch_body())
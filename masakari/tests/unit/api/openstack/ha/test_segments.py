@@ -35,7 +35,7 @@ def _make_segment_obj(segment_dict):
 
 
 def _make_segments_list(segments_list):
-    return segment_obj.FailoverSegment(objects=[
+    return segment_obj.FailoverSegmentList(objects=[
         _make_segment_obj(a) for a in segments_list])
 
 
@@ -83,7 +83,7 @@ class FailoverSegmentTestCase(base.TestCase):
 
         result = self.controller.index(self.req)
         result = result['segments']
-        self.assertEqual(FAILOVER_SEGMENT_LIST, result)
+        self.assertEqual(FAILOVER_SEGMENT_LIST.objects, result)
 
     @mock.patch('masakari.ha.api.FailoverSegmentAPI.get_all')
     def test_index_marker_not_found(self, mock_get_all):
@@ -385,6 +385,44 @@ class FailoverSegmentTestCase(base.TestCase):
         result = result['segment']
         self.assertEqual(FAILOVER_SEGMENT, result)
 
+    @mock.patch('masakari.ha.api.FailoverSegmentAPI.update_segment')
+    @mock.patch('masakari.ha.api.FailoverSegmentAPI.create_segment')
+    @mock.patch('masakari.ha.api.FailoverSegmentAPI.get_segment')
+    @mock.patch('masakari.ha.api.FailoverSegmentAPI.get_all')
+    def _test_active_notifications(self, version, mock_get_all, mock_get,
+                                   mock_create, mock_update):
+        segment = _make_segment_obj(dict(
+            FAILOVER_SEGMENT.obj_to_primitive()['masakari_object.data'],
+            active_notifications=2))
+        mock_get_all.return_value = [segment]
+        mock_get.return_value = segment
+        mock_create.return_value = segment
+        mock_update.return_value = segment
+        req = fakes.HTTPRequest.blank('/v1/segments',
+                                      use_admin_context=True,
+                                      version=version)
+        body = {"segment": {"name": "segment1",
+                            "service_type": "COMPUTE",
+                            "recovery_method": "auto"}}
+
+        results = [
+            self.controller.index(req)['segments'][0],
+            self.controller.show(req, uuidsentinel.fake_segment)['segment'],
+            self.controller.create(req, body=body)['segment'],
+            self.controller.update(req, uuidsentinel.fake_segment,
+                                   body=body)['segment']]
+
+        self.assertEqual(2, segment.active_notifications)
+        return results
+
+    def test_active_notifications_hidden_before_1_6(self):
+        for result in self._test_active_notifications('1.5'):
+            self.assertFalse(result.obj_attr_is_set('active_notifications'))
+
+    def test_active_notifications(self):
+        for result in self._test_active_notifications('1.6'):
+            self.assertEqual(2, result.active_notifications)
+
     @mock.patch('masakari.ha.api.FailoverSegmentAPI.delete_segment')
     def test_delete_segment(self, mock_delete):
 
@@ -13,7 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import socket
 import testtools
 from unittest import mock
 
@@ -49,7 +48,7 @@ class TestApiUtils(testtools.TestCase):
         mock_SegmentApiNotification.return_value = mock_api_notification
         mock_api_notification.emit.return_value = None
         mock_publisher = mock.Mock()
-        mock_NotificationPublisher.return_value = mock_publisher
+        mock_NotificationPublisher.from_binary.return_value = mock_publisher
         mock_event_type = mock.Mock()
         mock_EventType.return_value = mock_event_type
 
@@ -71,9 +70,8 @@ class TestApiUtils(testtools.TestCase):
             publisher=mock_publisher,
             event_type=mock_event_type,
             payload=mock_payload)
-        mock_NotificationPublisher.assert_called_once_with(
-            context=mock_context, host=socket.gethostname(),
-            binary='masakari-api')
+        mock_NotificationPublisher.from_binary.assert_called_once_with(
+            'masakari-api')
         mock_EventType.assert_called_once_with(
             action=action, phase=phase)
         mock_api_notification.emit.assert_called_once_with(mock_context)
@@ -95,7 +93,7 @@ class TestApiUtils(testtools.TestCase):
         mock_HostApiNotification.return_value = mock_api_notification
         mock_api_notification.emit.return_value = None
         mock_publisher = mock.Mock()
-        mock_NotificationPublisher.return_value = mock_publisher
+        mock_NotificationPublisher.from_binary.return_value = mock_publisher
         mock_event_type = mock.Mock()
         mock_EventType.return_value = mock_event_type
 
@@ -117,9 +115,8 @@ class TestApiUtils(testtools.TestCase):
             publisher=mock_publisher,
             event_type=mock_event_type,
             payload=mock_payload)
-        mock_NotificationPublisher.assert_called_once_with(
-            context=mock_context, host=socket.gethostname(),
-            binary='masakari-api')
+        mock_NotificationPublisher.from_binary.assert_called_once_with(
+            'masakari-api')
         mock_api_notification.emit.assert_called_once_with(mock_context)
         mock_EventType.assert_called_once_with(
             action=action, phase=phase)
@@ -142,7 +139,7 @@ class TestApiUtils(testtools.TestCase):
         mock_NotificationApiNotification.return_value = mock_api_notification
         mock_api_notification.emit.return_value = None
         mock_publisher = mock.Mock()
-        mock_NotificationPublisher.return_value = mock_publisher
+        mock_NotificationPublisher.from_binary.return_value = mock_publisher
         mock_event_type = mock.Mock()
         mock_EventType.return_value = mock_event_type
 
@@ -164,7 +161,6 @@ class TestApiUtils(testtools.TestCase):
             publisher=mock_publisher,
             event_type=mock_event_type,
             payload=mock_payload)
-        mock_NotificationPublisher.assert_called_once_with(
-            context=mock_context, host=socket.gethostname(),
-            binary='masakari-api')
+        mock_NotificationPublisher.from_binary.assert_called_once_with(
+            'masakari-api')
         mock_api_notification.emit.assert_called_once_with(mock_context)
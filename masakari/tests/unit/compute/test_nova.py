@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 from http import HTTPStatus
 from unittest import mock
 
@@ -42,6 +43,8 @@ class NovaClientTestCase(base.TestCase):
         self.override_config('os_privileged_user_password', 'strongpassword')
         self.override_config('os_privileged_user_auth_url',
                              'http://keystonehost/identity')
+        nova.CLIENT_POOL.reset()
+        self.addCleanup(nova.CLIENT_POOL.reset)
 
     @mock.patch('novaclient.api_versions.APIVersion')
     @mock.patch('novaclient.client.Client')
@@ -145,6 +148,71 @@ class NovaClientTestCase(base.TestCase):
             system_scope='all', username='adminuser'
         )
 
+    @mock.patch('novaclient.api_versions.APIVersion')
+    @mock.patch('novaclient.client.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    @mock.patch('keystoneauth1.session.Session')
+    def test_nova_client_reused_from_pool(self, p_session, p_plugin_loader,
+                                          p_client, p_api_version):
+        client_1 = nova.novaclient(self.ctx)
+        client_2 = nova.novaclient(self.ctx)
+
+        self.assertIs(client_1, client_2)
+        p_session.assert_called_once()
+        p_client.assert_called_once()
+        self.assertEqual({'hits': 1, 'misses': 1, 'sessions': 1,
+                          'clients': 1}, nova.CLIENT_POOL.stats())
+
+    @mock.patch('novaclient.api_versions.APIVersion')
+    @mock.patch('novaclient.client.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    @mock.patch('keystoneauth1.session.Session')
+    def test_nova_client_session_shared_across_requests(
+            self, p_session, p_plugin_loader, p_client, p_api_version):
+        other_ctx = context.RequestContext(
+            user_id='adminuser', project_id='e3f0833dc08b4cea',
+            auth_token='token', is_admin=True)
+
+        nova.novaclient(self.ctx)
+        nova.novaclient(other_ctx)
+
+        # One keystone session (and token) for both requests, one client
+        # per global request id.
+        p_session.assert_called_once()
+        self.assertEqual(2, p_client.call_count)
+        p_session.return_value.session.mount.assert_any_call(
+            'https://', mock.ANY)
+        self.assertEqual({'hits': 0, 'misses': 2, 'sessions': 1,
+                          'clients': 2}, nova.CLIENT_POOL.stats())
+
+    @mock.patch('novaclient.api_versions.APIVersion')
+    @mock.patch('novaclient.client.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    @mock.patch('keystoneauth1.session.Session')
+    def test_nova_client_new_session_on_credential_change(
+            self, p_session, p_plugin_loader, p_client, p_api_version):
+        nova.novaclient(self.ctx)
+        self.override_config('os_privileged_user_password', 'newpassword')
+        nova.novaclient(self.ctx)
+
+        self.assertEqual(2, p_session.call_count)
+        self.assertEqual(2, nova.CLIENT_POOL.stats()['sessions'])
+
+    @mock.patch('novaclient.api_versions.APIVersion')
+    @mock.patch('novaclient.client.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    @mock.patch('keystoneauth1.session.Session')
+    def test_nova_client_cache_size_bounded(self, p_session, p_plugin_loader,
+                                            p_client, p_api_version):
+        self.override_config('nova_client_cache_size', 1)
+        nova.novaclient(self.ctx)
+        nova.novaclient(self.ctx, timeout=10)
+        nova.novaclient(self.ctx)
+
+        self.assertEqual(3, p_client.call_count)
+        self.assertEqual({'hits': 0, 'misses': 3, 'sessions': 1,
+                          'clients': 1}, nova.CLIENT_POOL.stats())
+
 
 class NovaApiTestCase(base.TestCase):
     def setUp(self):
@@ -197,6 +265,19 @@ class NovaApiTestCase(base.TestCase):
         mock_servers.list.assert_called_once_with(
             detailed=True, search_opts={'host': 'fake', 'all_tenants': True})
 
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_get_servers_changed_since(self, mock_novaclient):
+        since = datetime.datetime(2016, 1, 1, 10, 0, 0)
+        mock_servers = mock.MagicMock()
+        mock_novaclient.return_value = mock.MagicMock(servers=mock_servers)
+        self.api.get_servers_changed_since(self.ctx, since)
+
+        mock_novaclient.assert_called_once_with(self.ctx)
+        mock_servers.list.assert_called_once_with(
+            detailed=True, limit=-1,
+            search_opts={'changes-since': '2016-01-01T10:00:00',
+                         'all_tenants': True})
+
     @mock.patch('masakari.compute.nova.novaclient')
     def test_enable_disable_service_enable(self, mock_novaclient):
         host = 'fake'
@@ -249,6 +330,39 @@ class NovaApiTestCase(base.TestCase):
         mock_services.list.assert_called_once_with(binary='nova-compute',
                                                    host='fake')
 
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_is_service_down(self, mock_novaclient):
+        mock_services = mock.MagicMock()
+        mock_novaclient.return_value = mock.MagicMock(services=mock_services)
+        mock_services.list.return_value = [
+            mock.MagicMock(state='up', forced_down=False)]
+        self.assertFalse(
+            self.api.is_service_down(self.ctx, 'fake', 'nova-compute'))
+
+        mock_services.list.return_value = [
+            mock.MagicMock(state='down', forced_down=False)]
+        self.assertTrue(
+            self.api.is_service_down(self.ctx, 'fake', 'nova-compute'))
+
+        mock_services.list.return_value = [
+            mock.MagicMock(state='up', forced_down=True)]
+        self.assertTrue(
+            self.api.is_service_down(self.ctx, 'fake', 'nova-compute'))
+        mock_services.list.assert_called_with(binary='nova-compute',
+                                              host='fake')
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_force_down_service(self, mock_novaclient):
+        mock_services = mock.MagicMock()
+        mock_novaclient.return_value = mock.MagicMock(services=mock_services)
+        mock_services.list.return_value = [mock.MagicMock(id='fake_id')]
+        self.api.force_down_service(self.ctx, 'fake', 'nova-compute')
+
+        mock_novaclient.assert_called_once_with(self.ctx)
+        mock_services.list.assert_called_once_with(binary='nova-compute',
+                                                   host='fake')
+        mock_services.force_down.assert_called_once_with('fake_id', True)
+
     @mock.patch('masakari.compute.nova.novaclient')
     def test_evacuate_instance(self, mock_novaclient):
         uuid = uuidsentinel.fake_server
@@ -36,4 +36,6 @@ class ConfFixture(config_fixture.Config):
         config.parse_args([], default_config_files=[], configure_db=False,
                           init_rpc=False)
         self.conf.set_default('connection', "sqlite://", group='database')
+        # Send the versioned notifications as they are emitted.
+        self.conf.set_default('emitter_queue_size', 0, group='notifications')
         policy_opts.set_defaults(self.conf)
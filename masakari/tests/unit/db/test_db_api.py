@@ -12,7 +12,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """Unit tests for the DB API."""
+import datetime
+from unittest import mock
+
 from oslo_utils import timeutils
+from oslo_utils import uuidutils
+from sqlalchemy.dialects.sqlite import base as sqlite_base
 
 from masakari import context
 from masakari import db
@@ -89,8 +94,9 @@ class FailoverSegmentsTestCase(base.TestCase, ModelsObjectComparatorMixin):
         failover_segment = self._create_failover_segment(self.
                                                          _get_fake_values())
         self.assertIsNotNone(failover_segment['id'])
+        self.assertEqual(0, failover_segment['active_notifications'])
         ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
-                        'id']
+                        'id', 'active_notifications']
         self._assertEqualObjects(failover_segment, self._get_fake_values(),
                                  ignored_keys)
 
@@ -114,7 +120,8 @@ class FailoverSegmentsTestCase(base.TestCase, ModelsObjectComparatorMixin):
                    'service_type': 'fake_service_type',
                    'description': 'updated_desc',
                    'recovery_method': 'auto',
-                   'enabled': False}
+                   'enabled': False,
+                   'active_notifications': 0}
         ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
                         'id']
         self._create_failover_segment(self._get_fake_values())
@@ -130,6 +137,49 @@ class FailoverSegmentsTestCase(base.TestCase, ModelsObjectComparatorMixin):
                           db.failover_segment_get_by_uuid, self.ctxt,
                           uuidsentinel.fake_uuid)
 
+    def _create_notification(self, status, source_host_uuid=None):
+        return db.notification_create(self.ctxt, {
+            'notification_uuid': uuidutils.generate_uuid(),
+            'generated_time': NOW,
+            'source_host_uuid': (source_host_uuid or
+                                 uuidsentinel.source_host),
+            'type': 'COMPUTE_HOST',
+            'payload': 'fake_payload',
+            'status': status,
+            'failover_segment_uuid': uuidsentinel.fake_uuid})
+
+    def test_is_failover_segment_under_recovery(self):
+        filters = {'status': ['new', 'running', 'error']}
+        self._create_failover_segment(self._get_fake_values())
+        self.assertFalse(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters=filters))
+
+        notification = self._create_notification('finished')
+        self.assertFalse(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters=filters))
+
+        notification = self._create_notification('new')
+        self.assertTrue(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters=filters))
+
+        db.notification_update(self.ctxt, notification['notification_uuid'],
+                               {'status': 'finished'})
+        self.assertFalse(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters=filters))
+
+    def test_is_failover_segment_under_recovery_other_status(self):
+        self._create_failover_segment(self._get_fake_values())
+        db.host_create(self.ctxt, {
+            'uuid': uuidsentinel.source_host, 'name': 'fake_host',
+            'type': 'fake_type', 'control_attributes': 'fake_attributes',
+            'failover_segment_id': uuidsentinel.fake_uuid})
+        self._create_notification('new')
+
+        self.assertFalse(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters={'status': 'failed'}))
+        self.assertTrue(db.is_failover_segment_under_recovery(
+            self.ctxt, uuidsentinel.fake_uuid, filters={'status': 'new'}))
+
     def test_failover_segment_get_all_by_filters(self):
         failover_segments = [self._create_failover_segment(p)
                              for p in self._get_fake_values_list()]
@@ -326,6 +376,18 @@ class HostsTestCase(base.TestCase, ModelsObjectComparatorMixin):
             sort_dirs=['asc'])
         self._assertEqualListsOfObjects([hosts[1]], real_host, ignored_keys)
 
+    def test_host_get_all_by_filters_name(self):
+        hosts = [self._create_host(p) for p in self._get_fake_values_list()]
+        ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
+                        'failover_segment']
+
+        real_hosts = db.host_get_all_by_filters(
+            context=self.ctxt, filters={'name': ['name_1', 'name_3']},
+            sort_keys=['id'], sort_dirs=['asc'])
+
+        self._assertEqualListsOfObjects([hosts[0], hosts[2]], real_hosts,
+                                        ignored_keys)
+
     def test_host_get_all_by_filter_on_maintenance(self):
         for p in self._get_fake_values_list():
             # create temporary reserved_hosts, all are on maintenance
@@ -359,6 +421,9 @@ class HostsTestCase(base.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.HostNotFound,
                           db.host_delete, self.ctxt,
                           uuidsentinel.uuid_4)
+        self.assertRaises(exception.HostNotFound,
+                          db.host_update, self.ctxt,
+                          uuidsentinel.uuid_4, {'reserved': False})
 
     def test_invalid_marker(self):
         [self._create_host(p) for p in self._get_fake_values_list()]
@@ -399,7 +464,11 @@ class NotificationsTestCase(base.TestCase, ModelsObjectComparatorMixin):
             'payload': 'fake_payload',
             'status': 'new',
             'failover_segment_uuid': uuidsentinel.fake_segment,
-            'message': None
+            'message': None,
+            'payload_hash': None,
+            'dedup_key': None,
+            'idempotency_key': None,
+            'idempotency_fingerprint': None
         }
 
     def _get_fake_values_list(self):
@@ -436,8 +505,9 @@ class NotificationsTestCase(base.TestCase, ModelsObjectComparatorMixin):
     def test_notification_create(self):
         notification = self._create_notification(self._get_fake_values())
         self.assertIsNotNone(notification['id'])
+        self.assertIsNone(notification['owner'])
         ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
-                        'id']
+                        'id', 'owner', 'lease_expires_at', 'fencing_token']
         self._assertEqualObjects(notification, self._get_fake_values(),
                                  ignored_keys)
 
@@ -457,7 +527,14 @@ class NotificationsTestCase(base.TestCase, ModelsObjectComparatorMixin):
                    'payload': 'updated_payload',
                    'status': 'new',
                    'failover_segment_uuid': uuidsentinel.fake_segment,
-                   'message': None}
+                   'message': None,
+                   'payload_hash': None,
+                   'dedup_key': None,
+                   'idempotency_key': None,
+                   'idempotency_fingerprint': None,
+                   'owner': None,
+                   'lease_expires_at': None,
+                   'fencing_token': None}
         ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
                         'id']
         self._create_notification(self._get_fake_values())
@@ -488,6 +565,310 @@ class NotificationsTestCase(base.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects([notifications[1]],
                                         real_notification, ignored_keys)
 
+    def test_notification_duplicate_exists(self):
+        values = self._get_fake_values()
+        values['payload_hash'] = 'fake_hash'
+        self._create_notification(values)
+        since = NOW - datetime.timedelta(seconds=180)
+
+        self.assertTrue(db.notification_duplicate_exists(
+            self.ctxt, 'fake_type', uuidsentinel.source_host, 'fake_hash',
+            since))
+        self.assertFalse(db.notification_duplicate_exists(
+            self.ctxt, 'fake_type', uuidsentinel.other_host, 'fake_hash',
+            since))
+        self.assertFalse(db.notification_duplicate_exists(
+            self.ctxt, 'other_type', uuidsentinel.source_host, 'fake_hash',
+            since))
+        self.assertFalse(db.notification_duplicate_exists(
+            self.ctxt, 'fake_type', uuidsentinel.source_host, 'other_hash',
+            since))
+        self.assertFalse(db.notification_duplicate_exists(
+            self.ctxt, 'fake_type', uuidsentinel.source_host, 'fake_hash',
+            NOW + datetime.timedelta(seconds=1)))
+
+    def test_notification_create_duplicate_dedup_key(self):
+        values = self._get_fake_values()
+        values['dedup_key'] = 'fake_key'
+        self._create_notification(values)
+
+        values['notification_uuid'] = uuidsentinel.notification_2
+        self.assertRaises(exception.DuplicateNotification,
+                          self._create_notification, values)
+
+        values['dedup_key'] = 'other_key'
+        self._create_notification(values)
+
+    def test_notification_get_by_idempotency_key(self):
+        values = self._get_fake_values()
+        values['idempotency_key'] = 'fake-key'
+        notification = self._create_notification(values)
+        since = timeutils.utcnow() - datetime.timedelta(seconds=600)
+
+        result = db.notification_get_by_idempotency_key(
+            self.ctxt, 'fake-key', since)
+
+        self._assertEqualObjects(notification, result)
+        self.assertRaises(exception.NotificationNotFound,
+                          db.notification_get_by_idempotency_key,
+                          self.ctxt, 'other-key', since)
+        self.assertRaises(exception.NotificationNotFound,
+                          db.notification_get_by_idempotency_key,
+                          self.ctxt, 'fake-key',
+                          timeutils.utcnow() + datetime.timedelta(seconds=1))
+
+    def test_notification_get_all_by_filters_payload_hash(self):
+        values_list = self._get_fake_values_list()
+        for values, payload_hash in zip(values_list, ['hash_1', 'hash_2',
+                                                      'hash_1']):
+            values['payload_hash'] = payload_hash
+        notifications = [self._create_notification(p) for p in values_list]
+
+        real_notifications = db.notifications_get_all_by_filters(
+            context=self.ctxt,
+            filters={'source_host_uuid': [uuidsentinel.s_host_1,
+                                          uuidsentinel.s_host_2],
+                     'payload_hash': ['hash_1']})
+
+        self._assertEqualListsOfObjects([notifications[0]],
+                                        real_notifications)
+
+    def test_notification_create_many(self):
+        values_list = self._get_fake_values_list()
+        for values in values_list:
+            values.pop('id')
+            values['dedup_key'] = values['notification_uuid']
+        self._create_notification(dict(values_list[1]))
+        values_list[1]['notification_uuid'] = uuidsentinel.notification_4
+
+        notifications = db.notification_create_many(self.ctxt, values_list)
+
+        self.assertEqual([uuidsentinel.notification_1,
+                          uuidsentinel.notification_3],
+                         [n['notification_uuid'] for n in notifications])
+        self.assertEqual(
+            3, len(db.notifications_get_all_by_filters(self.ctxt)))
+
+    def _get_active_notifications(self):
+        return db.failover_segment_get_by_uuid(
+            self.ctxt, uuidsentinel.fake_segment)['active_notifications']
+
+    def test_notification_active_notifications(self):
+        db.failover_segment_create(self.ctxt, {
+            'uuid': uuidsentinel.fake_segment, 'name': 'fake_segment',
+            'service_type': 'COMPUTE', 'recovery_method': 'auto'})
+        values_list = self._get_fake_values_list()
+        for values in values_list:
+            values.pop('id')
+        notifications = db.notification_create_many(self.ctxt,
+                                                    values_list[:2])
+        self._create_notification(values_list[2])
+        self.assertEqual(2, self._get_active_notifications())
+
+        db.notification_update(self.ctxt,
+                               notifications[0]['notification_uuid'],
+                               {'status': 'running'})
+        self.assertEqual(2, self._get_active_notifications())
+
+        db.notification_update(self.ctxt,
+                               notifications[0]['notification_uuid'],
+                               {'status': 'finished'})
+        self.assertEqual(1, self._get_active_notifications())
+
+        db.notification_update(self.ctxt,
+                               notifications[0]['notification_uuid'],
+                               {'status': 'error'})
+        self.assertEqual(2, self._get_active_notifications())
+
+        db.notification_delete(self.ctxt,
+                               notifications[1]['notification_uuid'])
+        db.notification_delete(self.ctxt, uuidsentinel.notification_3)
+        self.assertEqual(1, self._get_active_notifications())
+
+    def _create_notifications_generated(self, statuses_and_ages):
+        db.failover_segment_create(self.ctxt, {
+            'uuid': uuidsentinel.fake_segment, 'name': 'fake_segment',
+            'service_type': 'COMPUTE', 'recovery_method': 'auto'})
+        notifications = []
+        for status, age in statuses_and_ages:
+            values = self._get_fake_values()
+            values.update(notification_uuid=uuidutils.generate_uuid(),
+                          status=status,
+                          generated_time=NOW - datetime.timedelta(
+                              seconds=age))
+            notifications.append(self._create_notification(values))
+        return [n['notification_uuid'] for n in notifications]
+
+    def _claim(self, owner, lease_time=300, limit=10):
+        notifications = db.notifications_claim(
+            self.ctxt, owner,
+            timeutils.utcnow() + datetime.timedelta(seconds=lease_time),
+            NOW - datetime.timedelta(seconds=300), limit)
+        return sorted(n['notification_uuid'] for n in notifications)
+
+    def _get_owners(self, uuids):
+        return [db.notification_get_by_uuid(self.ctxt, uuid)['owner']
+                for uuid in uuids]
+
+    def test_notifications_claim(self):
+        uuids = self._create_notifications_generated(
+            [('new', 600), ('new', 60), ('error', 60), ('running', 600),
+             ('failed', 600)])
+
+        self.assertEqual(sorted([uuids[0], uuids[2]]),
+                         self._claim('engine-1'))
+        self.assertEqual(['engine-1', None, 'engine-1', None, None],
+                         self._get_owners(uuids))
+        # Claimed notifications aren't claimed by another engine.
+        self.assertEqual([], self._claim('engine-2'))
+
+    def test_notifications_claim_limit(self):
+        uuids = self._create_notifications_generated(
+            [('error', 0), ('error', 0), ('error', 0)])
+
+        first = self._claim('engine-1', limit=2)
+        second = self._claim('engine-2', limit=2)
+
+        self.assertEqual(2, len(first))
+        self.assertEqual(1, len(second))
+        self.assertEqual(sorted(uuids), sorted(first + second))
+
+    def test_notifications_claim_expired_lease(self):
+        uuids = self._create_notifications_generated([('error', 0)])
+        self.assertEqual(uuids, self._claim('engine-1', lease_time=-1))
+
+        self.assertEqual(uuids, self._claim('engine-2'))
+        self.assertEqual(['engine-2'], self._get_owners(uuids))
+
+    def test_notifications_claim_running_expired_lease(self):
+        uuids = self._create_notifications_generated(
+            [('running', 0), ('running', 0), ('running', 0)])
+        # The engine recovering the first notification stopped, the second
+        # one is still being recovered and the third one has no lease.
+        db.notification_update(
+            self.ctxt, uuids[0],
+            {'owner': 'engine-1',
+             'lease_expires_at': timeutils.utcnow() - datetime.timedelta(
+                 seconds=1)})
+        db.notification_update(
+            self.ctxt, uuids[1],
+            {'owner': 'engine-1',
+             'lease_expires_at': timeutils.utcnow() + datetime.timedelta(
+                 seconds=300)})
+
+        self.assertEqual([uuids[0]], self._claim('engine-2'))
+        self.assertEqual(['engine-2', 'engine-1', None],
+                         self._get_owners(uuids))
+
+    def test_notifications_renew_leases(self):
+        uuids = self._create_notifications_generated(
+            [('error', 0), ('error', 0), ('error', 0)])
+        self._claim('engine-1', lease_time=-1)
+        db.notification_update(self.ctxt, uuids[1], {'status': 'running'})
+        db.notification_update(self.ctxt, uuids[2], {'status': 'finished'})
+
+        self.assertEqual(2, db.notifications_renew_leases(
+            self.ctxt, 'engine-1',
+            timeutils.utcnow() + datetime.timedelta(seconds=300)))
+        self.assertEqual([], self._claim('engine-2'))
+
+    def test_notifications_release(self):
+        uuids = self._create_notifications_generated(
+            [('error', 0), ('error', 0)])
+        self._claim('engine-1')
+        db.notification_update(self.ctxt, uuids[1], {'status': 'running'})
+
+        self.assertEqual(1, db.notifications_release(self.ctxt, 'engine-1'))
+        # The running notification is kept until it is recovered.
+        self.assertEqual([None, 'engine-1'], self._get_owners(uuids))
+        self.assertEqual([uuids[0]], self._claim('engine-2'))
+
+    def test_notifications_expire(self):
+        uuids = self._create_notifications_generated(
+            [('new', 600), ('running', 600), ('error', 600), ('new', 60),
+             ('finished', 600)])
+        self.assertEqual(4, self._get_active_notifications())
+
+        expired = db.notifications_expire(
+            self.ctxt, NOW - datetime.timedelta(seconds=300))
+
+        self.assertEqual(sorted(uuids[:3]), sorted(expired))
+        self.assertEqual(
+            ['failed', 'failed', 'failed', 'new', 'finished'],
+            [db.notification_get_by_uuid(self.ctxt, uuid)['status']
+             for uuid in uuids])
+        self.assertEqual(1, self._get_active_notifications())
+        self.assertEqual([], db.notifications_expire(
+            self.ctxt, NOW - datetime.timedelta(seconds=300)))
+
+    def test_notification_update_expected_status(self):
+        uuids = self._create_notifications_generated([('new', 0)])
+        self.assertEqual(1, self._get_active_notifications())
+
+        notification = db.notification_update(
+            self.ctxt, uuids[0], {'status': 'running'},
+            expected_status='new')
+        self.assertEqual('running', notification['status'])
+        self.assertEqual(1, self._get_active_notifications())
+
+        exc = self.assertRaises(exception.UnexpectedNotificationStatus,
+                                db.notification_update, self.ctxt, uuids[0],
+                                {'status': 'running'}, expected_status='new')
+        self.assertEqual('running', exc.kwargs['actual'])
+
+        notification = db.notification_update(
+            self.ctxt, uuids[0], {'status': 'finished'},
+            expected_status='running')
+        self.assertEqual('finished', notification['status'])
+        self.assertEqual(0, self._get_active_notifications())
+        self.assertRaises(exception.NotificationNotFound,
+                          db.notification_update, self.ctxt,
+                          uuidsentinel.fake_uuid, {'status': 'running'},
+                          expected_status='new')
+
+    def test_notification_update_fencing_token(self):
+        uuids = self._create_notifications_generated([('new', 0)])
+
+        notification = db.notification_update(
+            self.ctxt, uuids[0], {'status': 'running'},
+            expected_status='new', fencing_token=2)
+        self.assertEqual(2, notification['fencing_token'])
+
+        # A previous holder of the lock can't update the notification.
+        exc = self.assertRaises(exception.StaleFencingToken,
+                                db.notification_update, self.ctxt, uuids[0],
+                                {'status': 'error'}, fencing_token=1)
+        self.assertEqual(2, exc.kwargs['actual'])
+        exc = self.assertRaises(exception.StaleFencingToken,
+                                db.notification_update, self.ctxt, uuids[0],
+                                {'status': 'error'},
+                                expected_status='running', fencing_token=1)
+        self.assertEqual(1, self._get_active_notifications())
+
+        notification = db.notification_update(
+            self.ctxt, uuids[0], {'status': 'finished'},
+            expected_status='running', fencing_token=3)
+        self.assertEqual(3, notification['fencing_token'])
+        self.assertEqual('finished', notification['status'])
+        self.assertEqual(0, self._get_active_notifications())
+
+    @mock.patch.object(sqlite_base.SQLiteDialect, 'update_returning', False)
+    def test_notification_update_without_returning(self):
+        uuids = self._create_notifications_generated([('new', 0)])
+
+        notification = db.notification_update(
+            self.ctxt, uuids[0], {'status': 'running', 'message': 'msg'},
+            expected_status='new')
+
+        self.assertEqual('running', notification['status'])
+        self.assertEqual('msg', notification['message'])
+        self.assertRaises(exception.UnexpectedNotificationStatus,
+                          db.notification_update, self.ctxt, uuids[0],
+                          {'status': 'running'}, expected_status='new')
+        self.assertRaises(exception.NotificationNotFound,
+                          db.notification_update, self.ctxt,
+                          uuidsentinel.fake_uuid, {'message': 'msg'})
+
     def test_notification_not_found(self):
         self._create_notification(self._get_fake_values())
         self.assertRaises(exception.NotificationNotFound,
@@ -528,7 +909,8 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
             'end_time': None,
             'type': 'evacuation',
             'status': 'pending',
-            'message': None
+            'message': None,
+            'fencing_token': None
         }
 
     def _get_fake_values_list(self):
@@ -543,7 +925,8 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
              'end_time': None,
              'type': 'evacuation',
              'status': 'pending',
-             'message': None},
+             'message': None,
+             'fencing_token': None},
             {'uuid': uuidsentinel.vmove_2,
              'notification_uuid': uuidsentinel.notification,
              'instance_uuid': uuidsentinel.instance_uuid_2,
@@ -554,7 +937,8 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
              'end_time': None,
              'type': 'evacuation',
              'status': 'pending',
-             'message': None},
+             'message': None,
+             'fencing_token': None},
             {'uuid': uuidsentinel.vmove_3,
              'notification_uuid': uuidsentinel.notification,
              'instance_uuid': uuidsentinel.instance_uuid_3,
@@ -565,7 +949,8 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
              'end_time': None,
              'type': 'evacuation',
              'status': 'pending',
-             'message': None}]
+             'message': None,
+             'fencing_token': None}]
 
     def _create_vmove(self, values):
         return db.vmove_create(self.ctxt, values)
@@ -585,6 +970,22 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualObjects(vmove, self._get_fake_values(),
                                  ignored_keys)
 
+    def test_vmove_create_many(self):
+        values_list = self._get_fake_values_list()
+        vmoves = db.vmove_create_many(self.ctxt, values_list)
+
+        self.assertEqual(len(values_list), len(vmoves))
+        ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
+                        'id']
+        for vmove, values in zip(vmoves, values_list):
+            self._assertEqualObjects(vmove, values, ignored_keys)
+            self.assertIsNotNone(vmove['created_at'])
+            self._assertEqualObjects(
+                vmove, db.vmove_get_by_uuid(self.ctxt, values['uuid']))
+
+    def test_vmove_create_many_empty(self):
+        self.assertEqual([], db.vmove_create_many(self.ctxt, []))
+
     def test_vmove_get_by_uuid(self):
         self._test_get_vmove(db.vmove_get_by_uuid, 'uuid')
 
@@ -600,7 +1001,8 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
                    'end_time': None,
                    'type': 'evacuation',
                    'status': 'succeeded',
-                   'message': None}
+                   'message': None,
+             'fencing_token': None}
         ignored_keys = ['deleted', 'created_at', 'updated_at', 'deleted_at',
                         'id']
         self._create_vmove(self._get_fake_values())
@@ -609,6 +1011,38 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
             self.ctxt, uuidsentinel.vmove)
         self._assertEqualObjects(updated, vmove_updated, ignored_keys)
 
+    def test_vmove_update_expected_status(self):
+        self._create_vmove(self._get_fake_values())
+
+        vmove = db.vmove_update(self.ctxt, uuidsentinel.vmove,
+                                {'status': 'ongoing'},
+                                expected_status='pending')
+        self.assertEqual('ongoing', vmove['status'])
+
+        exc = self.assertRaises(exception.UnexpectedVMoveStatus,
+                                db.vmove_update, self.ctxt,
+                                uuidsentinel.vmove, {'status': 'ongoing'},
+                                expected_status='pending')
+        self.assertEqual('ongoing', exc.kwargs['actual'])
+        self.assertRaises(exception.VMoveNotFound,
+                          db.vmove_update, self.ctxt, uuidsentinel.fake_uuid,
+                          {'status': 'ongoing'})
+
+    def test_vmove_update_fencing_token(self):
+        self._create_vmove(self._get_fake_values())
+
+        vmove = db.vmove_update(self.ctxt, uuidsentinel.vmove,
+                                {'status': 'ongoing'}, fencing_token=2)
+        self.assertEqual(2, vmove['fencing_token'])
+
+        exc = self.assertRaises(exception.StaleFencingToken,
+                                db.vmove_update, self.ctxt,
+                                uuidsentinel.vmove, {'status': 'failed'},
+                                fencing_token=1)
+        self.assertEqual(2, exc.kwargs['actual'])
+        self.assertEqual('ongoing', db.vmove_get_by_uuid(
+            self.ctxt, uuidsentinel.vmove)['status'])
+
     def test_vmove_not_found(self):
         self._create_vmove(self._get_fake_values())
         self.assertRaises(exception.VMoveNotFound,
@@ -626,3 +1060,68 @@ class VMoveTestCase(base.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.InvalidSortKey,
                           db.vmoves_get_all_by_filters,
                           context=self.ctxt, sort_keys=['invalid_sort_key'])
+
+
+class RecoveryWorkflowDetailsTestCase(base.TestCase,
+                                      ModelsObjectComparatorMixin):
+
+    def setUp(self):
+        super(RecoveryWorkflowDetailsTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+
+    def test_recovery_workflow_details_update_creates(self):
+        db.recovery_workflow_details_update(
+            self.ctxt, uuidsentinel.fake_notification,
+            {'details': '[]'})
+
+        workflow_details = (
+            db.recovery_workflow_details_get_by_notification_uuid(
+                self.ctxt, uuidsentinel.fake_notification))
+        self.assertEqual('[]', workflow_details.details)
+        self.assertFalse(workflow_details.finished)
+
+    def test_recovery_workflow_details_update(self):
+        db.recovery_workflow_details_update(
+            self.ctxt, uuidsentinel.fake_notification,
+            {'details': '[]'})
+        db.recovery_workflow_details_update(
+            self.ctxt, uuidsentinel.fake_notification,
+            {'details': '[{"name": "task"}]', 'finished': True})
+
+        workflow_details = (
+            db.recovery_workflow_details_get_by_notification_uuid(
+                self.ctxt, uuidsentinel.fake_notification))
+        self.assertEqual('[{"name": "task"}]', workflow_details.details)
+        self.assertTrue(workflow_details.finished)
+
+    def test_recovery_workflow_details_update_finished_is_immutable(self):
+        db.recovery_workflow_details_update(
+            self.ctxt, uuidsentinel.fake_notification,
+            {'details': '[{"name": "task"}]', 'finished': True})
+
+        workflow_details = db.recovery_workflow_details_update(
+            self.ctxt, uuidsentinel.fake_notification,
+            {'details': '[]', 'finished': False})
+
+        self.assertEqual('[{"name": "task"}]', workflow_details.details)
+        self.assertTrue(workflow_details.finished)
+
+    def test_recovery_workflow_details_not_found(self):
+        self.assertRaises(
+            exception.RecoveryWorkflowDetailsNotFound,
+            db.recovery_workflow_details_get_by_notification_uuid,
+            self.ctxt, uuidsentinel.fake_notification)
+
+
+class FencingTokensTestCase(base.TestCase):
+
+    def setUp(self):
+        super(FencingTokensTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+
+    def test_fencing_token_issue(self):
+        self.assertEqual(1, db.fencing_token_issue(self.ctxt, 'lock-1'))
+        self.assertEqual(2, db.fencing_token_issue(self.ctxt, 'lock-1'))
+        # Every lock has its own fencing tokens.
+        self.assertEqual(1, db.fencing_token_issue(self.ctxt, 'lock-2'))
+        self.assertEqual(3, db.fencing_token_issue(self.ctxt, 'lock-1'))
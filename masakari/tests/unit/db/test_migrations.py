@@ -18,10 +18,13 @@ from alembic import command as alembic_api
 from alembic import script as alembic_script
 from oslo_db.sqlalchemy import enginefacade
 from oslo_db.sqlalchemy import test_fixtures
+from oslo_utils import timeutils
 from oslotest import base as test_base
+import sqlalchemy
 
 import masakari.conf
 from masakari.db.sqlalchemy import migration
+from masakari.objects import notification
 
 
 CONF = masakari.conf.CONF
@@ -91,6 +94,218 @@ class MigrationsWalk(
         if check_method:
             check_method(connection)
 
+    def _check_c2b6f4a1d7e3(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        indexes = {
+            index['name']: index['column_names']
+            for index in inspector.get_indexes('notifications')}
+        self.assertEqual(['status', 'generated_time'],
+                         indexes['notifications_status_generated_time_idx'])
+        self.assertEqual(
+            ['source_host_uuid', 'type', 'generated_time'],
+            indexes['notifications_host_type_generated_time_idx'])
+
+        indexes = {
+            index['name']: index['column_names']
+            for index in inspector.get_indexes('vmoves')}
+        self.assertEqual(['notification_uuid', 'status'],
+                         indexes['vmoves_notification_uuid_status_idx'])
+
+    def _check_e7a1c9d3b5f2(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        self.assertTrue(inspector.has_table('recovery_workflow_details'))
+        columns = {
+            column['name']
+            for column in inspector.get_columns('recovery_workflow_details')}
+        self.assertEqual({'created_at', 'updated_at', 'deleted_at',
+                          'deleted', 'id', 'notification_uuid', 'details',
+                          'finished'}, columns)
+        constraints = {
+            constraint['name']: constraint['column_names']
+            for constraint in inspector.get_unique_constraints(
+                'recovery_workflow_details')}
+        self.assertEqual(
+            ['notification_uuid'],
+            constraints['uniq_recovery_workflow_details0notification_uuid'])
+
+    def _pre_upgrade_f4b2d8e6a1c9(self, connection):
+        notifications = sqlalchemy.table(
+            'notifications',
+            sqlalchemy.column('notification_uuid', sqlalchemy.String),
+            sqlalchemy.column('generated_time', sqlalchemy.DateTime),
+            sqlalchemy.column('source_host_uuid', sqlalchemy.String),
+            sqlalchemy.column('type', sqlalchemy.String),
+            sqlalchemy.column('payload', sqlalchemy.Text),
+            sqlalchemy.column('status', sqlalchemy.String),
+            sqlalchemy.column('failover_segment_uuid', sqlalchemy.String),
+            sqlalchemy.column('deleted', sqlalchemy.Integer))
+        connection.execute(notifications.insert().values(
+            notification_uuid='fake-notification',
+            generated_time=timeutils.utcnow(),
+            source_host_uuid='fake-host',
+            type='COMPUTE_HOST',
+            payload='{"event": "STOPPED", "cluster_status": "OFFLINE"}',
+            status='new',
+            failover_segment_uuid='fake-segment',
+            deleted=0))
+        for i, payload in enumerate((None, 'null', '{}')):
+            connection.execute(notifications.insert().values(
+                notification_uuid='fake-empty-notification-%d' % i,
+                generated_time=timeutils.utcnow(),
+                source_host_uuid='fake-host',
+                type='COMPUTE_HOST',
+                payload=payload,
+                status='finished',
+                failover_segment_uuid='fake-segment',
+                deleted=0))
+
+    def _check_f4b2d8e6a1c9(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('notifications')}
+        self.assertIn('payload_hash', columns)
+        indexes = {
+            index['name']: index['column_names']
+            for index in inspector.get_indexes('notifications')}
+        self.assertEqual(
+            ['source_host_uuid', 'type', 'payload_hash', 'generated_time'],
+            indexes['notifications_duplicate_idx'])
+        self.assertNotIn('notifications_host_type_generated_time_idx',
+                         indexes)
+
+        payload_hash = connection.execute(sqlalchemy.text(
+            "SELECT payload_hash FROM notifications "
+            "WHERE notification_uuid = 'fake-notification'")).scalar()
+        self.assertEqual(
+            notification.payload_hash({'cluster_status': 'OFFLINE',
+                                       'event': 'STOPPED'}),
+            payload_hash)
+        # The empty payloads have the hash of the notifications created
+        # without a payload.
+        payload_hashes = connection.execute(sqlalchemy.text(
+            "SELECT payload_hash FROM notifications "
+            "WHERE notification_uuid LIKE 'fake-empty-notification-%'"))
+        self.assertEqual([notification.payload_hash(None)] * 3,
+                         [row.payload_hash for row in payload_hashes])
+
+    def _check_a9c3e5f7b1d2(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('notifications')}
+        self.assertIn('dedup_key', columns)
+        constraints = {
+            constraint['name']: constraint['column_names']
+            for constraint in inspector.get_unique_constraints(
+                'notifications')}
+        self.assertEqual(
+            ['dedup_key', 'deleted'],
+            constraints['uniq_notifications0dedup_key0deleted'])
+
+    def _check_b3d5f7a9c1e4(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('notifications')}
+        self.assertIn('idempotency_key', columns)
+        indexes = {
+            index['name']: index['column_names']
+            for index in inspector.get_indexes('notifications')}
+        self.assertEqual(['idempotency_key'],
+                         indexes['notifications_idempotency_key_idx'])
+
+    def _pre_upgrade_135c0af01e37(self, connection):
+        segments = sqlalchemy.table(
+            'failover_segments',
+            sqlalchemy.column('uuid', sqlalchemy.String),
+            sqlalchemy.column('name', sqlalchemy.String),
+            sqlalchemy.column('service_type', sqlalchemy.String),
+            sqlalchemy.column('recovery_method', sqlalchemy.String),
+            sqlalchemy.column('deleted', sqlalchemy.Integer))
+        connection.execute(segments.insert().values(
+            uuid='fake-segment', name='fake-segment', service_type='COMPUTE',
+            recovery_method='auto', deleted=0))
+        notifications = sqlalchemy.table(
+            'notifications',
+            sqlalchemy.column('notification_uuid', sqlalchemy.String),
+            sqlalchemy.column('generated_time', sqlalchemy.DateTime),
+            sqlalchemy.column('source_host_uuid', sqlalchemy.String),
+            sqlalchemy.column('type', sqlalchemy.String),
+            sqlalchemy.column('status', sqlalchemy.String),
+            sqlalchemy.column('failover_segment_uuid', sqlalchemy.String),
+            sqlalchemy.column('deleted', sqlalchemy.Integer))
+        # Only the new notification inserted by _pre_upgrade_f4b2d8e6a1c9 is
+        # active.
+        connection.execute(notifications.insert().values(
+            notification_uuid='fake-finished-notification',
+            generated_time=timeutils.utcnow(),
+            source_host_uuid='fake-host',
+            type='COMPUTE_HOST',
+            status='finished',
+            failover_segment_uuid='fake-segment',
+            deleted=0))
+
+    def _check_135c0af01e37(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('failover_segments')}
+        self.assertIn('active_notifications', columns)
+
+        active_notifications = connection.execute(sqlalchemy.text(
+            "SELECT active_notifications FROM failover_segments "
+            "WHERE uuid = 'fake-segment'")).scalar()
+        self.assertEqual(1, active_notifications)
+
+    def _check_8b3c2c88fb9a(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('notifications')}
+        self.assertIn('owner', columns)
+        self.assertIn('lease_expires_at', columns)
+        indexes = {
+            index['name']: index['column_names']
+            for index in inspector.get_indexes('notifications')}
+        self.assertEqual(['owner'], indexes['notifications_owner_idx'])
+
+    def _check_88faa6057a27(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        self.assertTrue(inspector.has_table('fencing_tokens'))
+        columns = {
+            column['name']
+            for column in inspector.get_columns('fencing_tokens')}
+        self.assertEqual({'created_at', 'updated_at', 'deleted_at',
+                          'deleted', 'id', 'name', 'token'}, columns)
+        constraints = {
+            constraint['name']: constraint['column_names']
+            for constraint in inspector.get_unique_constraints(
+                'fencing_tokens')}
+        self.assertEqual(
+            ['name', 'deleted'],
+            constraints['uniq_fencing_token0name0deleted'])
+        for table in ('notifications', 'vmoves'):
+            columns = {
+                column['name'] for column in inspector.get_columns(table)}
+            self.assertIn('fencing_token', columns)
+
+    def _check_d5e1f3a7c9b2(self, connection):
+        inspector = sqlalchemy.inspect(connection)
+
+        columns = {
+            column['name']
+            for column in inspector.get_columns('notifications')}
+        self.assertIn('idempotency_fingerprint', columns)
+
     def test_walk_versions(self):
         with self.engine.begin() as connection:
             self.config.attributes['connection'] = connection
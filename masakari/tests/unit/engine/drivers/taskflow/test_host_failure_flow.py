@@ -20,10 +20,15 @@ import copy
 from unittest import mock
 
 import ddt
+import eventlet
+from oslo_utils import timeutils
+from tooz import coordination as tooz_coordination
 
 from masakari.compute import nova
 from masakari import conf
 from masakari import context
+from masakari import coordination
+from masakari import db
 from masakari.engine.drivers.taskflow import host_failure
 from masakari.engine import manager
 from masakari import exception
@@ -57,6 +62,16 @@ class HostFailureTestCase(base.TestCase):
         self.novaclient = nova.API()
         self.fake_client = fakes.FakeNovaClient()
         self.disabled_reason = CONF.host_failure.service_disable_reason
+        self.evacuation_priorities = None
+        db.notification_create(self.ctxt, {
+            'notification_uuid': self.notification_uuid,
+            'generated_time': timeutils.utcnow(),
+            'type': 'COMPUTE_HOST',
+            'payload': '{}',
+            'status': 'running',
+            'source_host_uuid': uuids.source_host,
+            'failover_segment_uuid': uuids.segment,
+            'fencing_token': 1})
 
     def _verify_instance_evacuated(self):
 
@@ -98,10 +113,13 @@ class HostFailureTestCase(base.TestCase):
         mock_enable_disable.assert_called_once_with(
             self.ctxt, self.instance_host, reason=self.disabled_reason)
 
-    def _test_instance_list(self, instances_evacuation_count):
+    def _test_instance_list(self, instances_evacuation_count,
+                            fencing_token=None):
         task = host_failure.PrepareHAEnabledInstancesTask(self.ctxt,
                                                           self.novaclient)
-        task.execute(self.instance_host, self.notification_uuid)
+        self.evacuation_priorities = task.execute(
+            self.instance_host, self.notification_uuid,
+            fencing_token=fencing_token)
 
         all_vmoves = objects.VMoveList.get_all_vmoves(
             self.ctxt,
@@ -120,7 +138,8 @@ class HostFailureTestCase(base.TestCase):
 
         self.assertEqual(instances_evacuation_count, len(all_vmoves))
 
-    def _evacuate_instances(self, mock_enable_disable, reserved_host=None):
+    def _evacuate_instances(self, mock_enable_disable, reserved_host=None,
+                            fencing_token=None):
         task = host_failure.EvacuateInstancesTask(
             self.ctxt, self.novaclient,
             update_host_method=manager.update_host_method)
@@ -128,12 +147,16 @@ class HostFailureTestCase(base.TestCase):
         if reserved_host:
             task.execute(self.instance_host,
                          self.notification_uuid,
-                         reserved_host=reserved_host)
+                         fencing_token=fencing_token,
+                         reserved_host=reserved_host,
+                         evacuation_priorities=self.evacuation_priorities)
 
             self.assertTrue(mock_enable_disable.called)
         else:
             task.execute(
-                self.instance_host, self.notification_uuid)
+                self.instance_host, self.notification_uuid,
+                fencing_token=fencing_token,
+                evacuation_priorities=self.evacuation_priorities)
 
         # make sure instance is active and has different host
         self._verify_instance_evacuated()
@@ -173,6 +196,189 @@ class HostFailureTestCase(base.TestCase):
         ]
         task._evacuate_and_confirm(self.ctxt, vmove)
         self.assertEqual(fields.VMoveStatus.FAILED, vmove.status)
+        vmove = objects.VMove.get_by_uuid(self.ctxt, vmove.uuid)
+        self.assertEqual(fields.VMoveStatus.FAILED, vmove.status)
+
+    @mock.patch.object(nova.API, "get_server")
+    @mock.patch.object(nova.API, "evacuate_instance")
+    def test_instance_evacuate_vmove_already_ongoing(
+            self, _mock_evacuate, _mock_get, mock_unlock, mock_lock,
+            mock_enable_disable):
+        task = host_failure.EvacuateInstancesTask(
+            self.ctxt, self.novaclient,
+            update_host_method=manager.update_host_method)
+
+        fake_instance = self.fake_client.servers.create(
+            id=uuids.instance, host=self.instance_host, ha_enabled=True)
+        setattr(fake_instance, 'OS-EXT-STS:vm_state', 'active')
+        _mock_get.return_value = fake_instance
+
+        vmove = vmove_obj.VMove(context=self.ctxt)
+        vmove.instance_uuid = fake_instance.id
+        vmove.instance_name = fake_instance.name
+        vmove.notification_uuid = self.notification_uuid
+        vmove.source_host = self.instance_host
+        vmove.status = fields.VMoveStatus.PENDING
+        vmove.type = fields.VMoveType.EVACUATION
+        vmove.create()
+
+        # the vm move is taken by someone else meanwhile
+        other_vmove = objects.VMove.get_by_uuid(self.ctxt, vmove.uuid)
+        other_vmove.status = fields.VMoveStatus.ONGOING
+        other_vmove.save(expected_status=fields.VMoveStatus.PENDING)
+
+        task._evacuate_and_confirm(self.ctxt, vmove)
+
+        _mock_evacuate.assert_not_called()
+        vmove = objects.VMove.get_by_uuid(self.ctxt, vmove.uuid)
+        self.assertEqual(fields.VMoveStatus.ONGOING, vmove.status)
+        self.assertIsNone(vmove.end_time)
+
+    @mock.patch.object(nova.API, "get_server")
+    @mock.patch.object(nova.API, "evacuate_instance")
+    def test_instance_evacuate_vmove_taken_unlocks_instance(
+            self, _mock_evacuate, _mock_get, mock_unlock, mock_lock,
+            mock_enable_disable):
+        task = host_failure.EvacuateInstancesTask(
+            self.ctxt, self.novaclient,
+            update_host_method=manager.update_host_method)
+
+        fake_instance = self.fake_client.servers.create(
+            id=uuids.instance, host=self.instance_host, ha_enabled=True)
+        setattr(fake_instance, 'OS-EXT-STS:vm_state', 'active')
+        _mock_get.return_value = fake_instance
+
+        vmove = vmove_obj.VMove(context=self.ctxt)
+        vmove.instance_uuid = fake_instance.id
+        vmove.instance_name = fake_instance.name
+        vmove.notification_uuid = self.notification_uuid
+        vmove.source_host = self.instance_host
+        vmove.status = fields.VMoveStatus.PENDING
+        vmove.type = fields.VMoveType.EVACUATION
+        vmove.create()
+
+        def fake_evacuate(context, uuid, target=None):
+            # the vm move is taken by someone else during the evacuation
+            other_vmove = objects.VMove.get_by_uuid(self.ctxt, vmove.uuid)
+            other_vmove.status = fields.VMoveStatus.FAILED
+            other_vmove.save(expected_status=fields.VMoveStatus.ONGOING)
+            raise exception.MasakariException()
+
+        _mock_evacuate.side_effect = fake_evacuate
+
+        self.assertRaises(exception.UnexpectedVMoveStatus,
+                          task._evacuate_and_confirm, self.ctxt, vmove)
+
+        # the instance is unlocked before the vm move is saved
+        mock_unlock.assert_called_once_with(self.ctxt, fake_instance.id)
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_disable_compute_service_wait_for_service_down(
+            self, _mock_novaclient, mock_unlock, mock_lock,
+            mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.override_config("wait_for_compute_service_down", True,
+                             "host_failure")
+        self.override_config("wait_period_after_service_update", 60)
+        self.fake_client.services.create(
+            1, host=self.instance_host, binary='nova-compute',
+            status='enabled', state='down')
+
+        # nova already considers the host down, no need to wait
+        with eventlet.Timeout(5):
+            self._test_disable_compute_service(mock_enable_disable)
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    @mock.patch.object(nova.API, 'is_service_down', return_value=False)
+    def test_disable_compute_service_wait_for_service_down_timeout(
+            self, mock_is_service_down, _mock_novaclient, mock_unlock,
+            mock_lock, mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.override_config("wait_for_compute_service_down", True,
+                             "host_failure")
+        self.override_config("wait_period_after_service_update", 1)
+
+        # the recovery goes on once the upper bound is reached
+        self._test_disable_compute_service(mock_enable_disable)
+
+        mock_is_service_down.assert_called_with(
+            self.ctxt, self.instance_host, 'nova-compute')
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_disable_compute_service_force_down(
+            self, _mock_novaclient, mock_unlock, mock_lock,
+            mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.override_config("force_down_compute_service", True,
+                             "host_failure")
+        self.override_config("wait_period_after_service_update", 60)
+        self.fake_client.services.create(
+            1, host=self.instance_host, binary='nova-compute',
+            status='enabled', state='up')
+
+        with eventlet.Timeout(5):
+            self._test_disable_compute_service(mock_enable_disable)
+
+        service = self.fake_client.services.list(
+            host=self.instance_host, binary='nova-compute')[0]
+        self.assertTrue(service.forced_down)
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    @mock.patch.object(host_failure.EvacuateInstancesTask,
+                       '_schedule_evacuation')
+    def test_evacuation_priority(self, mock_schedule, _mock_novaclient,
+                                 mock_unlock, mock_lock, mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.override_config("evacuate_all_instances", True, "host_failure")
+        prepare_task = host_failure.PrepareHAEnabledInstancesTask(
+            self.ctxt, self.novaclient)
+        task = host_failure.EvacuateInstancesTask(
+            self.ctxt, self.novaclient,
+            update_host_method=manager.update_host_method)
+
+        priorities = [(uuids.server_1, False, None),
+                      (uuids.server_2, True, '5'),
+                      (uuids.server_3, False, '10'),
+                      (uuids.server_4, True, None),
+                      (uuids.server_5, False, 'invalid')]
+        for server_id, ha_enabled, priority in priorities:
+            server = self.fake_client.servers.create(
+                id=server_id, host=self.instance_host, ha_enabled=ha_enabled)
+            if priority:
+                server.metadata['HA_Priority'] = priority
+
+        with mock.patch.object(
+                nova.API, 'get_servers',
+                wraps=self.novaclient.get_servers) as mock_get_servers:
+            evacuation_priorities = prepare_task.execute(
+                self.instance_host, self.notification_uuid)
+
+            # an instance without priority, e.g. moved by another engine
+            vmove = vmove_obj.VMove(context=self.ctxt)
+            vmove.instance_uuid = uuids.server_6
+            vmove.instance_name = 'fake_instance'
+            vmove.notification_uuid = self.notification_uuid
+            vmove.source_host = self.instance_host
+            vmove.status = fields.VMoveStatus.PENDING
+            vmove.type = fields.VMoveType.EVACUATION
+            vmove.create()
+
+            task.execute(self.instance_host, self.notification_uuid,
+                         evacuation_priorities=evacuation_priorities)
+
+        # the priorities come from the server list of the prepare task
+        mock_get_servers.assert_called_once_with(self.ctxt,
+                                                 self.instance_host)
+        scheduled = [(call[0][1].instance_uuid, call[0][2])
+                     for call in mock_schedule.call_args_list]
+        # HA_Enabled instances first, then by decreasing priority, the ones
+        # without priority or gone from the failed host last
+        self.assertEqual([(uuids.server_2, (False, -5)),
+                          (uuids.server_4, (False, 0)),
+                          (uuids.server_3, (True, -10))], scheduled[:3])
+        self.assertEqual({(uuids.server_1, (True, 0)),
+                          (uuids.server_5, (True, 0)),
+                          (uuids.server_6, (True, 0))}, set(scheduled[3:]))
 
     @mock.patch('masakari.compute.nova.novaclient')
     @mock.patch('masakari.engine.drivers.taskflow.base.MasakariTask.'
@@ -217,16 +423,98 @@ class HostFailureTestCase(base.TestCase):
             mock.call(f"Start evacuation of instances from failed host "
                       f"'fake-host', instance uuids are: "
                       f"'{uuids.server_2},{uuids.server_1}'"),
-            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
-                      0.5),
+            # the HA_Enabled instance is evacuated first
             mock.call(f"Evacuation of instance started: '{uuids.server_1}'",
                       0.5),
+            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
+                      0.5),
             mock.call(f"Successfully evacuate instances "
                       f"'{sorted_uuids[0]},{sorted_uuids[1]}' from host "
                       f"'fake-host'", 0.7),
             mock.call('Evacuation process completed!', 1.0)
         ])
 
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_host_failure_flow_fencing_token(
+            self, _mock_novaclient, mock_unlock, mock_lock,
+            mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.fake_client.servers.create(
+            id=uuids.server_1, host=self.instance_host, ha_enabled=True)
+
+        self._test_instance_list(1, fencing_token=1)
+        vmove = objects.VMoveList.get_all_vmoves(
+            self.ctxt, self.notification_uuid)[0]
+        self.assertEqual(1, vmove.fencing_token)
+
+        # Another engine took the recovery over and recorded its newer
+        # fencing token on the notification, the flow still running with
+        # the former token can't update the vm move anymore.
+        db.notification_update(self.ctxt, self.notification_uuid, {},
+                               fencing_token=2)
+        vmove.status = fields.VMoveStatus.ONGOING
+        self.assertRaises(exception.StaleFencingToken, vmove.save)
+
+        self._evacuate_instances(mock_enable_disable, fencing_token=2)
+
+        vmove = objects.VMove.get_by_uuid(self.ctxt, vmove.uuid)
+        self.assertEqual(2, vmove.fencing_token)
+        self.assertEqual(fields.VMoveStatus.SUCCEEDED, vmove.status)
+        vmove.fencing_token = 1
+        vmove.status = fields.VMoveStatus.FAILED
+        self.assertRaises(exception.StaleFencingToken, vmove.save)
+
+    @mock.patch.object(coordination.COORDINATOR, 'get_lock')
+    def test_evacuate_reserved_host_locked_by_another_engine(
+            self, mock_get_lock, mock_unlock, mock_lock,
+            mock_enable_disable):
+        lock = mock_get_lock.return_value
+        lock.return_value.__enter__.side_effect = (
+            tooz_coordination.LockAcquireFailed('locked'))
+        task = host_failure.EvacuateInstancesTask(
+            self.ctxt, self.novaclient,
+            update_host_method=manager.update_host_method)
+
+        self.assertRaises(exception.LockAlreadyAcquired, task.execute,
+                          self.instance_host, self.notification_uuid,
+                          reserved_host='fake-reserved-host')
+        mock_get_lock.assert_called_once_with(
+            'reserved-host-fake-reserved-host')
+        lock.assert_called_once_with(False)
+        mock_enable_disable.assert_not_called()
+
+    @mock.patch('masakari.compute.nova.novaclient')
+    def test_host_failure_flow_with_batch_server_state_polling(
+            self, _mock_novaclient, mock_unlock, mock_lock,
+            mock_enable_disable):
+        _mock_novaclient.return_value = self.fake_client
+        self.override_config("evacuate_all_instances",
+                             True, "host_failure")
+        self.override_config("batch_server_state_polling",
+                             True, "host_failure")
+
+        # create test data
+        self.fake_client.servers.create(
+            id=uuids.server_1, host=self.instance_host,
+            ha_enabled=True)
+        self.fake_client.servers.create(
+            id=uuids.server_2, host=self.instance_host,
+            vm_state='stopped')
+
+        self._test_instance_list(2)
+
+        with mock.patch.object(
+                nova.API, 'get_servers_changed_since',
+                wraps=self.novaclient.get_servers_changed_since) as mock_list:
+            self._evacuate_instances(mock_enable_disable)
+
+        # Both instances are confirmed through the shared server list.
+        self.assertTrue(mock_list.called)
+        all_vmoves = objects.VMoveList.get_all_vmoves(
+            self.ctxt, self.notification_uuid)
+        self.assertEqual([fields.VMoveStatus.SUCCEEDED] * 2,
+                         [vmove.status for vmove in all_vmoves])
+
     @mock.patch('masakari.compute.nova.novaclient')
     @mock.patch('masakari.engine.drivers.taskflow.base.MasakariTask.'
                 'update_details')
@@ -342,10 +630,10 @@ class HostFailureTestCase(base.TestCase):
                       0.2),
             mock.call('Added host fake-reserved-host to aggregate fake_agg',
                       0.3),
-            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
-                      0.5),
             mock.call(f"Evacuation of instance started: '{uuids.server_1}'",
                       0.5),
+            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
+                      0.5),
             mock.call(f"Successfully evacuate instances "
                       f"'{sorted_uuids[0]},{sorted_uuids[1]}' from host "
                       f"'fake-host'", 0.7),
@@ -425,10 +713,10 @@ class HostFailureTestCase(base.TestCase):
                       0.2),
             mock.call('Added host fake-reserved-host to aggregate fake_agg_2',
                       0.3),
-            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
-                      0.5),
             mock.call(f"Evacuation of instance started: '{uuids.server_1}'",
                       0.5),
+            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
+                      0.5),
             mock.call(f"Successfully evacuate instances "
                       f"'{sorted_uuids[0]},{sorted_uuids[1]}' from host "
                       f"'fake-host'", 0.7),
@@ -857,10 +1145,10 @@ class HostFailureTestCase(base.TestCase):
                       0.2),
             mock.call('Added host fake-reserved-host to aggregate fake_agg',
                       0.3),
-            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
-                      0.5),
             mock.call(f"Evacuation of instance started: '{uuids.server_1}'",
                       0.5),
+            mock.call(f"Evacuation of instance started: '{uuids.server_2}'",
+                      0.5),
             mock.call(f"Successfully evacuate instances "
                       f"'{sorted_uuids[0]},{sorted_uuids[1]}' from host "
                       f"'fake-host'", 0.7),
@@ -22,6 +22,7 @@ from unittest import mock
 from masakari.compute import nova
 from masakari import context
 from masakari.engine.drivers.taskflow import instance_failure
+from masakari.engine import nova_events
 from masakari import exception
 from masakari.tests.unit import base
 from masakari.tests.unit import fakes
@@ -93,6 +94,29 @@ class InstanceFailureTestCase(base.TestCase):
                       "' vm_state is ACTIVE", 1.0)
         ])
 
+    @mock.patch('masakari.compute.nova.novaclient')
+    @mock.patch.object(nova_events.NOVA_EVENTS, 'wait',
+                       wraps=nova_events.NOVA_EVENTS.wait)
+    @mock.patch.object(nova_events.NovaEvents, 'listening',
+                       new_callable=mock.PropertyMock, return_value=True)
+    def test_instance_failure_flow_with_nova_notifications(
+            self, _mock_listening, mock_wait, _mock_novaclient):
+        _mock_novaclient.return_value = self.fake_client
+
+        # create test data
+        self.fake_client.servers.create(self.instance_id,
+                                        host="fake-host",
+                                        ha_enabled=True)
+
+        self._test_stop_instance()
+        task = instance_failure.StartInstanceTask(self.ctxt, self.novaclient)
+        task.execute(self.instance_id)
+        self._test_confirm_instance_is_active()
+
+        mock_wait.assert_has_calls([
+            mock.call(self.instance_id, mock.ANY, 2),
+            mock.call(self.instance_id, mock.ANY, 2)])
+
     @mock.patch('masakari.compute.nova.novaclient')
     @mock.patch('masakari.engine.drivers.taskflow.base.MasakariTask.'
                 'update_details')
@@ -23,6 +23,7 @@ from masakari import context
 from masakari.engine.drivers.taskflow import base
 from masakari.engine.drivers.taskflow import driver
 from masakari.engine.drivers.taskflow import host_failure
+from masakari.engine import evacuation_scheduler
 from masakari import exception
 from masakari.objects import fields
 from masakari.tests.unit import base as test_base
@@ -47,6 +48,9 @@ class TaskflowDriverTestCase(test_base.TestCase):
         super(TaskflowDriverTestCase, self).setUp()
         self.taskflow_driver = driver.TaskFlowDriver()
         self.ctxt = context.get_admin_context()
+        # The flows are fakes, there is nothing to listen to.
+        self.stub_out('masakari.engine.drivers.taskflow.base.'
+                      'RecoveryWorkflowDetailsListener', mock.MagicMock())
 
     @mock.patch.object(base, 'DynamicLogListener')
     @mock.patch.object(host_failure, 'get_auto_flow')
@@ -224,6 +228,35 @@ class TaskflowDriverTestCase(test_base.TestCase):
         # Ensures that 'auto' flow executes as 'reserved_host' flow fails
         self.assertTrue(mock_auto_flow.called)
 
+    @mock.patch.object(base, 'DynamicLogListener')
+    @mock.patch.object(host_failure, 'get_auto_flow')
+    def test_auto_recovery_flow_fencing_token(self, mock_auto_flow,
+                                              mock_listener):
+        mock_auto_flow.return_value = FakeFlow
+        FakeFlow.run = mock.Mock(return_value=None)
+        self.taskflow_driver.execute_host_failure(
+            self.ctxt, 'fake_host',
+            fields.FailoverSegmentRecoveryMethod.AUTO,
+            uuidsentinel.fake_notification, fencing_token=3)
+
+        # The flow is run with the fencing token of the recovery lock
+        mock_auto_flow.assert_called_once_with(
+            self.ctxt, mock.ANY, {
+                'host_name': 'fake_host',
+                'notification_uuid': uuidsentinel.fake_notification,
+                'fencing_token': 3})
+
+    @mock.patch.object(base, 'reset_task_classes_cache')
+    @mock.patch.object(base.PERSISTENCE_BACKENDS, 'reset')
+    @mock.patch.object(evacuation_scheduler.SCHEDULER, 'reset')
+    def test_reset(self, mock_scheduler_reset, mock_backends_reset,
+                   mock_cache_reset):
+        self.taskflow_driver.reset()
+
+        mock_scheduler_reset.assert_called_once_with()
+        mock_backends_reset.assert_called_once_with()
+        mock_cache_reset.assert_called_once_with()
+
     @mock.patch.object(path_based.PathBasedConnection, 'get_atoms_for_flow')
     @mock.patch.object(path_based.PathBasedConnection, 'get_flows_for_book')
     def test_get_notification_recovery_workflow_details(
@@ -13,15 +13,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import datetime
 from unittest import mock
 
+import eventlet
+from oslo_service import loopingcall
 from oslo_utils import importutils
 from oslo_utils import timeutils
+from tooz import coordination as tooz_coordination
 
 from masakari.compute import nova
 import masakari.conf
 from masakari import context
+from masakari import coordination
+from masakari import db
 from masakari.engine import manager
 from masakari.engine import utils as engine_utils
 from masakari import exception
@@ -36,8 +42,6 @@ from masakari.tests import uuidsentinel
 CONF = masakari.conf.CONF
 
 NOW = timeutils.utcnow().replace(microsecond=0)
-EXPIRED_TIME = timeutils.utcnow().replace(microsecond=0) \
-    - datetime.timedelta(seconds=CONF.notifications_expired_interval)
 
 
 def _get_vm_type_notification(status="new"):
@@ -79,14 +83,14 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
             generated_time=NOW, status="new",
             notification_uuid=uuidsentinel.fake_notification)
 
-    def _get_compute_host_type_notification(self, expired=False):
+    def _get_compute_host_type_notification(self):
         return fakes.create_fake_notification(
             type="COMPUTE_HOST", id=1, payload={
                 'event': 'stopped', 'host_status': 'NORMAL',
                 'cluster_status': 'ONLINE'
             },
             source_host_uuid=uuidsentinel.fake_host,
-            generated_time=EXPIRED_TIME if expired else NOW,
+            generated_time=NOW,
             status="new",
             notification_uuid=uuidsentinel.fake_notification)
 
@@ -209,6 +213,40 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
                       phase=phase_end)]
         mock_notify_about_notification_update.assert_has_calls(notify_calls)
 
+    @mock.patch.object(db, "fencing_token_issue", return_value=7)
+    @mock.patch.object(coordination.COORDINATOR, "get_lock")
+    @mock.patch.object(host_obj.Host, "get_by_uuid")
+    @mock.patch.object(host_obj.Host, "save")
+    @mock.patch("masakari.engine.drivers.taskflow."
+                "TaskFlowDriver.execute_process_failure")
+    @mock.patch.object(notification_obj.Notification, "save")
+    @mock.patch.object(engine_utils, 'notify_about_notification_update')
+    def test_process_notification_fencing_token(
+            self, mock_notify_about_notification_update,
+            mock_notification_save, mock_process_failure,
+            mock_host_save, mock_host_obj, mock_get_lock,
+            mock_fencing_token_issue, mock_notification_get):
+        lock = mock_get_lock.return_value
+        lock.name = b'masakari-host-recovery-%s' % (
+            uuidsentinel.fake_host.encode('ascii'))
+        notification = self._get_process_type_notification()
+        mock_process_failure.side_effect = self._fake_notification_workflow()
+        mock_host_obj.return_value = fakes.create_fake_host()
+
+        self.engine._process_notification(self.context,
+                                          notification=notification)
+
+        # The notification is recovered holding the recovery lock of its
+        # host on every engine and saved with the fencing token of the lock.
+        mock_get_lock.assert_called_once_with(
+            'host-recovery-%s' % notification.source_host_uuid)
+        lock.assert_called_once_with(True)
+        mock_fencing_token_issue.assert_called_once_with(
+            mock.ANY, lock.name.decode('ascii'))
+        self.assertEqual(7, notification.fencing_token)
+        self.assertEqual("finished", notification.status)
+        self.assertEqual(2, mock_notification_save.call_count)
+
     @mock.patch.object(host_obj.Host, "get_by_uuid")
     @mock.patch.object(host_obj.Host, "save")
     @mock.patch("masakari.engine.drivers.taskflow."
@@ -394,7 +432,8 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
         mock_host_failure.assert_called_once_with(
             self.context,
             fake_host.name, fake_host.failover_segment.recovery_method,
-            notification.notification_uuid, reserved_host_list=None,
+            notification.notification_uuid, fencing_token=None,
+            reserved_host_list=None,
             update_host_method=manager.update_host_method)
         action = fields.EventNotificationAction.NOTIFICATION_PROCESS
         phase_start = fields.EventNotificationPhase.START
@@ -488,7 +527,7 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
         mock_host_failure.assert_called_once_with(
             self.context,
             fake_host.name, fake_host.failover_segment.recovery_method,
-            notification.notification_uuid,
+            notification.notification_uuid, fencing_token=None,
             reserved_host_list=reserved_host_list,
             update_host_method=manager.update_host_method)
         mock_get_all.assert_called_once_with(self.context, filters={
@@ -543,7 +582,7 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
         mock_host_failure.assert_called_once_with(
             self.context,
             fake_host.name, fake_host.failover_segment.recovery_method,
-            notification.notification_uuid,
+            notification.notification_uuid, fencing_token=None,
             reserved_host_list=reserved_host_list,
             update_host_method=manager.update_host_method)
         action = fields.EventNotificationAction.NOTIFICATION_PROCESS
@@ -765,16 +804,24 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
                       tb=mock.ANY)]
         mock_notify_about_notification_update.assert_has_calls(notify_calls)
 
-    def test_process_notification_stop_from_recovery_failure(self,
-                                                     mock_get_noti):
+    @mock.patch.object(notification_obj.Notification, "save")
+    def test_process_notification_stop_from_recovery_failure(
+            self, mock_save, mock_get_noti):
         noti_new = _get_vm_type_notification()
-        mock_get_noti.return_value = _get_vm_type_notification(
-            status="failed")
+        mock_save.side_effect = exception.UnexpectedNotificationStatus(
+            uuid=noti_new.notification_uuid, expected="new",
+            actual="failed")
 
         with mock.patch("masakari.engine.manager.LOG.warning") as mock_log:
-            self.engine._process_notification(self.context,
-                                              notification=noti_new)
+            status = self.engine._process_notification(self.context,
+                                                       notification=noti_new)
             mock_log.assert_called_once()
+            mock_save.assert_called_once_with(
+                expected_status="new", owner=self.engine._claim_owner,
+                lease_expires_at=mock.ANY)
+            self.assertEqual("failed", status)
+            self.assertEqual("new", noti_new.status)
+            mock_get_noti.assert_not_called()
             args = mock_log.call_args[0]
             expected_log = ("Processing of notification is skipped to avoid "
                             "recovering from failure twice. "
@@ -1198,11 +1245,305 @@ class EngineManagerUnitTestCase(base.NoDBTestCase):
         mock_progress_details.assert_called_once_with(
             self.context, notification)
 
-    @mock.patch.object(notification_obj.Notification, "save")
-    @mock.patch.object(notification_obj.NotificationList, "get_all")
-    def test_check_expired_notifications(self, mock_get_all, mock_save,
+    def test_reset(self, mock_notification_get):
+        with mock.patch.object(self.engine.driver, 'reset') as mock_reset:
+            self.engine.reset()
+
+        mock_reset.assert_called_once_with()
+
+    @mock.patch.object(timeutils, 'utcnow', return_value=NOW)
+    @mock.patch.object(notification_obj.NotificationList, "expire")
+    def test_check_expired_notifications(self, mock_expire, mock_utcnow,
                                          mock_notification_get):
-        notification = self._get_compute_host_type_notification(expired=True)
-        mock_get_all.return_value = [notification]
+        mock_expire.return_value = [uuidsentinel.fake_notification]
+
         self.engine._check_expired_notifications(self.context)
+
+        mock_expire.assert_called_once_with(
+            self.context, NOW - datetime.timedelta(
+                seconds=CONF.notifications_expired_interval))
+
+    @mock.patch.object(coordination.COORDINATOR, "is_leader",
+                       return_value=False)
+    @mock.patch.object(notification_obj.NotificationList, "claim")
+    @mock.patch.object(notification_obj.NotificationList, "expire")
+    def test_periodic_tasks_not_leader(self, mock_expire, mock_claim,
+                                       mock_is_leader,
+                                       mock_notification_get):
+        self.engine._check_expired_notifications(self.context)
+        self.engine._process_unfinished_notifications(self.context)
+
+        # Another engine scans the notifications.
+        mock_expire.assert_not_called()
+        mock_claim.assert_not_called()
+        mock_is_leader.assert_called_with(manager.PERIODIC_TASKS_ELECTION)
+
+    @mock.patch.object(coordination.COORDINATOR, "stop")
+    @mock.patch.object(coordination.COORDINATOR, "start")
+    def test_coordination(self, mock_start, mock_stop,
+                          mock_notification_get):
+        self.engine.post_start_hook()
+        mock_start.assert_not_called()
+
+        self.override_config('backend_url', 'etcd3+http://localhost:2379',
+                             'coordination')
+        self.engine.post_start_hook()
+        self.engine.cleanup_host()
+
+        mock_start.assert_called_once_with()
+        mock_stop.assert_called_once_with()
+
+    @mock.patch.object(loopingcall, "FixedIntervalLoopingCall")
+    def test_lease_renewal(self, mock_looping_call, mock_notification_get):
+        self.engine.post_start_hook()
+        self.engine.post_start_hook()
+
+        # The leases are renewed as long as the engine runs.
+        mock_looping_call.assert_called_once_with(
+            self.engine._renew_notification_leases, mock.ANY)
+        interval = CONF.notification_lease_time / 3.0
+        mock_looping_call.return_value.start.assert_called_once_with(
+            interval=interval, initial_delay=interval)
+
+        self.engine.cleanup_host()
+
+        mock_looping_call.return_value.stop.assert_called_once_with()
+        self.assertIsNone(self.engine._lease_renewal)
+
+    @mock.patch.object(manager.LOG, "error")
+    @mock.patch.object(coordination.COORDINATOR, "start")
+    def test_coordination_start_failed(self, mock_start, mock_log,
+                                       mock_notification_get):
+        self.override_config('backend_url', 'etcd3+http://localhost:2379',
+                             'coordination')
+        mock_start.side_effect = tooz_coordination.ToozConnectionError(
+            'connection refused')
+
+        # The engine starts without coordination.
+        self.engine.post_start_hook()
+
+        mock_start.assert_called_once_with()
+        self.assertTrue(mock_log.called)
+
+    def _get_unfinished_notifications(self):
+        return [
+            fakes.create_fake_notification(
+                type="COMPUTE_HOST", id=1, payload={}, status="error",
+                source_host_uuid=uuidsentinel.fake_host_1,
+                notification_uuid=uuidsentinel.fake_notification_1),
+            fakes.create_fake_notification(
+                type="COMPUTE_HOST", id=2, payload={}, status="error",
+                source_host_uuid=uuidsentinel.fake_host_2,
+                notification_uuid=uuidsentinel.fake_notification_2),
+            fakes.create_fake_notification(
+                type="COMPUTE_HOST", id=3, payload={}, status="error",
+                source_host_uuid=uuidsentinel.fake_host_1,
+                notification_uuid=uuidsentinel.fake_notification_3),
+        ]
+
+    def _run_unfinished_notifications(self, notifications,
+                                      fail_notification=None,
+                                      error_host=None, status="finished"):
+        running = collections.Counter()
+        calls = []
+        max_running = []
+
+        def fake_process_notification(context, notification):
+            host = notification.source_host_uuid
+            running[host] += 1
+            max_running.append((sum(running.values()), running[host]))
+            calls.append(notification.notification_uuid)
+            eventlet.sleep(0.01)
+            running[host] -= 1
+            if notification.notification_uuid == fail_notification:
+                raise exception.MasakariException()
+            if host == error_host:
+                return "error"
+            return status
+
+        with mock.patch.object(notification_obj.NotificationList, "claim",
+                               return_value=notifications), \
+                mock.patch.object(notification_obj.NotificationList,
+                                  "release") as mock_release, \
+                mock.patch.object(self.engine, "_process_notification",
+                                  side_effect=fake_process_notification):
+            self.engine._process_unfinished_notifications(self.context)
+
+        mock_release.assert_called_once_with(self.context,
+                                             self.engine._claim_owner)
+
+        return calls, max_running
+
+    def test_process_unfinished_notifications_in_parallel(
+            self, mock_notification_get):
+        mock_notification_get.return_value = (
+            fakes.create_fake_notification(payload={}, status="finished"))
+        notifications = self._get_unfinished_notifications()
+
+        calls, max_running = self._run_unfinished_notifications(
+            notifications)
+
+        self.assertEqual(3, len(calls))
+        # notifications of the same host are processed in order
+        self.assertLess(calls.index(uuidsentinel.fake_notification_1),
+                        calls.index(uuidsentinel.fake_notification_3))
+        # both hosts are recovered at the same time ...
+        self.assertEqual(2, max(total for total, _ in max_running))
+        # ... but never two notifications of the same host
+        self.assertEqual(1, max(per_host for _, per_host in max_running))
+        self.assertEqual(0, self.engine._unfinished_notifications_queued)
+
+    def test_process_unfinished_notifications_single_worker(
+            self, mock_notification_get):
+        self.override_config('process_unfinished_notifications_workers', 1)
+        mock_notification_get.return_value = (
+            fakes.create_fake_notification(payload={}, status="finished"))
+        notifications = self._get_unfinished_notifications()
+
+        calls, max_running = self._run_unfinished_notifications(
+            notifications)
+
+        self.assertEqual([uuidsentinel.fake_notification_1,
+                          uuidsentinel.fake_notification_3,
+                          uuidsentinel.fake_notification_2], calls)
+        self.assertEqual(1, max(total for total, _ in max_running))
+
+    @mock.patch.object(notification_obj.Notification, "save")
+    def test_process_unfinished_notifications_host_failure_isolated(
+            self, mock_save, mock_notification_get):
+        notifications = self._get_unfinished_notifications()
+
+        calls, _ = self._run_unfinished_notifications(
+            notifications, error_host=uuidsentinel.fake_host_1)
+
+        # the failed recovery of host 1 doesn't skip its remaining
+        # notifications
+        self.assertEqual(3, len(calls))
+        self.assertLess(calls.index(uuidsentinel.fake_notification_1),
+                        calls.index(uuidsentinel.fake_notification_3))
+        # the notifications of host 1 are marked failed as before, without
+        # being read again
+        self.assertEqual(["failed", "error", "failed"],
+                         [notification.status
+                          for notification in notifications])
+        mock_save.assert_has_calls([mock.call(expected_status="error"),
+                                    mock.call(expected_status="error")])
+        self.assertEqual(2, mock_save.call_count)
+        mock_notification_get.assert_not_called()
+
+    @mock.patch.object(notification_obj.Notification, "save")
+    def test_process_unfinished_notifications_exception_isolated(
+            self, mock_save, mock_notification_get):
+        notifications = self._get_unfinished_notifications()
+
+        calls, _ = self._run_unfinished_notifications(
+            notifications, fail_notification=uuidsentinel.fake_notification_1,
+            status="error")
+
+        # the failure of a notification doesn't skip the remaining
+        # notifications of its host
+        self.assertEqual(3, len(calls))
+        self.assertLess(calls.index(uuidsentinel.fake_notification_1),
+                        calls.index(uuidsentinel.fake_notification_3))
+        self.assertEqual(["error", "failed", "failed"],
+                         [notification.status
+                          for notification in notifications])
+        self.assertEqual(2, mock_save.call_count)
+
+    @mock.patch.object(timeutils, 'utcnow', return_value=NOW)
+    def test_process_unfinished_notifications_new_generated_before(
+            self, mock_utcnow, mock_notification_get):
+        with mock.patch.object(notification_obj.NotificationList, "claim",
+                               return_value=[]) as mock_claim, \
+                mock.patch.object(notification_obj.NotificationList,
+                                  "release") as mock_release:
+            self.engine._process_unfinished_notifications(self.context)
+
+        mock_claim.assert_called_once_with(
+            self.context, self.engine._claim_owner,
+            NOW + datetime.timedelta(seconds=CONF.notification_lease_time),
+            NOW - datetime.timedelta(
+                seconds=CONF.retry_notification_new_status_interval),
+            CONF.process_unfinished_notifications_batch_size)
+        # Nothing was claimed, so there is nothing to release.
+        mock_release.assert_not_called()
+
+    @mock.patch.object(timeutils, 'utcnow', return_value=NOW)
+    @mock.patch.object(notification_obj.NotificationList, "renew_leases")
+    def test_renew_notification_leases(self, mock_renew_leases, mock_utcnow,
+                                       mock_notification_get):
+        mock_renew_leases.side_effect = [exception.MasakariException(), 1]
+
+        # A failure to renew the leases is logged and retried at the next
+        # interval.
+        self.engine._renew_notification_leases(self.context)
+        self.engine._renew_notification_leases(self.context)
+
+        mock_renew_leases.assert_called_with(
+            self.context, self.engine._claim_owner,
+            NOW + datetime.timedelta(seconds=CONF.notification_lease_time))
+        self.assertEqual(2, mock_renew_leases.call_count)
+
+    @mock.patch.object(notification_obj.Notification, "save")
+    def test_process_unfinished_notification_already_processed(
+            self, mock_save, mock_notification_get):
+        # The status of the notification changed since it was listed.
+        mock_save.side_effect = [
+            exception.UnexpectedNotificationStatus(
+                uuid=uuidsentinel.fake_notification_1, expected="new",
+                actual="error"),
+            None]
+        notification = fakes.create_fake_notification(
+            type="COMPUTE_HOST", payload={}, status="new",
+            source_host_uuid=uuidsentinel.fake_host_1,
+            notification_uuid=uuidsentinel.fake_notification_1)
+
+        self.engine._process_unfinished_notification(self.context,
+                                                     notification)
+
         self.assertEqual("failed", notification.status)
+        self.assertEqual([mock.call(expected_status="new",
+                                    owner=self.engine._claim_owner,
+                                    lease_expires_at=mock.ANY),
+                          mock.call(expected_status="error")],
+                         mock_save.call_args_list)
+
+    @mock.patch.object(notification_obj.Notification, "save")
+    def test_process_unfinished_notification_failed_concurrently(
+            self, mock_save, mock_notification_get):
+        mock_save.side_effect = exception.UnexpectedNotificationStatus(
+            uuid=uuidsentinel.fake_notification_1, expected="error",
+            actual="failed")
+        notification = fakes.create_fake_notification(
+            type="COMPUTE_HOST", payload={}, status="error",
+            source_host_uuid=uuidsentinel.fake_host_1,
+            notification_uuid=uuidsentinel.fake_notification_1)
+
+        with mock.patch.object(self.engine, "_process_notification",
+                               return_value="error"), \
+                mock.patch("masakari.engine.manager.LOG") as mock_log:
+            self.engine._process_unfinished_notification(self.context,
+                                                         notification)
+
+        mock_save.assert_called_once_with(expected_status="error")
+        mock_log.warning.assert_called_once()
+        mock_log.error.assert_not_called()
+
+    def test_process_notifications(self, mock_notification_get):
+        notifications = self._get_unfinished_notifications()
+        calls = []
+
+        def fake_process_notification(context, notification):
+            calls.append(notification.notification_uuid)
+            if (notification.notification_uuid ==
+                    uuidsentinel.fake_notification_1):
+                raise exception.MasakariException()
+
+        with mock.patch.object(self.engine, "process_notification",
+                               side_effect=fake_process_notification):
+            self.engine.process_notifications(self.context, notifications)
+
+        # a failure doesn't stop the other notifications of the batch
+        self.assertEqual(3, len(calls))
+        self.assertLess(calls.index(uuidsentinel.fake_notification_1),
+                        calls.index(uuidsentinel.fake_notification_3))
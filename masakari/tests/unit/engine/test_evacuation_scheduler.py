@@ -0,0 +1,134 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+import eventlet
+from eventlet import event
+
+from masakari.engine import evacuation_scheduler
+from masakari import exception
+from masakari.tests.unit import base
+
+
+class EvacuationSchedulerTestCase(base.NoDBTestCase):
+
+    def setUp(self):
+        super(EvacuationSchedulerTestCase, self).setUp()
+        self.override_config('initial_concurrent_evacuations', 2,
+                             'host_failure')
+        self.override_config('max_concurrent_evacuations', 4, 'host_failure')
+        self.scheduler = evacuation_scheduler.EvacuationScheduler()
+
+    def _hold(self, name, priority, started, release):
+        with self.scheduler.slot(priority):
+            started.append(name)
+            release.wait()
+
+    def _request(self, slot, error=None):
+        with slot.measure():
+            if error:
+                raise error
+
+    def test_initial_limit(self):
+        self.assertEqual(2, self.scheduler.limit)
+
+        self.override_config('max_concurrent_evacuations', 1, 'host_failure')
+        self.scheduler.reset()
+
+        self.assertEqual(1, self.scheduler.limit)
+
+    def test_slots_started_by_priority(self):
+        started = []
+        release = event.Event()
+        threads = [
+            eventlet.spawn(self._hold, name, priority, started, release)
+            for name, priority in [('first', (False, 0)),
+                                   ('second', (False, 0)),
+                                   ('low', (True, 0)),
+                                   ('high', (False, -10)),
+                                   ('ha', (False, 0))]]
+        eventlet.sleep(0)
+
+        self.assertEqual(['first', 'second'], started)
+        self.assertEqual({'limit': 2, 'in_flight': 2, 'waiting': 3},
+                         self.scheduler.stats())
+
+        release.send()
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(['first', 'second', 'high', 'ha', 'low'], started)
+        self.assertEqual({'limit': 2, 'in_flight': 0, 'waiting': 0},
+                         self.scheduler.stats())
+
+    def test_limit_increased_after_successes(self):
+        with self.scheduler.slot() as slot:
+            self._request(slot)
+            self.assertEqual(2, self.scheduler.limit)
+            self._request(slot)
+            self.assertEqual(3, self.scheduler.limit)
+            for i in range(10):
+                self._request(slot)
+
+        self.assertEqual(4, self.scheduler.limit)
+
+    def test_limit_decreased_once_per_generation(self):
+        self.override_config('initial_concurrent_evacuations', 4,
+                             'host_failure')
+        self.scheduler.reset()
+
+        with self.scheduler.slot() as first, \
+                self.scheduler.slot() as second:
+            self.assertRaises(exception.Conflict, self._request, first,
+                              exception.Conflict(reason='conflict'))
+            self.assertEqual(2, self.scheduler.limit)
+            # started before the decrease, doesn't count again
+            self.assertRaises(ValueError, self._request, second,
+                              ValueError())
+            self.assertEqual(2, self.scheduler.limit)
+
+        with self.scheduler.slot() as slot:
+            self.assertRaises(ValueError, self._request, slot, ValueError())
+
+        self.assertEqual(1, self.scheduler.limit)
+
+    @mock.patch.object(evacuation_scheduler.timeutils, 'now')
+    def test_limit_decreased_on_slow_request(self, mock_now):
+        self.override_config('evacuation_latency_threshold', 5,
+                             'host_failure')
+        mock_now.side_effect = [0, 6]
+
+        with self.scheduler.slot() as slot:
+            self._request(slot)
+
+        self.assertEqual(1, self.scheduler.limit)
+
+    def test_killed_waiter_removed(self):
+        self.override_config('initial_concurrent_evacuations', 1,
+                             'host_failure')
+        self.scheduler.reset()
+        started = []
+        release = event.Event()
+        holder = eventlet.spawn(self._hold, 'holder', (False, 0), started,
+                                release)
+        waiter = eventlet.spawn(self._hold, 'waiter', (False, 0), started,
+                                release)
+        eventlet.sleep(0)
+
+        waiter.kill()
+        release.send()
+        holder.wait()
+
+        self.assertEqual(['holder'], started)
+        self.assertEqual({'limit': 1, 'in_flight': 0, 'waiting': 0},
+                         self.scheduler.stats())
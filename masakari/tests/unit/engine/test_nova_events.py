@@ -0,0 +1,118 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+import eventlet
+import oslo_messaging as messaging
+from oslo_service import loopingcall
+
+from masakari import conf
+from masakari import context
+from masakari.engine import manager
+from masakari.engine import nova_events
+from masakari.tests.unit import base
+from masakari.tests import uuidsentinel as uuids
+
+CONF = conf.CONF
+
+
+class NovaEventsTestCase(base.NoDBTestCase):
+
+    def setUp(self):
+        super(NovaEventsTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        transport = messaging.get_notification_transport(CONF, url='fake:/')
+        self.addCleanup(transport.cleanup)
+        self.stub_out('masakari.rpc.NOTIFICATION_TRANSPORT', transport)
+        self.override_config('nova_notifications_exchange',
+                             CONF.control_exchange)
+        self.override_config('nova_notifications_verify_interval', 30)
+        self.notifier = messaging.Notifier(
+            transport, publisher_id='nova-compute:fake-host',
+            driver='messaging', topics=['versioned_notifications'])
+
+        self.nova_events = nova_events.NovaEvents()
+        self.nova_events.start()
+        self.addCleanup(self.nova_events.stop)
+
+        self.vm_state = 'active'
+        self.checks = 0
+
+    def _wait_for_stopped(self):
+        self.checks += 1
+        if self.vm_state == 'stopped':
+            raise loopingcall.LoopingCallDone()
+
+    def _notify(self, event_type, instance_uuid):
+        payload = {'nova_object.name': 'InstanceActionPayload',
+                   'nova_object.data': {'uuid': instance_uuid}}
+        self.notifier.info(self.ctxt, event_type, payload)
+
+    def test_wait_woken_up_by_notification(self):
+        self.assertTrue(self.nova_events.listening)
+        thread = eventlet.spawn(self.nova_events.wait, uuids.instance,
+                                self._wait_for_stopped, 10)
+        eventlet.sleep(0.1)
+        self.assertEqual(1, self.checks)
+
+        self.vm_state = 'stopped'
+        self._notify('instance.power_off.end', uuids.instance)
+
+        with eventlet.Timeout(5):
+            thread.wait()
+        self.assertEqual(2, self.checks)
+
+    def test_wait_ignores_other_notifications(self):
+        thread = eventlet.spawn(self.nova_events.wait, uuids.instance,
+                                self._wait_for_stopped, 0.5)
+        eventlet.sleep(0.1)
+
+        self._notify('instance.power_off.start', uuids.instance)
+        self._notify('instance.power_off.end', uuids.other_instance)
+
+        self.assertRaises(loopingcall.LoopingCallTimeOut, thread.wait)
+        # checked when the wait starts and once more when it times out
+        self.assertEqual(2, self.checks)
+
+    def test_wait_already_done(self):
+        self.vm_state = 'stopped'
+
+        self.nova_events.wait(uuids.instance, self._wait_for_stopped, 10)
+
+        self.assertEqual(1, self.checks)
+        self.assertEqual({}, self.nova_events._waiters)
+
+    def test_stop(self):
+        self.nova_events.stop()
+
+        self.assertFalse(self.nova_events.listening)
+
+
+class NovaEventsManagerTestCase(base.NoDBTestCase):
+
+    @mock.patch.object(nova_events.NOVA_EVENTS, 'start')
+    def test_post_start_hook(self, mock_start):
+        engine_manager = manager.MasakariManager()
+
+        engine_manager.post_start_hook()
+        self.assertFalse(mock_start.called)
+
+        self.override_config('nova_notifications_listener', True)
+        engine_manager.post_start_hook()
+        mock_start.assert_called_once_with()
+
+    @mock.patch.object(nova_events.NOVA_EVENTS, 'stop')
+    def test_cleanup_host(self, mock_stop):
+        manager.MasakariManager().cleanup_host()
+
+        mock_stop.assert_called_once_with()
@@ -73,7 +73,8 @@ class EngineRpcAPITestCase(base.TestCase):
                     self.assertEqual(expected_arg, arg)
 
                 for kwarg, value in self.fake_kwargs.items():
-                    if isinstance(value, objects.Notification):
+                    if isinstance(value, (objects.Notification,
+                                          objects.NotificationList)):
                         expected_back = expected_msg[kwarg].obj_to_primitive()
                         backup = value.obj_to_primitive()
                         self.assertEqual(expected_back, backup)
@@ -94,3 +95,25 @@ class EngineRpcAPITestCase(base.TestCase):
                               rpc_method='call',
                               notification=self.fake_notification_obj,
                               version='1.1')
+
+    @mock.patch("masakari.rpc.get_client")
+    def test_process_notifications(self, mock_get_client):
+        self._test_engine_api('process_notifications',
+                              rpc_method='cast',
+                              notifications=objects.NotificationList(
+                                  objects=[self.fake_notification_obj]),
+                              version='1.2')
+
+    @mock.patch.object(engine_rpcapi.EngineAPI, 'process_notification')
+    @mock.patch("masakari.rpc.get_client")
+    def test_process_notifications_old_engine(self, mock_get_client,
+                                              mock_process_notification):
+        mock_get_client.return_value.can_send_version.return_value = False
+        rpcapi = engine_rpcapi.EngineAPI()
+
+        rpcapi.process_notifications(self.context,
+                                     [self.fake_notification_obj])
+
+        mock_process_notification.assert_called_once_with(
+            self.context, self.fake_notification_obj)
+        mock_get_client.return_value.cast.assert_not_called()
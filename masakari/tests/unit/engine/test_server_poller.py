@@ -0,0 +1,94 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+import eventlet
+from oslo_service import loopingcall
+
+from masakari import context
+from masakari.engine import server_poller
+from masakari import exception
+from masakari.tests.unit import base
+from masakari.tests.unit import fakes
+from masakari.tests import uuidsentinel as uuids
+
+
+class ServerStatePollerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ServerStatePollerTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.fake_client = fakes.FakeNovaClient()
+        self.novaclient = mock.Mock()
+        self.novaclient.get_servers_changed_since.side_effect = (
+            lambda ctxt, since: self.fake_client.servers.list())
+        self.poller = server_poller.ServerStatePoller(
+            self.ctxt, self.novaclient, interval=0.01)
+
+    @staticmethod
+    def _wait_for_state(vm_state):
+        def _condition(server):
+            if getattr(server, 'OS-EXT-STS:vm_state') == vm_state:
+                raise loopingcall.LoopingCallDone()
+        return _condition
+
+    def test_wait_shares_list_requests(self):
+        server_1 = self.fake_client.servers.create(id=uuids.server_1,
+                                                   vm_state='active')
+        self.fake_client.servers.create(id=uuids.server_2,
+                                        vm_state='stopped')
+
+        threads = [
+            eventlet.spawn(self.poller.wait, uuids.server_1,
+                           self._wait_for_state('stopped'), 5),
+            eventlet.spawn(self.poller.wait, uuids.server_2,
+                           self._wait_for_state('stopped'), 5),
+        ]
+        eventlet.sleep(0.05)
+        setattr(server_1, 'OS-EXT-STS:vm_state', 'stopped')
+        for thread in threads:
+            thread.wait()
+
+        # Every tick serves both waiters with a single list request.
+        calls = self.novaclient.get_servers_changed_since.call_count
+        self.assertLess(calls, 10)
+        self.assertEqual({}, self.poller._waiters)
+        eventlet.sleep(0.05)
+        self.assertIsNone(self.poller._thread)
+
+    def test_wait_timeout(self):
+        self.fake_client.servers.create(id=uuids.server_1, vm_state='active')
+
+        self.assertRaises(loopingcall.LoopingCallTimeOut,
+                          self.poller.wait, uuids.server_1,
+                          self._wait_for_state('stopped'), 0.05)
+        self.assertEqual({}, self.poller._waiters)
+
+    def test_wait_condition_error(self):
+        self.fake_client.servers.create(id=uuids.server_1, vm_state='error')
+
+        def _condition(server):
+            raise exception.InstanceEvacuateFailed(instance_uuid=server.id)
+
+        self.assertRaises(exception.InstanceEvacuateFailed,
+                          self.poller.wait, uuids.server_1, _condition, 5)
+
+    def test_wait_list_failure_is_retried(self):
+        self.fake_client.servers.create(id=uuids.server_1, vm_state='stopped')
+        self.novaclient.get_servers_changed_since.side_effect = [
+            exception.MasakariException('nova-api unavailable'),
+            self.fake_client.servers.list()]
+
+        self.poller.wait(uuids.server_1, self._wait_for_state('stopped'), 5)
+        self.assertEqual(
+            2, self.novaclient.get_servers_changed_since.call_count)
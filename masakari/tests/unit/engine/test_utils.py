@@ -13,7 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import socket
 import testtools
 from unittest import mock
 
@@ -48,7 +47,7 @@ class TestApiUtils(testtools.TestCase):
             mock_engine_notification)
         mock_engine_notification.emit.return_value = None
         mock_publisher = mock.Mock()
-        mock_NotificationPublisher.return_value = mock_publisher
+        mock_NotificationPublisher.from_binary.return_value = mock_publisher
         mock_event_type = mock.Mock()
         mock_EventType.return_value = mock_event_type
 
@@ -70,7 +69,6 @@ class TestApiUtils(testtools.TestCase):
             publisher=mock_publisher,
             event_type=mock_event_type,
             payload=mock_payload)
-        mock_NotificationPublisher.assert_called_once_with(
-            context=mock_context, host=socket.gethostname(),
-            binary='masakari-engine')
+        mock_NotificationPublisher.from_binary.assert_called_once_with(
+            'masakari-engine')
         mock_engine_notification.emit.assert_called_once_with(mock_context)
@@ -76,7 +76,8 @@ class FakeNovaClient(object):
                     return s
             return None
 
-        def list(self, detailed=True, search_opts=None):
+        def list(self, detailed=True, search_opts=None, marker=None,
+                 limit=None):
             matching = list(self._servers)
             if search_opts:
                 for opt, val in search_opts.items():
@@ -143,21 +144,25 @@ class FakeNovaClient(object):
                     return aggregate
 
     class Service(object):
-        def __init__(self, id=None, host=None, binary=None, status='enabled'):
+        def __init__(self, id=None, host=None, binary=None, status='enabled',
+                     state='up'):
             self.id = id
             self.host = host
             self.binary = binary
             self.status = status
+            self.state = state
+            self.forced_down = False
 
     class Services(object):
         def __init__(self):
             self._services = []
 
         def create(self, id, host=None, binary=None,
-                   status=None):
+                   status=None, state='up'):
             self._services.append(FakeNovaClient.Service(id=id, host=host,
                                                          binary=binary,
-                                                         status=status))
+                                                         status=status,
+                                                         state=state))
 
         def disable(self, service_id):
             for _service in self._services:
@@ -179,6 +184,12 @@ class FakeNovaClient(object):
             service.status = 'disabled'
             service.disabled_reason = reason
 
+        def force_down(self, service_id, force_down):
+            for _service in self._services:
+                if _service.id == service_id:
+                    service = _service
+            service.forced_down = force_down
+
     def __init__(self):
         self.servers = FakeNovaClient.ServerManager()
         self.services = FakeNovaClient.Services()
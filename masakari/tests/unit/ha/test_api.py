@@ -16,13 +16,15 @@
 """Tests for the failover segment api."""
 
 import copy
+import datetime
 from unittest import mock
 
 from oslo_utils import timeutils
+from oslo_utils import uuidutils
 
 from masakari.api import utils as api_utils
 from masakari.compute import nova as nova_obj
-from masakari import coordination
+from masakari import conf
 from masakari.engine import rpcapi as engine_rpcapi
 from masakari import exception
 from masakari.ha import api as ha_api
@@ -38,6 +40,7 @@ from masakari.tests.unit import base
 from masakari.tests.unit import fakes as fakes_data
 from masakari.tests import uuidsentinel
 
+CONF = conf.CONF
 NOW = timeutils.utcnow().replace(microsecond=0)
 
 
@@ -726,29 +729,18 @@ class NotificationAPITestCase(base.NoDBTestCase):
         )
         self.exception_duplicate = exception.DuplicateNotification(
             host='host_1', type='COMPUTE_HOST')
-        coordination.Coordinator.get_lock = mock.MagicMock()
 
     def _assert_notification_data(self, expected, actual):
         self.assertTrue(obj_base.obj_equal_prims(expected, actual),
                         "The notification objects were not equal")
 
-    @mock.patch.object(notification_obj.NotificationList, 'get_all')
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists')
     @mock.patch.object(notification_obj, 'Notification')
     @mock.patch.object(notification_obj.Notification, 'create')
     @mock.patch.object(host_obj.Host, 'get_by_name')
     def test_create(self, mock_host_obj, mock_create, mock_notification_obj,
-                    mock_get_all):
-        fake_notification = fakes_data.create_fake_notification(
-            type="COMPUTE_HOST", id=2, payload={
-                'event': 'STARTED', 'host_status': 'NORMAL',
-                'cluster_status': 'ONLINE'
-            },
-            source_host_uuid=uuidsentinel.fake_host, generated_time=NOW,
-            status="running",
-            notification_uuid=uuidsentinel.fake_notification_2
-        )
-        fake_notification_list = [self.notification, fake_notification]
-        mock_get_all.return_value = fake_notification_list
+                    mock_duplicate_exists):
+        mock_duplicate_exists.return_value = False
         notification_data = {"hostname": "fake_host",
                              "payload": {"event": "STARTED",
                                          "host_status": "NORMAL",
@@ -765,23 +757,14 @@ class NotificationAPITestCase(base.NoDBTestCase):
             self.notification, _make_notification_obj(result))
 
     @mock.patch.object(api_utils, 'notify_about_notification_api')
-    @mock.patch.object(notification_obj.NotificationList, 'get_all')
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists')
     @mock.patch.object(notification_obj.Notification, 'create')
     @mock.patch.object(host_obj.Host, 'get_by_name')
     def test_create_notification_exception(self, mock_host_obj,
-                                           mock_notification_obj, mock_get_all,
+                                           mock_notification_obj,
+                                           mock_duplicate_exists,
                                            mock_notify_about_notification_api):
-        fake_notification = fakes_data.create_fake_notification(
-            type="COMPUTE_HOST", id=2, payload={
-                'event': 'STARTED', 'host_status': 'NORMAL',
-                'cluster_status': 'ONLINE'
-            },
-            source_host_uuid=uuidsentinel.fake_host, generated_time=NOW,
-            status="running",
-            notification_uuid=uuidsentinel.fake_notification_2
-        )
-        fake_notification_list = [self.notification, fake_notification]
-        mock_get_all.return_value = fake_notification_list
+        mock_duplicate_exists.return_value = False
         notification_data = {"hostname": "fake_host",
                              "payload": {"event": "STARTED",
                                          "host_status": "NORMAL",
@@ -821,53 +804,229 @@ class NotificationAPITestCase(base.NoDBTestCase):
                           self.notification_api.create_notification,
                           self.context, notification_data)
 
-    @mock.patch('masakari.ha.api.time.sleep')
-    @mock.patch('masakari.ha.api.random.uniform', return_value=2.5)
-    @mock.patch.object(ha_api.NotificationAPI,
-                       '_create_host_type_notification')
-    def test_create_notification_add_pause_when_no_coordinator(
-        self, mock_create_host, mock_uniform, mock_sleep
-    ):
-        # When no coordinator configured (backend_url=NULL) add a random pause
-        self.override_config('backend_url', '', group='coordination')
-        self.override_config('notification_delay_max', 5)
-
-        notification_data = {
-            "hostname": "host_1",
-            "type": fields.NotificationType.COMPUTE_HOST,
-        }
+    @mock.patch.object(api_utils, 'notify_about_notification_api')
+    @mock.patch.object(engine_rpcapi.EngineAPI, 'process_notification')
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists')
+    @mock.patch.object(notification_obj.Notification, 'create')
+    @mock.patch.object(host_obj.Host, 'get_by_name')
+    def test_create_notification_concurrent_duplicate(
+            self, mock_host_obj, mock_create, mock_duplicate_exists,
+            mock_process_notification, mock_notify_about_notification_api):
+        mock_host_obj.return_value = self.host
+        mock_duplicate_exists.return_value = False
+        mock_create.side_effect = exception.DuplicateNotification(
+            type='COMPUTE_HOST')
+        notification_data = {"hostname": "host_1",
+                             "payload": {'event': 'STOPPED',
+                                         'host_status': 'NORMAL',
+                                         'cluster_status': 'ONLINE'},
+                             "type": "COMPUTE_HOST",
+                             "generated_time": str(NOW)}
 
-        self.notification_api.create_notification(
-            self.context, notification_data)
-
-        mock_uniform.assert_called_once_with(0, 5)
-        mock_sleep.assert_called_once_with(2.5)
-        mock_create_host.assert_called_once_with(
-            self.context, notification_data)
-
-    @mock.patch('masakari.ha.api.time.sleep')
-    @mock.patch('masakari.ha.api.random.uniform')
-    @mock.patch.object(ha_api.NotificationAPI,
-                       '_create_host_type_notification')
-    def test_create_notification_disabled_pause_when_no_coordinator(
-        self, mock_create_host, mock_uniform, mock_sleep
-    ):
-        # When no coordinator configured (backend_url=NULL) add a random pause
-        self.override_config('backend_url', '', group='coordination')
-        self.override_config('notification_delay_max', 0)
-
-        notification_data = {
-            "hostname": "host_1",
-            "type": fields.NotificationType.COMPUTE_HOST,
-        }
+        ex = self.assertRaises(exception.DuplicateNotification,
+                               self.notification_api.create_notification,
+                               self.context, notification_data)
+
+        self.assertIn('is duplicate', str(ex))
+        mock_process_notification.assert_not_called()
+        mock_notify_about_notification_api.assert_not_called()
+
+    @mock.patch.object(host_obj.Host, 'get_by_name')
+    @mock.patch.object(notification_obj.Notification,
+                       'get_by_idempotency_key')
+    def test_create_notification_idempotent_replay(
+            self, mock_get_by_idempotency_key, mock_host_obj):
+        notification_data = {"hostname": "host_1",
+                             "payload": {'event': 'STOPPED',
+                                         'host_status': 'NORMAL',
+                                         'cluster_status': 'ONLINE'},
+                             "type": "COMPUTE_HOST",
+                             "generated_time": str(NOW)}
+        self.notification.idempotency_fingerprint = (
+            notification_obj.request_fingerprint(
+                'host_1', 'COMPUTE_HOST',
+                notification_obj.payload_hash(notification_data['payload'])))
+        mock_get_by_idempotency_key.return_value = self.notification
+
+        result = self.notification_api.create_notification(
+            self.context, notification_data, idempotency_key='fake-key')
+
+        self.assertIs(self.notification, result)
+        mock_get_by_idempotency_key.assert_called_once_with(
+            self.context, 'fake-key', mock.ANY)
+        mock_host_obj.assert_not_called()
+
+    @mock.patch.object(host_obj.Host, 'get_by_name')
+    @mock.patch.object(notification_obj.Notification,
+                       'get_by_idempotency_key')
+    def test_create_notification_idempotency_key_reused(
+            self, mock_get_by_idempotency_key, mock_host_obj):
+        self.notification.idempotency_fingerprint = (
+            notification_obj.request_fingerprint(
+                'host_1', 'COMPUTE_HOST',
+                notification_obj.payload_hash({'event': 'STARTED'})))
+        mock_get_by_idempotency_key.return_value = self.notification
+        notification_data = {"hostname": "host_1",
+                             "payload": {'event': 'STOPPED'},
+                             "type": "COMPUTE_HOST",
+                             "generated_time": str(NOW)}
+
+        self.assertRaises(exception.IdempotencyKeyReused,
+                          self.notification_api.create_notification,
+                          self.context, notification_data,
+                          idempotency_key='fake-key')
+        mock_host_obj.assert_not_called()
+
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists',
+                       return_value=False)
+    @mock.patch.object(notification_obj.Notification, 'create')
+    @mock.patch.object(host_obj.Host, 'get_by_name')
+    @mock.patch.object(notification_obj.Notification,
+                       'get_by_idempotency_key')
+    def test_create_notification_stores_idempotency_key(
+            self, mock_get_by_idempotency_key, mock_host_obj, mock_create,
+            mock_duplicate_exists):
+        mock_get_by_idempotency_key.side_effect = (
+            exception.NotificationNotFound(id='fake-key'))
+        mock_host_obj.return_value = self.host
+        notification_data = {"hostname": "host_1",
+                             "payload": {'event': 'STOPPED',
+                                         'host_status': 'NORMAL',
+                                         'cluster_status': 'ONLINE'},
+                             "type": "COMPUTE_HOST",
+                             "generated_time": str(NOW)}
+
+        result = self.notification_api.create_notification(
+            self.context, notification_data, idempotency_key='fake-key')
+
+        self.assertEqual('fake-key', result.idempotency_key)
+        self.assertEqual(
+            notification_obj.request_fingerprint(
+                'host_1', 'COMPUTE_HOST',
+                notification_obj.payload_hash(notification_data['payload'])),
+            result.idempotency_fingerprint)
+        mock_create.assert_called_once_with()
+
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists',
+                       return_value=False)
+    @mock.patch.object(notification_obj.Notification, 'create')
+    @mock.patch.object(host_obj.Host, 'get_by_name')
+    @mock.patch.object(notification_obj.Notification,
+                       'get_by_idempotency_key')
+    def test_create_notification_idempotency_disabled(
+            self, mock_get_by_idempotency_key, mock_host_obj, mock_create,
+            mock_duplicate_exists):
+        self.override_config('notification_idempotency_window', 0)
+        mock_host_obj.return_value = self.host
+        notification_data = {"hostname": "host_1",
+                             "payload": {'event': 'STOPPED',
+                                         'host_status': 'NORMAL',
+                                         'cluster_status': 'ONLINE'},
+                             "type": "COMPUTE_HOST",
+                             "generated_time": str(NOW)}
+
+        result = self.notification_api.create_notification(
+            self.context, notification_data, idempotency_key='fake-key')
+
+        self.assertIsNone(result.idempotency_key)
+        self.assertIsNone(result.idempotency_fingerprint)
+        mock_get_by_idempotency_key.assert_not_called()
+
+    def _batch_item(self, hostname, event, type="VM"):
+        return {"hostname": hostname,
+                "payload": {"event": event, "instance_uuid": "fake-uuid",
+                            "vir_domain_event": "STOPPED_FAILED"},
+                "type": type,
+                "generated_time": str(NOW)}
+
+    @mock.patch.object(notification_obj.NotificationList, 'create_all')
+    @mock.patch.object(notification_obj.NotificationList, 'get_all')
+    @mock.patch.object(host_obj.HostList, 'get_all')
+    def test_create_notifications(self, mock_host_get_all, mock_get_all,
+                                  mock_create_all):
+        host_2 = fakes_data.create_fake_host(
+            name="host_2", id=2, on_maintenance=True,
+            uuid=uuidsentinel.fake_host_2)
+        mock_host_get_all.return_value = [self.host, host_2]
+        mock_get_all.return_value = [fakes_data.create_fake_notification(
+            type="VM", payload=self._batch_item("host_1", "STOPPED")[
+                "payload"],
+            source_host_uuid=self.host.uuid, generated_time=NOW)]
+
+        def fake_create_all(context, notifications):
+            for notification in notifications:
+                notification.notification_uuid = uuidutils.generate_uuid()
+            # The PROCESS notification loses the race against a concurrent
+            # request.
+            return objects.NotificationList(
+                objects=[notification for notification in notifications
+                         if notification.type == "VM"])
+
+        mock_create_all.side_effect = fake_create_all
+        notifications_data = [
+            self._batch_item("unknown", "STOPPED"),
+            self._batch_item("host_2", "STOPPED"),
+            self._batch_item("host_1", "STOPPED"),
+            self._batch_item("host_1", "LIFECYCLE"),
+            self._batch_item("host_1", "LIFECYCLE"),
+            self._batch_item("host_1", "STARTED", type="PROCESS"),
+        ]
+
+        results = self.notification_api.create_notifications(
+            self.context, notifications_data)
+
+        self.assertIsInstance(results[0], exception.HostNotFoundByName)
+        self.assertIsInstance(results[1], exception.HostOnMaintenanceError)
+        for index in (2, 4, 5):
+            self.assertIsInstance(results[index],
+                                  exception.DuplicateNotification)
+        self.assertIsInstance(results[3], objects.Notification)
+        self.assertEqual(self.host.uuid, results[3].source_host_uuid)
+        mock_host_get_all.assert_called_once_with(
+            self.context, filters={'name': ['host_1', 'host_2', 'unknown']})
+        mock_get_all.assert_called_once_with(self.context, filters=mock.ANY)
+        created = mock_create_all.call_args[0][1]
+        self.assertEqual(['VM', 'PROCESS'],
+                         [notification.type for notification in created])
+        (self.notification_api.engine_rpcapi.process_notifications.
+         assert_called_once_with(self.context, mock.ANY))
+
+    @mock.patch.object(notification_obj.NotificationList, 'create_all')
+    @mock.patch.object(notification_obj.NotificationList, 'get_all')
+    @mock.patch.object(host_obj.HostList, 'get_all')
+    def test_create_notifications_nothing_to_create(
+            self, mock_host_get_all, mock_get_all, mock_create_all):
+        mock_host_get_all.return_value = []
 
-        self.notification_api.create_notification(
-            self.context, notification_data)
+        results = self.notification_api.create_notifications(
+            self.context, [self._batch_item("unknown", "STOPPED")])
 
-        mock_uniform.assert_not_called()
-        mock_sleep.assert_not_called()
-        mock_create_host.assert_called_once_with(
-            self.context, notification_data)
+        self.assertIsInstance(results[0], exception.HostNotFoundByName)
+        mock_get_all.assert_not_called()
+        mock_create_all.assert_not_called()
+        (self.notification_api.engine_rpcapi.process_notifications.
+         assert_not_called())
+
+    @mock.patch.object(api_utils, 'notify_about_notification_api')
+    @mock.patch.object(notification_obj.NotificationList, 'create_all')
+    @mock.patch.object(notification_obj.NotificationList, 'get_all',
+                       return_value=[])
+    @mock.patch.object(host_obj.HostList, 'get_all')
+    def test_create_notifications_failed(
+            self, mock_host_get_all, mock_get_all, mock_create_all,
+            mock_notify_about_notification_api):
+        mock_host_get_all.return_value = [self.host]
+        mock_create_all.side_effect = exception.MasakariException
+
+        self.assertRaises(exception.MasakariException,
+                          self.notification_api.create_notifications,
+                          self.context,
+                          [self._batch_item("host_1", "STOPPED"),
+                           self._batch_item("host_1", "LIFECYCLE")])
+
+        self.assertEqual(2, mock_notify_about_notification_api.call_count)
+        (self.notification_api.engine_rpcapi.process_notifications.
+         assert_not_called())
 
     @mock.patch.object(exception, 'DuplicateNotification')
     @mock.patch.object(objects, 'Notification')
@@ -896,33 +1055,26 @@ class NotificationAPITestCase(base.NoDBTestCase):
                           self.notification_api.create_notification,
                           self.context, notification_data)
 
-    @mock.patch.object(notification_obj.NotificationList, 'get_all')
-    def test_create_is_duplicate_true(self, mock_get_all):
-        mock_get_all.return_value = [self.notification, ]
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists')
+    def test_create_is_duplicate_true(self, mock_duplicate_exists):
+        mock_duplicate_exists.return_value = True
+        self.notification.generated_time = NOW
 
         self.assertTrue(self.notification_api._is_duplicate_notification(
             self.context, self.notification))
+        mock_duplicate_exists.assert_called_once_with(
+            self.context, self.notification.type,
+            self.notification.source_host_uuid, self.notification.payload,
+            self.notification.generated_time - datetime.timedelta(
+                seconds=CONF.duplicate_notification_detection_interval))
 
-    @mock.patch.object(notification_obj.NotificationList, 'get_all')
-    def test_is_duplicate_true_for_any_notification_status(
-            self, mock_get_all):
-        FAKE_NOTIFICATION_FINISHED = copy.deepcopy(self.notification)
-        FAKE_NOTIFICATION_FINISHED.status = fields.NotificationStatus.FINISHED
-        mock_get_all.return_value = [FAKE_NOTIFICATION_FINISHED]
-        FAKE_NOTIFICATION_NEW = copy.deepcopy(self.notification)
-        FAKE_NOTIFICATION_NEW.status = fields.NotificationStatus.NEW
-        self.assertTrue(self.notification_api._is_duplicate_notification(
-            self.context, FAKE_NOTIFICATION_NEW))
+    @mock.patch.object(notification_obj.Notification, 'duplicate_exists')
+    def test_create_is_duplicate_false(self, mock_duplicate_exists):
+        mock_duplicate_exists.return_value = False
+        self.notification.generated_time = NOW
 
-    @mock.patch.object(notification_obj.NotificationList, 'get_all')
-    def test_create_is_duplicate_false(self, mock_get_all):
-        mock_get_all.return_value = [self.notification, ]
-        FAKE_NOTIFICATION = copy.deepcopy(self.notification)
-        FAKE_NOTIFICATION.payload = {'event': 'STOPPED',
-                                     'host_status': 'UNKNOWN',
-                                     'cluster_status': 'OFFLINE'}
         self.assertFalse(self.notification_api._is_duplicate_notification(
-            self.context, FAKE_NOTIFICATION))
+            self.context, self.notification))
 
     @mock.patch.object(notification_obj.Notification, 'get_by_uuid')
     def test_get_notification(self, mock_get_notification):
@@ -992,6 +1144,88 @@ class NotificationAPITestCase(base.NoDBTestCase):
                           self.notification_api.get_all,
                           self.context, self.req)
 
+    def _fake_progress_details(self):
+        return [notification_obj.NotificationProgressDetails.create(
+            'StopInstanceTask', 1.0,
+            [{'timestamp': '2019-03-11 05:22:20.329171',
+              'message': 'Stopping instance', 'progress': 1.0}],
+            'SUCCESS')]
+
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails, 'save')
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails,
+                       'get_by_notification_uuid')
+    @mock.patch.object(notification_obj.Notification, 'get_by_uuid')
+    def test_get_notification_recovery_workflow_details_cached(
+            self, mock_get_notification, mock_get_details, mock_save):
+        mock_get_notification.return_value = self.notification
+        details = self._fake_progress_details()
+        mock_get_details.return_value = (
+            notification_obj.RecoveryWorkflowDetails(
+                notification_uuid=uuidsentinel.fake_notification,
+                details=details, finished=False))
+
+        result = (self.notification_api.
+                  get_notification_recovery_workflow_details(
+                      self.context, uuidsentinel.fake_notification))
+
+        self.assertEqual(details, result.recovery_workflow_details)
+        self.assertFalse(self.notification_api.engine_rpcapi.
+                         get_notification_recovery_workflow_details.called)
+        self.assertFalse(mock_save.called)
+
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails, 'save')
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails,
+                       'get_by_notification_uuid')
+    @mock.patch.object(notification_obj.Notification, 'get_by_uuid')
+    def test_get_notification_recovery_workflow_details_finished_snapshot(
+            self, mock_get_notification, mock_get_details, mock_save):
+        self.notification.status = fields.NotificationStatus.FINISHED
+        mock_get_notification.return_value = self.notification
+        mock_get_details.side_effect = (
+            exception.RecoveryWorkflowDetailsNotFound(
+                id=uuidsentinel.fake_notification))
+        details = self._fake_progress_details()
+        fake_notification = copy.deepcopy(self.notification)
+        fake_notification.recovery_workflow_details = details
+        mock_rpc = (self.notification_api.engine_rpcapi.
+                    get_notification_recovery_workflow_details)
+        mock_rpc.return_value = fake_notification
+
+        result = (self.notification_api.
+                  get_notification_recovery_workflow_details(
+                      self.context, uuidsentinel.fake_notification))
+
+        self.assertEqual(details, result.recovery_workflow_details)
+        mock_rpc.assert_called_once_with(self.context, self.notification)
+        mock_save.assert_called_once_with()
+
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails, 'save')
+    @mock.patch.object(notification_obj.RecoveryWorkflowDetails,
+                       'get_by_notification_uuid')
+    @mock.patch.object(notification_obj.Notification, 'get_by_uuid')
+    def test_get_notification_recovery_workflow_details_stale_cache(
+            self, mock_get_notification, mock_get_details, mock_save):
+        # The notification finished after the engine last cached the
+        # details, they are read from the engine one more time.
+        self.notification.status = fields.NotificationStatus.FAILED
+        mock_get_notification.return_value = self.notification
+        mock_get_details.return_value = (
+            notification_obj.RecoveryWorkflowDetails(
+                notification_uuid=uuidsentinel.fake_notification,
+                details=[], finished=False))
+        fake_notification = copy.deepcopy(self.notification)
+        fake_notification.recovery_workflow_details = (
+            self._fake_progress_details())
+        mock_rpc = (self.notification_api.engine_rpcapi.
+                    get_notification_recovery_workflow_details)
+        mock_rpc.return_value = fake_notification
+
+        self.notification_api.get_notification_recovery_workflow_details(
+            self.context, uuidsentinel.fake_notification)
+
+        mock_rpc.assert_called_once_with(self.context, self.notification)
+        mock_save.assert_called_once_with()
+
 
 class VMoveAPITestCase(base.NoDBTestCase):
     """Test Case for vmove api."""
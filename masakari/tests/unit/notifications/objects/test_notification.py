@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import collections
+import socket
 from unittest import mock
 
 from oslo_utils import timeutils
@@ -244,6 +245,24 @@ class TestNotificationBase(test_base.NoDBTestCase):
         self.assertIn('test-update-1.json', self.TestNotification.samples)
         self.assertIn('test-update-2.json', self.TestNotification.samples)
 
+    @mock.patch.object(socket, 'gethostname', return_value='fake-host')
+    def test_publisher_from_binary(self, mock_gethostname):
+        self.stub_out('masakari.notifications.objects.base._PUBLISHERS', {})
+
+        publisher = notification.NotificationPublisher.from_binary(
+            'masakari-api')
+
+        self.assertEqual('fake-host', publisher.host)
+        self.assertEqual('masakari-api', publisher.binary)
+        self.assertIs(publisher,
+                      notification.NotificationPublisher.from_binary(
+                          'masakari-api'))
+        self.assertEqual(
+            'masakari-engine',
+            notification.NotificationPublisher.from_binary(
+                'masakari-engine').binary)
+        self.assertEqual(2, mock_gethostname.call_count)
+
 
 class TestNotificationObjectVersions(test_base.NoDBTestCase):
 
@@ -0,0 +1,179 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+import eventlet
+from eventlet import event
+
+from masakari.notifications import emitter
+from masakari.tests.unit import base
+
+
+class NotificationEmitterTestCase(base.NoDBTestCase):
+
+    def setUp(self):
+        super(NotificationEmitterTestCase, self).setUp()
+        self.notifier = mock.Mock()
+        self.notifier.prepare.return_value = self.notifier
+        self.stub_out('masakari.rpc.NOTIFIER', self.notifier)
+        self.emitter = emitter.NotificationEmitter()
+        self.addCleanup(self.emitter.stop)
+
+    def _emit(self, event_type, priority='info', publisher_id='api:host'):
+        self.emitter.emit(mock.sentinel.context, priority, event_type,
+                          publisher_id, {'event': event_type})
+
+    def _sent(self):
+        return [call[1]['event_type']
+                for call in self.notifier.info.call_args_list]
+
+    def test_emit_synchronously(self):
+        self._emit('host.update.start')
+        self._emit('host.update.end')
+        self._emit('host.update.error', priority='error')
+
+        self.assertEqual(['host.update.start', 'host.update.end'],
+                         self._sent())
+        self.notifier.error.assert_called_once_with(
+            mock.sentinel.context, event_type='host.update.error',
+            payload={'event': 'host.update.error'})
+        # The notifier of the publisher is prepared once.
+        self.notifier.prepare.assert_called_once_with(publisher_id='api:host')
+        self.assertIsNone(self.emitter._worker)
+
+    def test_notifiers_reset_with_transport(self):
+        self._emit('host.update.start')
+        notifier = mock.Mock()
+        notifier.prepare.return_value = notifier
+        self.stub_out('masakari.rpc.NOTIFIER', notifier)
+
+        self._emit('host.update.end')
+
+        notifier.info.assert_called_once_with(
+            mock.sentinel.context, event_type='host.update.end',
+            payload={'event': 'host.update.end'})
+
+    def test_emit_in_background(self):
+        self.override_config('emitter_queue_size', 10, 'notifications')
+        self.override_config('emitter_batch_size', 2, 'notifications')
+        event_types = ['host.update.start', 'host.update.end',
+                       'notification.create.start']
+
+        for event_type in event_types:
+            self._emit(event_type)
+        self.emitter.stop()
+
+        self.assertEqual(event_types, self._sent())
+        self.assertIsNone(self.emitter._worker)
+
+    def test_emit_batch_grouped_per_publisher(self):
+        self.override_config('emitter_queue_size', 10, 'notifications')
+        release = self._block_sending()
+        self._emit('host.update.end', publisher_id='api:host')
+        self._emit('notification.create.start',
+                   publisher_id='api:notification')
+        self._emit('host.delete.start', publisher_id='api:host')
+        self._emit('notification.create.end',
+                   publisher_id='api:notification')
+
+        release.send()
+        self.emitter.stop()
+
+        # the notifications of every publisher are sent in order
+        self.assertEqual(['host.update.start', 'host.update.end',
+                          'host.delete.start', 'notification.create.start',
+                          'notification.create.end'], self._sent())
+        self.assertEqual(
+            [mock.call(publisher_id='api:host'),
+             mock.call(publisher_id='api:notification')],
+            self.notifier.prepare.call_args_list)
+
+    @mock.patch.object(emitter, 'LOG')
+    def test_stop_timeout(self, mock_log):
+        self.override_config('emitter_queue_size', 10, 'notifications')
+        self._block_sending()
+        self._emit('host.update.end')
+
+        self.emitter.stop(timeout=0.01)
+
+        self.assertEqual(['host.update.start'], self._sent())
+        self.assertIsNone(self.emitter._worker)
+        self.assertTrue(mock_log.warning.called)
+
+    @mock.patch('atexit.register')
+    def test_stopped_at_exit(self, mock_register):
+        self.override_config('emitter_queue_size', 10, 'notifications')
+
+        self._emit('host.update.start')
+        self.emitter.stop()
+        self._emit('host.update.end')
+
+        mock_register.assert_called_once_with(self.emitter.stop)
+
+    def test_send_failure(self):
+        self.override_config('emitter_queue_size', 10, 'notifications')
+        self.notifier.info.side_effect = [Exception('bus down'), None]
+
+        self._emit('host.update.start')
+        self._emit('host.update.end')
+        self.emitter.stop()
+
+        self.assertEqual(['host.update.start', 'host.update.end'],
+                         self._sent())
+
+    def _block_sending(self):
+        sending = event.Event()
+        release = event.Event()
+
+        def notify(context, event_type, payload):
+            if not sending.ready():
+                sending.send()
+                release.wait()
+
+        self.notifier.info.side_effect = notify
+        self._emit('host.update.start')
+        sending.wait()
+        return release
+
+    def test_queue_full_drop(self):
+        self.override_config('emitter_queue_size', 1, 'notifications')
+        self.override_config('emitter_overflow_policy', 'drop',
+                             'notifications')
+        release = self._block_sending()
+
+        self._emit('host.update.end')
+        self._emit('notification.create.start')
+        self._emit('notification.create.end')
+        release.send()
+        self.emitter.stop()
+
+        self.assertEqual(2, self.emitter.dropped)
+        self.assertEqual(['host.update.start', 'host.update.end'],
+                         self._sent())
+
+    def test_queue_full_block(self):
+        self.override_config('emitter_queue_size', 1, 'notifications')
+        release = self._block_sending()
+        self._emit('host.update.end')
+
+        blocked = eventlet.spawn(self._emit, 'notification.create.start')
+        eventlet.sleep(0.1)
+        self.assertFalse(blocked.dead)
+
+        release.send()
+        blocked.wait()
+        self.emitter.stop()
+
+        self.assertEqual(0, self.emitter.dropped)
+        self.assertEqual(['host.update.start', 'host.update.end',
+                          'notification.create.start'], self._sent())
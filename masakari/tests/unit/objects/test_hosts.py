@@ -35,6 +35,7 @@ fake_segment_dict = {
     'description': 'fake',
     'service_type': 'CINDER',
     'enabled': True,
+    'active_notifications': 0,
     'id': 123,
     'uuid': uuidsentinel.fake_segment,
     'created_at': NOW,
@@ -14,6 +14,7 @@
 #    under the License.
 
 import copy
+import datetime
 from unittest import mock
 
 from oslo_utils import timeutils
@@ -46,6 +47,9 @@ def _fake_db_notification(**kwargs):
         'source_host_uuid': uuidsentinel.fake_host,
         'failover_segment_uuid': uuidsentinel.fake_segment,
         'message': None,
+        'idempotency_key': None,
+        'idempotency_fingerprint': None,
+        'fencing_token': None,
         }
     fake_notification.update(kwargs)
     return fake_notification
@@ -66,6 +70,9 @@ def _fake_object_notification(**kwargs):
         'source_host_uuid': uuidsentinel.fake_host,
         'failover_segment_uuid': uuidsentinel.fake_segment,
         'message': None,
+        'idempotency_key': None,
+        'idempotency_fingerprint': None,
+        'fencing_token': None,
         }
     fake_notification.update(kwargs)
     return fake_notification
@@ -73,6 +80,10 @@ def _fake_object_notification(**kwargs):
 
 fake_object_notification = _fake_object_notification()
 
+PAYLOAD_HASH = notification.payload_hash({'fake_key': 'fake_value'})
+DEDUP_KEY = notification.dedup_key(uuidsentinel.fake_host, 'COMPUTE_HOST',
+                                   PAYLOAD_HASH, NOW)
+
 fake_db_notification = _fake_db_notification()
 
 
@@ -102,6 +113,10 @@ class TestNotificationObject(test_objects._LocalTest):
         self._test_query('notification_get_by_uuid', 'get_by_uuid',
                          uuidsentinel.fake_segment)
 
+    def test_get_by_idempotency_key(self):
+        self._test_query('notification_get_by_idempotency_key',
+                         'get_by_idempotency_key', 'fake-key', NOW)
+
     def _notification_create_attributes(self, skip_uuid=False):
 
         notification_obj = notification.Notification(context=self.context)
@@ -131,7 +146,8 @@ class TestNotificationObject(test_objects._LocalTest):
             'failover_segment_uuid': uuidsentinel.fake_segment,
             'notification_uuid': uuidsentinel.fake_notification,
             'generated_time': NOW, 'status': 'new',
-            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}'})
+            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}',
+            'payload_hash': PAYLOAD_HASH, 'dedup_key': DEDUP_KEY})
         action = fields.EventNotificationAction.NOTIFICATION_CREATE
         phase_start = fields.EventNotificationPhase.START
         phase_end = fields.EventNotificationPhase.END
@@ -157,7 +173,8 @@ class TestNotificationObject(test_objects._LocalTest):
             'failover_segment_uuid': uuidsentinel.fake_segment,
             'notification_uuid': uuidsentinel.fake_notification,
             'generated_time': NOW, 'status': 'new',
-            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}'})
+            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}',
+            'payload_hash': PAYLOAD_HASH, 'dedup_key': DEDUP_KEY})
         action = fields.EventNotificationAction.NOTIFICATION_CREATE
         phase_start = fields.EventNotificationPhase.START
         phase_end = fields.EventNotificationPhase.END
@@ -187,7 +204,8 @@ class TestNotificationObject(test_objects._LocalTest):
             'failover_segment_uuid': uuidsentinel.fake_segment,
             'notification_uuid': uuidsentinel.fake_notification,
             'generated_time': NOW, 'status': 'new',
-            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}'})
+            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}',
+            'payload_hash': PAYLOAD_HASH, 'dedup_key': DEDUP_KEY})
         self.assertTrue(mock_generate_uuid.called)
         action = fields.EventNotificationAction.NOTIFICATION_CREATE
         phase_start = fields.EventNotificationPhase.START
@@ -196,6 +214,47 @@ class TestNotificationObject(test_objects._LocalTest):
                       phase=phase_start)]
         mock_notify_about_notification_api.assert_has_calls(notify_calls)
 
+    def test_payload_hash(self):
+        self.assertEqual(
+            notification.payload_hash({'b': '2', 'a': '1'}),
+            notification.payload_hash({'a': '1', 'b': '2'}))
+        self.assertNotEqual(
+            notification.payload_hash({'a': '1'}),
+            notification.payload_hash({'a': '2'}))
+        self.assertEqual(notification.payload_hash({}),
+                         notification.payload_hash(None))
+
+    def test_dedup_key(self):
+        self.override_config('duplicate_notification_detection_interval', 60)
+        start = NOW.replace(minute=0, second=0)
+        key = notification.dedup_key(uuidsentinel.fake_host, 'COMPUTE_HOST',
+                                     PAYLOAD_HASH, start)
+
+        self.assertEqual(key, notification.dedup_key(
+            uuidsentinel.fake_host, 'COMPUTE_HOST', PAYLOAD_HASH,
+            start + datetime.timedelta(seconds=59)))
+        self.assertNotEqual(key, notification.dedup_key(
+            uuidsentinel.fake_host, 'COMPUTE_HOST', PAYLOAD_HASH,
+            start + datetime.timedelta(seconds=60)))
+        self.assertNotEqual(key, notification.dedup_key(
+            uuidsentinel.other_host, 'COMPUTE_HOST', PAYLOAD_HASH, start))
+
+        self.override_config('duplicate_notification_detection_interval', 0)
+        self.assertIsNone(notification.dedup_key(
+            uuidsentinel.fake_host, 'COMPUTE_HOST', PAYLOAD_HASH, start))
+
+    @mock.patch.object(db, 'notification_duplicate_exists')
+    def test_duplicate_exists(self, mock_duplicate_exists):
+        mock_duplicate_exists.return_value = True
+        payload = {'fake_key': 'fake_value'}
+
+        self.assertTrue(notification.Notification.duplicate_exists(
+            self.context, 'COMPUTE_HOST', uuidsentinel.fake_host, payload,
+            NOW))
+        mock_duplicate_exists.assert_called_once_with(
+            self.context, 'COMPUTE_HOST', uuidsentinel.fake_host,
+            notification.payload_hash(payload), NOW)
+
     @mock.patch.object(db, 'notification_delete')
     def test_destroy(self, mock_notification_delete):
         notification_obj = self._notification_create_attributes()
@@ -241,6 +300,51 @@ class TestNotificationObject(test_objects._LocalTest):
             'status': 'new'
         }, limit=None, marker=None, sort_dirs=None, sort_keys=None)
 
+    @mock.patch.object(api_utils, 'notify_about_notification_api')
+    @mock.patch.object(db, 'notification_create_many')
+    def test_create_all(self, mock_db_create_many,
+                        mock_notify_about_notification_api):
+        mock_db_create_many.return_value = [fake_db_notification]
+        duplicate = self._notification_create_attributes(skip_uuid=True)
+        notification_obj = self._notification_create_attributes()
+
+        result = notification.NotificationList.create_all(
+            self.context, [notification_obj, duplicate])
+
+        self.assertEqual(1, len(result))
+        self.compare_obj(result[0], fake_object_notification,
+                         allow_missing=OPTIONAL)
+        values = {
+            'source_host_uuid': uuidsentinel.fake_host,
+            'failover_segment_uuid': uuidsentinel.fake_segment,
+            'notification_uuid': uuidsentinel.fake_notification,
+            'generated_time': NOW, 'status': 'new',
+            'type': 'COMPUTE_HOST', 'payload': '{"fake_key": "fake_value"}',
+            'payload_hash': PAYLOAD_HASH, 'dedup_key': DEDUP_KEY}
+        duplicate_values = dict(
+            values, notification_uuid=duplicate.notification_uuid)
+        mock_db_create_many.assert_called_once_with(
+            self.context, [values, duplicate_values])
+        action = fields.EventNotificationAction.NOTIFICATION_CREATE
+        phase_start = fields.EventNotificationPhase.START
+        phase_end = fields.EventNotificationPhase.END
+        mock_notify_about_notification_api.assert_has_calls([
+            mock.call(self.context, notification_obj, action=action,
+                      phase=phase_start),
+            mock.call(self.context, duplicate, action=action,
+                      phase=phase_start),
+            mock.call(self.context, result[0], action=action,
+                      phase=phase_end)])
+        self.assertEqual(3, mock_notify_about_notification_api.call_count)
+
+    def test_create_all_already_created(self):
+        notification_obj = self._notification_create_attributes()
+        notification_obj.id = 123
+
+        self.assertRaises(exception.ObjectActionError,
+                          notification.NotificationList.create_all,
+                          self.context, [notification_obj])
+
     @mock.patch.object(db, 'notifications_get_all_by_filters')
     def test_get_limit_and_marker_invalid_marker(self, mock_api_get):
         notification_uuid = uuidsentinel.fake_notification
@@ -251,6 +355,41 @@ class TestNotificationObject(test_objects._LocalTest):
                           notification.NotificationList.get_all,
                           self.context, limit=5, marker=notification_uuid)
 
+    @mock.patch.object(db, 'notifications_claim')
+    def test_claim(self, mock_claim):
+        mock_claim.return_value = [fake_db_notification]
+
+        result = notification.NotificationList.claim(
+            self.context, 'fake-owner', NOW, NOW, 10)
+
+        self.assertEqual(1, len(result))
+        self.compare_obj(result[0], fake_object_notification,
+                         allow_missing=OPTIONAL)
+        mock_claim.assert_called_once_with(self.context, 'fake-owner', NOW,
+                                           NOW, 10)
+
+    @mock.patch.object(db, 'notifications_renew_leases', return_value=1)
+    def test_renew_leases(self, mock_renew_leases):
+        self.assertEqual(1, notification.NotificationList.renew_leases(
+            self.context, 'fake-owner', NOW))
+        mock_renew_leases.assert_called_once_with(self.context,
+                                                  'fake-owner', NOW)
+
+    @mock.patch.object(db, 'notifications_release', return_value=1)
+    def test_release(self, mock_release):
+        self.assertEqual(1, notification.NotificationList.release(
+            self.context, 'fake-owner'))
+        mock_release.assert_called_once_with(self.context, 'fake-owner')
+
+    @mock.patch.object(db, 'notifications_expire')
+    def test_expire(self, mock_expire):
+        mock_expire.return_value = [uuidsentinel.fake_notification]
+
+        result = notification.NotificationList.expire(self.context, NOW)
+
+        self.assertEqual([uuidsentinel.fake_notification], result)
+        mock_expire.assert_called_once_with(self.context, NOW)
+
     @mock.patch.object(db, 'notification_update')
     def test_save(self, mock_notification_update):
 
@@ -271,5 +410,159 @@ class TestNotificationObject(test_objects._LocalTest):
                                   'on_uuid': uuidsentinel.fake_notification,
                                   'status': 'new', 'generated_time': NOW,
                                   'payload': {'fake_key': 'fake_value'},
-                                  'type': 'COMPUTE_HOST'}
-                                 ))
+                                  'type': 'COMPUTE_HOST'},
+                                 expected_status=None, fencing_token=None))
+
+    @mock.patch.object(db, 'notification_update')
+    def test_save_expected_status(self, mock_notification_update):
+        mock_notification_update.return_value = fake_db_notification
+
+        notification_obj = self._notification_create_attributes()
+        notification_obj.obj_reset_changes()
+        notification_obj.status = 'running'
+        notification_obj.save(expected_status='new')
+
+        mock_notification_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_notification,
+            {'status': 'running'}, expected_status='new', fencing_token=None)
+
+    @mock.patch.object(db, 'notification_update')
+    def test_save_fencing_token(self, mock_notification_update):
+        mock_notification_update.return_value = fake_db_notification
+
+        notification_obj = self._notification_create_attributes()
+        notification_obj.fencing_token = 7
+        notification_obj.obj_reset_changes()
+        notification_obj.status = 'running'
+        notification_obj.save()
+
+        # The fencing token is checked even though it didn't change.
+        mock_notification_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_notification,
+            {'status': 'running'}, expected_status=None, fencing_token=7)
+
+    @mock.patch.object(db, 'notification_update')
+    def test_save_lease(self, mock_notification_update):
+        mock_notification_update.return_value = fake_db_notification
+
+        notification_obj = self._notification_create_attributes()
+        notification_obj.obj_reset_changes()
+        notification_obj.status = 'running'
+        notification_obj.save(expected_status='new', owner='engine-1',
+                              lease_expires_at=NOW)
+
+        mock_notification_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_notification,
+            {'status': 'running', 'owner': 'engine-1',
+             'lease_expires_at': NOW},
+            expected_status='new', fencing_token=None)
+
+    def test_obj_make_compatible(self):
+        notification_obj = notification.Notification(fencing_token=7)
+
+        primitive = notification_obj.obj_to_primitive('1.5')
+
+        self.assertNotIn('fencing_token', primitive['masakari_object.data'])
+
+    def test_obj_make_compatible_idempotency_fingerprint(self):
+        notification_obj = notification.Notification(
+            idempotency_fingerprint='fake-fingerprint')
+
+        primitive = notification_obj.obj_to_primitive('1.6')
+
+        self.assertNotIn('idempotency_fingerprint',
+                         primitive['masakari_object.data'])
+
+    def test_request_fingerprint(self):
+        stopped = notification.payload_hash({'event': 'STOPPED'})
+        started = notification.payload_hash({'event': 'STARTED'})
+        fingerprint = notification.request_fingerprint(
+            'fake-host', 'VM', stopped)
+
+        self.assertEqual(fingerprint, notification.request_fingerprint(
+            'fake-host', 'VM', stopped))
+        self.assertNotEqual(fingerprint, notification.request_fingerprint(
+            'other-host', 'VM', stopped))
+        self.assertNotEqual(fingerprint, notification.request_fingerprint(
+            'fake-host', 'PROCESS', stopped))
+        self.assertNotEqual(fingerprint, notification.request_fingerprint(
+            'fake-host', 'VM', started))
+
+    @mock.patch.object(db, 'notification_update')
+    def test_save_unexpected_status(self, mock_notification_update):
+        mock_notification_update.side_effect = (
+            exception.UnexpectedNotificationStatus(
+                uuid=uuidsentinel.fake_notification, expected='new',
+                actual='running'))
+
+        notification_obj = self._notification_create_attributes()
+        notification_obj.obj_reset_changes()
+        notification_obj.status = 'running'
+
+        self.assertRaises(exception.UnexpectedNotificationStatus,
+                          notification_obj.save, expected_status='new')
+
+
+class TestRecoveryWorkflowDetailsObject(test_objects._LocalTest):
+
+    def _fake_db_workflow_details(self, details, finished=False):
+        return {
+            'created_at': NOW, 'updated_at': None, 'deleted_at': None,
+            'deleted': False, 'id': 1,
+            'notification_uuid': uuidsentinel.fake_notification,
+            'details': details, 'finished': finished,
+        }
+
+    @mock.patch.object(db, 'recovery_workflow_details_get_by_'
+                           'notification_uuid')
+    def test_get_by_notification_uuid(self, mock_get):
+        mock_get.return_value = self._fake_db_workflow_details(
+            '[{"name": "StopInstanceTask", "progress": 1.0, '
+            '"progress_details": [{"message": "Stopped", '
+            '"progress": "1.0"}], "state": "SUCCESS"}]', finished=True)
+
+        workflow_details = (
+            notification.RecoveryWorkflowDetails.get_by_notification_uuid(
+                self.context, uuidsentinel.fake_notification))
+
+        mock_get.assert_called_once_with(self.context,
+                                         uuidsentinel.fake_notification)
+        self.assertTrue(workflow_details.finished)
+        self.assertEqual(1, len(workflow_details.details))
+        detail = workflow_details.details[0]
+        self.assertEqual('StopInstanceTask', detail.name)
+        self.assertEqual(1.0, detail.progress)
+        self.assertEqual([{'message': 'Stopped', 'progress': '1.0'}],
+                         detail.progress_details)
+        self.assertEqual('SUCCESS', detail.state)
+
+    @mock.patch.object(db, 'recovery_workflow_details_get_by_'
+                           'notification_uuid')
+    def test_get_by_notification_uuid_not_found(self, mock_get):
+        mock_get.side_effect = exception.RecoveryWorkflowDetailsNotFound(
+            id=uuidsentinel.fake_notification)
+
+        self.assertRaises(
+            exception.RecoveryWorkflowDetailsNotFound,
+            notification.RecoveryWorkflowDetails.get_by_notification_uuid,
+            self.context, uuidsentinel.fake_notification)
+
+    @mock.patch.object(db, 'recovery_workflow_details_update')
+    def test_save(self, mock_update):
+        details = '[{"name": "StopInstanceTask", "progress": 0.5, ' \
+                  '"progress_details": [], "state": "RUNNING"}]'
+        mock_update.return_value = self._fake_db_workflow_details(details)
+
+        workflow_details = notification.RecoveryWorkflowDetails(
+            context=self.context,
+            notification_uuid=uuidsentinel.fake_notification,
+            details=[notification.NotificationProgressDetails.create(
+                'StopInstanceTask', 0.5, [], 'RUNNING')])
+        workflow_details.save()
+
+        mock_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_notification,
+            {'details': details})
+        self.assertEqual(1, workflow_details.id)
+        self.assertFalse(workflow_details.finished)
+        self.assertEqual('RUNNING', workflow_details.details[0].state)
@@ -656,13 +656,14 @@ class TestRegistry(test_base.NoDBTestCase):
 # they come with a corresponding version bump in the affected
 # objects
 object_data = {
-    'FailoverSegment': '1.1-9cecc07c111f647b32d560f19f1f5db9',
+    'FailoverSegment': '1.2-11c091349956085af73a3a962b99ab0e',
     'FailoverSegmentList': '1.0-dfc5c6f5704d24dcaa37b0bbb03cbe60',
     'Host': '1.2-f05735b156b687bc916d46b551bc45e3',
     'HostList': '1.0-25ebe1b17fbd9f114fae8b6a10d198c0',
-    'Notification': '1.2-d59495957ac67ee9863863d92def4178',
+    'Notification': '1.8-cb134df7fc652fd885600b13d11f3497',
     'NotificationProgressDetails': '1.0-fc611ac932b719fbc154dbe34bb8edee',
-    'NotificationList': '1.0-25ebe1b17fbd9f114fae8b6a10d198c0',
+    'NotificationList': '1.3-9c9e47bf79a07465101599cd7bee0a84',
+    'RecoveryWorkflowDetails': '1.0-25870dc4c1e491ca775a875f1417edc8',
     'EventType': '1.0-d1d2010a7391fa109f0868d964152607',
     'ExceptionNotification': '1.0-1187e93f564c5cca692db76a66cda2a6',
     'ExceptionPayload': '1.0-96f178a12691e3ef0d8e3188fc481b90',
@@ -678,8 +679,8 @@ object_data = {
     'SegmentApiNotification': '1.0-1187e93f564c5cca692db76a66cda2a6',
     'SegmentApiPayload': '1.1-e34e1c772e16e9ad492067ee98607b1d',
     'SegmentApiPayloadBase': '1.1-6a1db76f3e825f92196fc1a11508d886',
-    'VMove': '1.0-5c4d8667b5612b8a49adc065f8961aa2',
-    'VMoveList': '1.0-63fff36dee683c7a1555798cb233ad3f'
+    'VMove': '1.2-a074e6f2eafe95bff3e9d8bdbe326637',
+    'VMoveList': '1.1-5b54ea389118f8b179ce3b7ce8962d88'
 }
 
 
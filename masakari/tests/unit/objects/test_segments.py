@@ -39,7 +39,8 @@ fake_segment = {
     'service_type': 'COMPUTE',
     'description': 'fake-description',
     'recovery_method': 'auto',
-    'enabled': True
+    'enabled': True,
+    'active_notifications': 0
     }
 
 
@@ -290,7 +291,13 @@ class TestFailoverSegmentObject(test_objects._LocalTest):
         segment_obj.id = 123
         segment_obj.uuid = uuidsentinel.fake_segment
         segment_obj.enabled = True
+        segment_obj.active_notifications = 2
+        primitive = segment_obj.obj_to_primitive('1.2')
+        self.assertIn('active_notifications',
+                      primitive['masakari_object.data'])
         primitive = segment_obj.obj_to_primitive('1.1')
         self.assertIn('enabled', primitive['masakari_object.data'])
+        self.assertNotIn('active_notifications',
+                         primitive['masakari_object.data'])
         primitive = segment_obj.obj_to_primitive('1.0')
         self.assertNotIn('enabled', primitive['masakari_object.data'])
@@ -40,7 +40,8 @@ fake_vmove = {
     'end_time': None,
     'status': 'pending',
     'type': 'evacuation',
-    'message': None
+    'message': None,
+    'fencing_token': None
     }
 
 
@@ -89,6 +90,35 @@ class TestVMoveObject(test_objects._LocalTest):
             'type': 'evacuation'
         })
 
+    @mock.patch('masakari.db.vmove_create_many')
+    def test_create_all(self, mock_vmove_create_many):
+
+        mock_vmove_create_many.return_value = [fake_vmove]
+        vmove_obj = self._vmove_create_attributes()
+        vmove_list = vmove.VMoveList.create_all(self.context, [vmove_obj])
+
+        self.assertEqual(1, len(vmove_list))
+        self.compare_obj(vmove_list[0], fake_vmove)
+        mock_vmove_create_many.assert_called_once_with(self.context, [{
+            'uuid': uuidsentinel.fake_vmove,
+            'notification_uuid': uuidsentinel.fake_notification,
+            'instance_uuid': uuidsentinel.fake_instance,
+            'instance_name': 'fake_vm1',
+            'source_host': 'fake_host1',
+            'status': 'pending',
+            'type': 'evacuation'
+        }])
+
+    @mock.patch('masakari.db.vmove_create_many')
+    def test_create_all_already_created(self, mock_vmove_create_many):
+        vmove_obj = self._vmove_create_attributes()
+        vmove_obj.id = 1
+
+        self.assertRaises(exception.ObjectActionError,
+                          vmove.VMoveList.create_all,
+                          self.context, [vmove_obj])
+        self.assertFalse(mock_vmove_create_many.called)
+
     @mock.patch('masakari.db.vmoves_get_all_by_filters')
     def test_get_limit_and_marker_invalid_marker(self, mock_api_get):
         vmove_uuid = uuidsentinel.fake_vmove
@@ -117,4 +147,41 @@ class TestVMoveObject(test_objects._LocalTest):
              'instance_name': 'fake_vm1',
              'source_host': 'fake_host1',
              'status': 'pending',
-             'type': 'evacuation'}))
+             'type': 'evacuation'}, expected_status=None,
+            fencing_token=None))
+
+    @mock.patch('masakari.db.vmove_update')
+    def test_save_expected_status(self, mock_vmove_update):
+        mock_vmove_update.return_value = fake_vmove
+
+        vmove_obj = self._vmove_create_attributes()
+        vmove_obj.uuid = uuidsentinel.fake_vmove
+        vmove_obj.obj_reset_changes()
+        vmove_obj.status = 'ongoing'
+        vmove_obj.save(expected_status='pending')
+
+        mock_vmove_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_vmove, {'status': 'ongoing'},
+            expected_status='pending', fencing_token=None)
+
+    @mock.patch('masakari.db.vmove_update')
+    def test_save_fencing_token(self, mock_vmove_update):
+        mock_vmove_update.return_value = fake_vmove
+
+        vmove_obj = self._vmove_create_attributes()
+        vmove_obj.uuid = uuidsentinel.fake_vmove
+        vmove_obj.fencing_token = 7
+        vmove_obj.obj_reset_changes()
+        vmove_obj.status = 'ongoing'
+        vmove_obj.save()
+
+        mock_vmove_update.assert_called_once_with(
+            self.context, uuidsentinel.fake_vmove, {'status': 'ongoing'},
+            expected_status=None, fencing_token=7)
+
+    def test_obj_make_compatible(self):
+        vmove_obj = vmove.VMove(fencing_token=7)
+
+        primitive = vmove_obj.obj_to_primitive('1.1')
+
+        self.assertNotIn('fencing_token', primitive['masakari_object.data'])
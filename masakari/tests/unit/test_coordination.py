@@ -0,0 +1,143 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+import tooz
+from tooz import coordination as tooz_coordination
+
+from masakari import coordination
+from masakari import db
+from masakari.tests.unit import base
+
+
+class CoordinatorLeaderTestCase(base.NoDBTestCase):
+
+    def setUp(self):
+        super(CoordinatorLeaderTestCase, self).setUp()
+        self.override_config('backend_url', 'etcd3+http://localhost:2379',
+                             'coordination')
+        self.lock = mock.Mock()
+        self.tooz_coordinator = mock.Mock()
+        self.tooz_coordinator.get_lock.return_value = self.lock
+        self.stub_out('tooz.coordination.get_coordinator',
+                      lambda backend_url, member_id: self.tooz_coordinator)
+        self.coordinator = coordination.Coordinator(agent_id='agent',
+                                                    prefix='masakari-')
+
+    def test_get_lock(self):
+        self.coordinator.start()
+
+        self.assertIs(self.lock, self.coordinator.get_lock('lock'))
+        self.tooz_coordinator.get_lock.assert_called_once_with(
+            b'masakari-lock')
+
+    def test_get_lock_not_started(self):
+        self.assertIsNone(self.coordinator.get_lock('lock'))
+        self.tooz_coordinator.get_lock.assert_not_called()
+
+    def test_get_lock_start_failed(self):
+        self.tooz_coordinator.start.side_effect = (
+            tooz_coordination.ToozConnectionError('connection refused'))
+
+        self.assertRaises(tooz.ToozError, self.coordinator.start)
+        self.assertIsNone(self.coordinator.get_lock('lock'))
+        self.tooz_coordinator.get_lock.assert_not_called()
+
+    def test_is_leader_not_started(self):
+        self.assertTrue(self.coordinator.is_leader('election'))
+        self.tooz_coordinator.get_lock.assert_not_called()
+
+    def test_is_leader(self):
+        self.coordinator.start()
+        self.lock.acquire.return_value = True
+        self.lock.is_still_owner.return_value = True
+
+        self.assertTrue(self.coordinator.is_leader('election'))
+        self.assertTrue(self.coordinator.is_leader('election'))
+
+        # The lock of the election is acquired once and kept.
+        self.tooz_coordinator.get_lock.assert_called_once_with(
+            b'masakari-election')
+        self.lock.acquire.assert_called_once_with(blocking=False)
+
+        self.coordinator.stop()
+        self.lock.release.assert_called_once_with()
+
+    def test_is_leader_follower(self):
+        self.coordinator.start()
+        self.lock.acquire.side_effect = [False, True]
+
+        self.assertFalse(self.coordinator.is_leader('election'))
+        # The leader stopped renewing the lock, which expired.
+        self.assertTrue(self.coordinator.is_leader('election'))
+
+    def test_is_leader_lost(self):
+        self.coordinator.start()
+        self.lock.acquire.side_effect = [True, False]
+        self.lock.is_still_owner.return_value = False
+
+        self.assertTrue(self.coordinator.is_leader('election'))
+        self.assertFalse(self.coordinator.is_leader('election'))
+
+        self.coordinator.stop()
+        self.lock.release.assert_not_called()
+
+    def test_is_leader_still_owner_not_implemented(self):
+        self.coordinator.start()
+        self.lock.acquire.return_value = True
+        self.lock.is_still_owner.side_effect = tooz.NotImplemented()
+
+        self.assertTrue(self.coordinator.is_leader('election'))
+        self.assertTrue(self.coordinator.is_leader('election'))
+        self.lock.acquire.assert_called_once_with(blocking=False)
+
+    def test_is_leader_backend_error(self):
+        self.coordinator.start()
+        self.lock.acquire.side_effect = tooz_coordination.ToozConnectionError(
+            'connection refused')
+
+        self.assertTrue(self.coordinator.is_leader('election'))
+
+
+class SynchronizedTestCase(base.NoDBTestCase):
+
+    def setUp(self):
+        super(SynchronizedTestCase, self).setUp()
+        self.coordinator = mock.MagicMock()
+        self.lock = self.coordinator.get_lock.return_value
+        self.lock.name = b'masakari-lock-host'
+
+    @mock.patch.object(db, 'fencing_token_issue', return_value=3)
+    def test_synchronized_fencing(self, mock_fencing_token_issue):
+        @coordination.synchronized('lock-{host}', coordinator=self.coordinator,
+                                   fencing=True)
+        def func(host, fencing_token=None):
+            return fencing_token
+
+        self.assertEqual(3, func('host'))
+        self.coordinator.get_lock.assert_called_once_with('lock-host')
+        mock_fencing_token_issue.assert_called_once_with(
+            mock.ANY, 'masakari-lock-host')
+
+    @mock.patch.object(db, 'fencing_token_issue')
+    def test_synchronized_fencing_not_configured(self,
+                                                 mock_fencing_token_issue):
+        self.coordinator.get_lock.return_value = None
+
+        @coordination.synchronized('lock-{host}', coordinator=self.coordinator,
+                                   fencing=True)
+        def func(host, fencing_token=None):
+            return fencing_token
+
+        self.assertIsNone(func('host'))
+        mock_fencing_token_issue.assert_not_called()
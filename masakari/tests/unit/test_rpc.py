@@ -122,6 +122,20 @@ class RPCAPITestCase(base.TestCase):
                                          access_policy=access_policy)
         self.assertEqual('server', server)
 
+    @mock.patch.object(messaging, 'get_notification_listener')
+    def test_get_notification_listener(self, mock_get):
+        rpc.NOTIFICATION_TRANSPORT = mock.Mock()
+        tgts = [mock.Mock()]
+        ends = [mock.Mock()]
+        mock_get.return_value = 'listener'
+
+        listener = rpc.get_notification_listener(tgts, ends, pool='pool')
+
+        mock_get.assert_called_once_with(rpc.NOTIFICATION_TRANSPORT, tgts,
+                                         ends, executor='eventlet',
+                                         pool='pool')
+        self.assertEqual('listener', listener)
+
 
 class RPCResetFixture(fixtures.Fixture):
     def _setUp(self):
@@ -300,3 +314,56 @@ class TestRequestContextSerializer(base.NoDBTestCase):
         self.ser.deserialize_context('context')
 
         mock_req.from_dict.assert_called_once_with('context')
+
+
+class TestNotificationsEnabled(base.NoDBTestCase):
+
+    def setUp(self):
+        super(TestNotificationsEnabled, self).setUp()
+        self.notifier = mock.Mock()
+        self.notifier.is_enabled.return_value = True
+        self.stub_out('masakari.rpc.NOTIFIER', self.notifier)
+        self.notify = mock.Mock(return_value='sent')
+        self.decorated = rpc.if_notifications_enabled(self.notify)
+
+    def test_all_event_types_enabled(self):
+        self.assertTrue(rpc.is_event_type_enabled('host.update.start'))
+        self.assertTrue(rpc.is_event_type_enabled('host.update'))
+
+    def test_notifier_disabled(self):
+        self.notifier.is_enabled.return_value = False
+
+        self.assertFalse(rpc.is_event_type_enabled('host.update.end'))
+
+    def test_event_types_filtered(self):
+        self.override_config('include_event_types', ['*.end', '*.error'],
+                             'notifications')
+        self.override_config('exclude_event_types', ['segment.*'],
+                             'notifications')
+
+        self.assertTrue(rpc.is_event_type_enabled('host.update.end'))
+        self.assertTrue(rpc.is_event_type_enabled(
+            'notification.create.error'))
+        self.assertFalse(rpc.is_event_type_enabled('host.update.start'))
+        self.assertFalse(rpc.is_event_type_enabled('segment.create.end'))
+
+    def test_if_notifications_enabled(self):
+        self.override_config('include_event_types', ['*.end'],
+                             'notifications')
+
+        self.assertEqual('sent', self.decorated(
+            'context', 'host', 'host.update', phase='end', binary='api'))
+        self.assertIsNone(self.decorated('context', 'host', 'host.update',
+                                         phase='start'))
+
+        self.notify.assert_called_once_with('context', 'host', 'host.update',
+                                            phase='end', binary='api')
+
+    def test_if_notifications_enabled_without_phase(self):
+        self.override_config('include_event_types', ['host.update'],
+                             'notifications')
+
+        self.decorated('context', 'host', 'host.update')
+
+        self.notify.assert_called_once_with('context', 'host', 'host.update',
+                                            phase=None)
@@ -98,7 +98,9 @@ class ServiceTestCase(base.NoDBTestCase):
         serv.stop()
 
         serv.rpcserver.start.assert_called_once_with()
+        serv.manager.post_start_hook.assert_called_once_with()
         serv.rpcserver.stop.assert_called_once_with()
+        serv.manager.cleanup_host.assert_called_once_with()
         mock_stop.assert_called_once_with()
 
     @mock.patch.object(rpc, 'init')
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the notification and vmove queries run on the hot paths.
+
+Populates a database with the masakari schema and a large number of
+notification and vmove rows, then times the queries issued by the engine
+periodic tasks, the duplicate notification detection and the host failure
+workflow, first without and then with the indexes on these tables.
+
+Usage::
+
+    python tools/benchmark_notification_queries.py --rows 1000000 \\
+        --connection sqlite:////tmp/masakari-bench.db
+"""
+
+import argparse
+import datetime
+import random
+import statistics
+import sys
+import time
+
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import sqlalchemy as sa
+
+import masakari.conf
+from masakari import context
+from masakari import db
+from masakari.db.sqlalchemy import api as sqlalchemy_api
+from masakari.db.sqlalchemy import models
+from masakari.objects import notification as notification_obj
+
+CONF = masakari.conf.CONF
+
+INDEXES = [
+    index
+    for table in (models.Notification.__table__, models.VMove.__table__)
+    for index in table.indexes
+]
+
+PAYLOADS = [
+    {'event': 'STOPPED', 'host_status': 'NORMAL', 'cluster_status': 'ONLINE'},
+    {'event': 'STOPPED', 'host_status': 'UNKNOWN',
+     'cluster_status': 'OFFLINE'},
+    {'event': 'STARTED', 'host_status': 'NORMAL', 'cluster_status': 'ONLINE'},
+]
+
+FINISHED_STATUSES = ['finished', 'failed', 'ignored']
+UNFINISHED_STATUSES = ['new', 'running', 'error']
+TYPES = ['COMPUTE_HOST', 'VM', 'PROCESS']
+
+
+def _populate(engine, rows, vmove_rows, hosts, chunk=10000):
+    now = timeutils.utcnow().replace(microsecond=0)
+    host_uuids = [uuidutils.generate_uuid() for _ in range(hosts)]
+    segment_uuid = uuidutils.generate_uuid()
+    notification_uuids = []
+
+    notifications = models.Notification.__table__
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk):
+            values = []
+            for _ in range(min(chunk, rows - start)):
+                notification_uuid = uuidutils.generate_uuid()
+                notification_uuids.append(notification_uuid)
+                # Only a small share of the notifications is unfinished,
+                # like on a long running deployment.
+                if random.random() < 0.01:
+                    status = random.choice(UNFINISHED_STATUSES)
+                else:
+                    status = random.choice(FINISHED_STATUSES)
+                generated_time = now - datetime.timedelta(
+                    seconds=random.randint(0, 90 * 86400))
+                payload = random.choice(PAYLOADS)
+                values.append({
+                    'notification_uuid': notification_uuid,
+                    'generated_time': generated_time,
+                    'created_at': generated_time,
+                    'type': random.choice(TYPES),
+                    'payload': jsonutils.dumps(payload),
+                    'payload_hash': notification_obj.payload_hash(payload),
+                    'status': status,
+                    'source_host_uuid': random.choice(host_uuids),
+                    'failover_segment_uuid': segment_uuid,
+                    'deleted': 0,
+                })
+            conn.execute(notifications.insert(), values)
+
+    vmoves = models.VMove.__table__
+    with engine.begin() as conn:
+        for start in range(0, vmove_rows, chunk):
+            values = []
+            for _ in range(min(chunk, vmove_rows - start)):
+                values.append({
+                    'uuid': uuidutils.generate_uuid(),
+                    'notification_uuid': random.choice(notification_uuids),
+                    'instance_uuid': uuidutils.generate_uuid(),
+                    'instance_name': 'instance',
+                    'source_host': 'host',
+                    'type': 'evacuation',
+                    'status': random.choice(['succeeded', 'failed',
+                                             'pending']),
+                    'deleted': 0,
+                })
+            conn.execute(vmoves.insert(), values)
+
+    return host_uuids, notification_uuids
+
+
+def _time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def _queries(ctxt, host_uuids, notification_uuids):
+    now = timeutils.utcnow()
+
+    def unfinished():
+        db.notifications_get_all_by_filters(
+            ctxt, filters={'status': ['error', 'new']})
+
+    def expired():
+        db.notifications_get_all_by_filters(
+            ctxt, filters={'status': ['running', 'error', 'new']})
+
+    def duplicate():
+        db.notification_duplicate_exists(
+            ctxt, 'COMPUTE_HOST', random.choice(host_uuids),
+            notification_obj.payload_hash(random.choice(PAYLOADS)),
+            now - datetime.timedelta(seconds=180))
+
+    def vmoves():
+        db.vmoves_get_all_by_filters(ctxt, filters={
+            'notification_uuid': random.choice(notification_uuids),
+            'status': 'pending'})
+
+    return [('process_unfinished_notifications', unfinished),
+            ('check_expired_notifications', expired),
+            ('is_duplicate_notification', duplicate),
+            ('get_all_vmoves', vmoves)]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connection',
+                        default='sqlite:////tmp/masakari-bench.db',
+                        help='SQLAlchemy URL of an empty scratch database.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of notification rows to create.')
+    parser.add_argument('--vmove-rows', type=int, default=200000,
+                        help='Number of vmove rows to create.')
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of distinct source hosts.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs per query, the median is '
+                             'reported.')
+    args = parser.parse_args(argv)
+
+    CONF([], project='masakari')
+    CONF.set_override('connection', args.connection, 'database')
+    sqlalchemy_api.configure(CONF)
+    engine = sqlalchemy_api.get_engine()
+    models.BASE.metadata.create_all(engine)
+
+    print('Populating %d notifications and %d vmoves...' % (
+        args.rows, args.vmove_rows))
+    host_uuids, notification_uuids = _populate(
+        engine, args.rows, args.vmove_rows, args.hosts)
+
+    ctxt = context.get_admin_context()
+    queries = _queries(ctxt, host_uuids, notification_uuids)
+    results = {}
+
+    with engine.begin() as conn:
+        for index in INDEXES:
+            index.drop(conn)
+    for name, func in queries:
+        results[name] = [_time(func, args.repeat)]
+
+    with engine.begin() as conn:
+        for index in INDEXES:
+            index.create(conn)
+        if engine.dialect.name != 'sqlite':
+            conn.execute(sa.text('ANALYZE'))
+    for name, func in queries:
+        results[name].append(_time(func, args.repeat))
+
+    print('%-36s %14s %14s' % ('query', 'no index (ms)', 'index (ms)'))
+    for name, (before, after) in results.items():
+        print('%-36s %14.2f %14.2f' % (name, before, after))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))